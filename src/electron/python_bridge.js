@@ -44,6 +44,37 @@ if (isNode) {
   };
 }
 
+// フレームプロトコル（negotiate_protocolで切り替える）で、Base64を経由せずにバイナリで送る画像パラメータ
+const FRAMED_IMAGE_KEYS = ['image_data', 'imageData', 'image', 'previous_image', 'original_image', 'rendered_image'];
+const FRAME_LENGTH_SIZE = 4; // フレーム長のバイト数（ビッグエンディアンの符号なし整数）
+const PROTOCOL_NEGOTIATION_TIMEOUT = 30000; // サーバーの初期化（画像解析モジュールの読み込み）を待つ時間
+
+/**
+ * Base64文字列（Data URI形式を含む）の画像をバイナリに変換する
+ * @param {any} value - 画像パラメータの値
+ * @returns {Buffer|null} 画像のバイナリ（Base64の画像でない場合はnull）
+ */
+function decodeBase64Image(value) {
+  if (typeof value !== 'string' || value.length === 0) return null;
+  if (value.startsWith('data:')) {
+    const commaIndex = value.indexOf(',');
+    if (commaIndex === -1 || !value.substring(0, commaIndex).endsWith(';base64')) return null;
+    return Buffer.from(value.substring(commaIndex + 1), 'base64');
+  }
+  return /^[A-Za-z0-9+/=\r\n]+$/.test(value) ? Buffer.from(value, 'base64') : null;
+}
+
+/**
+ * フレーム長（ビッグエンディアンの4バイト）を作る
+ * @param {number} length - フレームのバイト数
+ * @returns {Buffer}
+ */
+function frameLength(length) {
+  const prefix = Buffer.alloc(FRAME_LENGTH_SIZE);
+  prefix.writeUInt32BE(length, 0);
+  return prefix;
+}
+
 // プラットフォーム検出
 const isWindows = process.platform === 'win32';
 const isMac = process.platform === 'darwin';
@@ -170,6 +201,9 @@ class PythonBridge {
     this.maxRestarts = 5;
     this.responseBuffer = '';
 
+    // 入力プロトコル（'line': 1行1JSON / 'framed': 長さ付きフレームで画像をバイナリのまま送る）
+    this.protocol = 'line';
+
     // メモリ管理のための追加プロパティ
     this.processCounter = 0;
     this.MAX_PROCESSES_BEFORE_RESTART = 20;
@@ -277,6 +311,11 @@ class PythonBridge {
       env.PYTHONGC = 'enabled';
       env.PYTHONUNBUFFERED = '1';
 
+      // 解析結果キャッシュなどの保存先としてアプリのデータディレクトリを渡す
+      if (app && typeof app.getPath === 'function') {
+        env.APP_DATA_DIR = app.getPath('userData');
+      }
+
       // メモリ使用量を抑えるための追加設定
       if (process.platform === 'linux') {
         env.MALLOC_TRIM_THRESHOLD_ = '65536'; // 64KB以上の未使用メモリを解放
@@ -292,6 +331,8 @@ class PythonBridge {
       }
 
       // 標準出力からデータを読み取る設定
+      // （UTF-8の文字がチャンク境界で分割されても壊れないよう、ストリーム側でデコードする）
+      this.pythonProcess.stdout.setEncoding('utf8');
       this.pythonProcess.stdout.on('data', (data) => this._handleStdout(data));
       this.pythonProcess.stderr.on('data', (data) => this._handleStderr(data));
       this.pythonProcess.on('close', (code) => this._handleClose(code));
@@ -302,6 +343,10 @@ class PythonBridge {
 
       console.log('Pythonプロセスが起動しました');
 
+      // 画像をBase64にせずに送れるよう、フレームプロトコルに切り替える
+      // （キューのリクエストを送る前に切り替えを終えておく。失敗した場合は行プロトコルのまま）
+      await this._negotiateProtocol();
+
       // メモリモニタリングを開始
       this.startMemoryMonitoring();
 
@@ -334,7 +379,7 @@ class PythonBridge {
           id: 'exit',
           command: 'exit'
         };
-        this.pythonProcess.stdin.write(JSON.stringify(exitCommand) + '\n');
+        this._writeRequest(exitCommand);
 
         // 正常終了のための待機時間
         await new Promise(resolve => setTimeout(resolve, 500));
@@ -350,6 +395,7 @@ class PythonBridge {
       }
 
       this.pythonProcess = null;
+      this.protocol = 'line';
       console.log('Pythonプロセスが停止しました');
     }
   }
@@ -506,9 +552,11 @@ class PythonBridge {
    * @param {string} command - コマンド名
    * @param {object} params - コマンドパラメータ
    * @param {number} timeout - タイムアウト時間（ミリ秒）
+   * @param {string|null} existingRequestId - 既存のリクエストID
+   * @param {Function|null} onEvent - 途中経過イベント（stream: true の partial など）を受け取るコールバック
    * @returns {Promise<any>} コマンドの実行結果
    */
-  async sendCommand(command, params = {}, timeout = 30000, existingRequestId = null) {
+  async sendCommand(command, params = {}, timeout = 30000, existingRequestId = null, onEvent = null) {
     // リクエストIDを生成（既存のIDが渡された場合はそれを使用）
     const requestId = existingRequestId || crypto.randomUUID();
     console.log(`Pythonブリッジ: コマンド[${command}]送信開始 (ID: ${requestId.substring(0, 8)}...)`);
@@ -527,7 +575,7 @@ class PythonBridge {
       }
       console.log(`Pythonブリッジ: コマンド[${command}]をキューに追加しました`);
       return new Promise((resolve, reject) => {
-        this.requestMap.set(requestId, { resolve, reject });
+        this.requestMap.set(requestId, { resolve, reject, onEvent });
       });
     }
 
@@ -536,7 +584,7 @@ class PythonBridge {
       console.log(`Pythonブリッジ: プロセス起動中のため、コマンド[${command}]をキューに追加します`);
       return new Promise((resolve, reject) => {
         this.requestQueue.push({ requestId, command, params });
-        this.requestMap.set(requestId, { resolve, reject });
+        this.requestMap.set(requestId, { resolve, reject, onEvent });
       });
     }
 
@@ -547,6 +595,8 @@ class PythonBridge {
         if (this.requestMap.has(requestId)) {
           console.error(`Pythonブリッジ: コマンド[${command}]がタイムアウトしました (${timeout}ms)`);
           this.requestMap.delete(requestId);
+          // Python側で処理が続かないようにキャンセルを通知する
+          this._sendCancel(requestId, command);
           reject(new Error(`コマンド '${command}' の実行がタイムアウトしました (${timeout}ms)`));
         }
       }, timeout);
@@ -554,7 +604,7 @@ class PythonBridge {
 
 
       // リクエストをマップに保存（タイムアウトIDも含む）
-      this.requestMap.set(requestId, { resolve, reject, timeoutId });
+      this.requestMap.set(requestId, { resolve, reject, timeoutId, onEvent });
       console.log(`Pythonブリッジ: リクエストマップに追加 (ID: ${requestId.substring(0, 8)}...), 現在のマップサイズ: ${this.requestMap.size}`);
       console.log(`Pythonブリッジ: 現在のリクエストIDs:`, Array.from(this.requestMap.keys()).map(id => id.substring(0, 8) + '...'));
 
@@ -565,18 +615,14 @@ class PythonBridge {
         ...params
       };
 
-      // リクエストデータのサイズをチェック
-      const requestStr = JSON.stringify(requestData);
-      const dataSize = requestStr.length;
-      console.log(`Pythonブリッジ: コマンド[${command}]送信データサイズ: ${Math.round(dataSize / 1024)}KB`);
-
-      // 大きなデータの場合は警告
-      if (dataSize > 5000000) { // 5MB以上
-        console.warn(`Pythonブリッジ: 送信データが非常に大きいです (${Math.round(dataSize / 1024 / 1024)}MB)`);
-      }
-
       try {
-        this.pythonProcess.stdin.write(requestStr + '\n');
+        const dataSize = this._writeRequest(requestData);
+        console.log(`Pythonブリッジ: コマンド[${command}]送信データサイズ: ${Math.round(dataSize / 1024)}KB (${this.protocol})`);
+
+        // 大きなデータの場合は警告
+        if (dataSize > 5000000) { // 5MB以上
+          console.warn(`Pythonブリッジ: 送信データが非常に大きいです (${Math.round(dataSize / 1024 / 1024)}MB)`);
+        }
         console.log(`Pythonブリッジ: コマンド[${command}]送信完了 (ID: ${requestId.substring(0, 8)}...)`);
       } catch (error) {
         // マップからリクエストを削除（クリーンアップ）
@@ -590,6 +636,88 @@ class PythonBridge {
     });
   }
 
+  /**
+   * リクエストを現在の入力プロトコルでPythonプロセスの標準入力に書き込む
+   *
+   * フレームプロトコルでは [4バイト長][JSONヘッダー] に続けて、ヘッダーの frames に列挙した
+   * 画像パラメータを [4バイト長][バイナリ] で送る（Base64のデコード・エンコードを省略する）。
+   * @param {object} requestData - id・commandを含むリクエスト
+   * @returns {number} 書き込んだバイト数
+   * @private
+   */
+  _writeRequest(requestData) {
+    if (this.protocol !== 'framed') {
+      const requestStr = JSON.stringify(requestData) + '\n';
+      this.pythonProcess.stdin.write(requestStr);
+      return requestStr.length;
+    }
+
+    const header = { ...requestData };
+    const frames = [];
+    for (const key of FRAMED_IMAGE_KEYS) {
+      const buffer = decodeBase64Image(header[key]);
+      if (buffer) {
+        frames.push(buffer);
+        header.frames = [...(header.frames || []), key];
+        delete header[key];
+      }
+    }
+
+    const headerBuffer = Buffer.from(JSON.stringify(header), 'utf8');
+    const chunks = [frameLength(headerBuffer.length), headerBuffer];
+    for (const buffer of frames) {
+      chunks.push(frameLength(buffer.length), buffer);
+    }
+    // 他のリクエストと混ざらないよう、1回の書き込みで送る
+    const payload = Buffer.concat(chunks);
+    this.pythonProcess.stdin.write(payload);
+    return payload.length;
+  }
+
+  /**
+   * Pythonサーバーの入力プロトコルをフレーム形式に切り替える
+   *
+   * 切り替えのレスポンスを受け取るまでは他のリクエストを送らない（start()の中で、キューを処理する前に呼ぶ）。
+   * サーバーが対応していない場合やタイムアウトした場合は行プロトコルのまま続ける。
+   * @returns {Promise<void>}
+   * @private
+   */
+  async _negotiateProtocol() {
+    this.protocol = 'line';
+    const requestId = crypto.randomUUID();
+    const response = new Promise((resolve, reject) => {
+      const timeoutId = setTimeout(() => {
+        this.requestMap.delete(requestId);
+        reject(new Error(`タイムアウトしました (${PROTOCOL_NEGOTIATION_TIMEOUT}ms)`));
+      }, PROTOCOL_NEGOTIATION_TIMEOUT);
+      this.requestMap.set(requestId, { resolve, reject, timeoutId });
+    });
+
+    try {
+      this._writeRequest({ id: requestId, command: 'negotiate_protocol', protocol: 'framed' });
+      const result = await response;
+      if (result && result.protocol === 'framed') {
+        this.protocol = 'framed';
+        console.log('Pythonブリッジ: フレームプロトコルに切り替えました');
+      }
+    } catch (error) {
+      console.warn(`Pythonブリッジ: フレームプロトコルに切り替えられないため、行プロトコルで通信します: ${error.message}`);
+    }
+  }
+
+  /**
+   * Python側に実行中リクエストのキャンセルを通知する
+   * @param {string} targetId - キャンセルするリクエストID
+   * @param {string} command - キャンセルするコマンド名（ログ用）
+   * @private
+   */
+  _sendCancel(targetId, command) {
+    if (!this.pythonProcess || command === 'cancel') return;
+    this.sendCommand('cancel', { target_id: targetId }, 5000).catch((error) => {
+      console.warn(`Pythonブリッジ: キャンセル通知に失敗しました (ID: ${targetId.substring(0, 8)}...)`, error);
+    });
+  }
+
   /**
    * 標準出力からのデータを処理
    * @param {Buffer} data - 受信データ
@@ -674,6 +802,14 @@ class PythonBridge {
         return;
       }
 
+      // 途中経過イベント（partial など）は最終レスポンスではないため、コールバックに渡すだけにする
+      if (response.event) {
+        if (typeof requestInfo.onEvent === 'function') {
+          requestInfo.onEvent(response);
+        }
+        return;
+      }
+
       // タイムアウトをクリア
       if (requestInfo.timeoutId) {
         clearTimeout(requestInfo.timeoutId);
@@ -766,9 +902,9 @@ class PythonBridge {
 
     for (const { requestId, command, params } of queue) {
       if (this.requestMap.has(requestId)) {
-        const { resolve, reject } = this.requestMap.get(requestId);
+        const { resolve, reject, onEvent } = this.requestMap.get(requestId);
 
-        this.sendCommand(command, params)
+        this.sendCommand(command, params, undefined, null, onEvent)
           .then(resolve)
           .catch(reject);
       }
@@ -953,10 +1089,11 @@ class PythonBridge {
   /**
    * 画像の総合分析を行う
    * @param {string|object} imageData - Base64形式の画像データ、またはオブジェクト
-   * @param {object} options - オプション
+   * @param {object} options - オプション（onEvent: ステージが完了するごとに呼ばれるコールバック）
+   * @param {function} onPartial - ステージが完了するごとに呼ばれるコールバック（{ stage, result, completed, total }）
    * @returns {Promise<object>} 総合分析結果
    */
-  async analyzeAll(imageData, options = {}) {
+  async analyzeAll(imageData, options = {}, onPartial = null) {
     // 処理回数をカウント
     this.processCounter++;
 
@@ -1023,6 +1160,11 @@ class PythonBridge {
         };
       }
 
+      // 途中結果のコールバックはPython側に送らない
+      const { onEvent: optionCallback, ...analysisOptions } = requestOptions;
+      const partialCallback = onPartial || (typeof optionCallback === 'function' ? optionCallback : null);
+      requestOptions = analysisOptions;
+
       // 画像の前処理
       const optimizedImageData = await this.preprocessImage(imageContent);
 
@@ -1034,11 +1176,22 @@ class PythonBridge {
         ? optimizedImageData
         : optimizedImageData?.image || optimizedImageData?.image_data || '';
 
+      // 実行するステージの指定（例: ['colors', 'layout']。省略時は全ステージ）
+      const stages = (typeof imageData === 'object' && imageData !== null && imageData.stages) || requestOptions.stages;
+
+      // コールバックがある場合はステージごとの途中結果（partialイベント）を受け取る
+      const onEvent = partialCallback
+        ? (event) => { if (event.event === 'partial') partialCallback(event); }
+        : null;
+
       // Python側が参照する名前を 'image_data' に統一
       const result = await this.sendCommand('analyze_all', {
         image_data: base64Image,  // Python側が期待する名前に合わせる
-        options: requestOptions
-      }, 90000);  // より長いタイムアウト
+        options: requestOptions,
+        ...(stages ? { stages } : {}),
+        stream: Boolean(partialCallback),
+        deadline_ms: 85000  // タイムアウト前に途中結果を返してもらう
+      }, 90000, null, onEvent);  // より長いタイムアウト
 
       return result;
     } catch (error) {
@@ -1052,6 +1205,114 @@ class PythonBridge {
     }
   }
 
+  /**
+   * 前回の解析結果を元に、画像の変更された領域だけを再解析する
+   * @param {string} imageData - Base64形式の新しい画像データ
+   * @param {object|string} previous - 前回のanalyzeAllの結果、またはその cache_key
+   * @param {object} options - オプション（previousImage: 前回の画像。キャッシュにない場合の差分判定用、
+   *   previousImageHandle: registerImageで登録した前回の画像のハンドル）
+   * @returns {Promise<object>} analyzeAllと同じ形式の解析結果（incrementalに差分再解析の統計）
+   */
+  async analyzeIncremental(imageData, previous, options = {}) {
+    const { previousImage, previousImageHandle, ...requestOptions } = options;
+    const params = {
+      image_data: imageData,
+      options: requestOptions,
+      deadline_ms: 85000
+    };
+    if (typeof previous === 'string') {
+      params.previous_cache_key = previous;
+    } else if (previous) {
+      params.previous = previous;
+    }
+    if (previousImageHandle) {
+      params.previous_image_handle = previousImageHandle;
+    } else if (previousImage) {
+      params.previous_image = previousImage;
+    }
+
+    try {
+      await this._ensureRunning();
+      return await this.sendCommand('analyze_incremental', params, 90000);
+    } catch (error) {
+      console.error('差分再解析エラー:', error);
+      return {
+        success: false,
+        error: `差分再解析エラー: ${error.message || '(不明)'}`,
+      };
+    }
+  }
+
+  /**
+   * 画像をPython側に登録し、以降のコマンドで画像の代わりに渡せるハンドルを取得する
+   * （同じ画像を何度も解析する場合に、転送とデコードを1回で済ませる）
+   * @param {string} imageData - Base64形式の画像データ
+   * @returns {Promise<object>} { image_handle, width, height, format, store }
+   */
+  async registerImage(imageData) {
+    try {
+      await this._ensureRunning();
+      return await this.sendCommand('register_image', { image_data: imageData });
+    } catch (error) {
+      console.error('画像登録エラー:', error);
+      return {
+        success: false,
+        error: `画像登録エラー: ${error.message || '(不明)'}`,
+      };
+    }
+  }
+
+  /**
+   * registerImageで登録した画像を解放する
+   * @param {string|null} handle - 画像ハンドル（省略時はすべて解放）
+   * @returns {Promise<object>} { released, store }
+   */
+  async releaseImage(handle = null) {
+    try {
+      await this._ensureRunning();
+      return await this.sendCommand('release_image', handle ? { image_handle: handle } : { all: true });
+    } catch (error) {
+      console.error('画像解放エラー:', error);
+      return {
+        success: false,
+        error: `画像解放エラー: ${error.message || '(不明)'}`,
+      };
+    }
+  }
+
+  /**
+   * 複数の画像をまとめて解析する
+   * @param {Array<string|object>} images - Base64画像データ、ファイルパス、または { id, image_data | path | image_handle }
+   * @param {object} options - オプション（stages, quality など）
+   * @param {function} onItem - 1件解析するごとに呼ばれるコールバック（{ index, item_id, status, result, completed, total }）
+   * @returns {Promise<object>} 件数と処理速度（images_per_second）を含む集計結果
+   */
+  async analyzeBatch(images, options = {}, onItem = null) {
+    if (!Array.isArray(images) || images.length === 0) {
+      return { success: false, error: '解析する画像が指定されていません' };
+    }
+
+    try {
+      await this._ensureRunning();
+      const onEvent = onItem
+        ? (event) => { if (event.event === 'item') onItem(event); }
+        : null;
+      // 1枚あたり最大60秒として全体のタイムアウトを決める
+      const timeout = Math.max(90000, images.length * 60000);
+      return await this.sendCommand('analyze_batch', {
+        images,
+        options,
+        stream: Boolean(onItem)
+      }, timeout, null, onEvent);
+    } catch (error) {
+      console.error('バッチ解析エラー:', error);
+      return {
+        success: false,
+        error: `バッチ解析エラー: ${error.message || '(不明)'}`,
+      };
+    }
+  }
+
   /**
    * 画像から主要な色を抽出する
    * @param {string} imageData - Base64形式の画像データ
@@ -1074,7 +1335,7 @@ class PythonBridge {
   /**
    * 画像からテキストを抽出する
    * @param {string} imageData - Base64形式の画像データ
-   * @param {object} options - オプション
+   * @param {object} options - オプション（ocr_mode: 'boxes' で認識を省略し、テキストの位置と大きさだけを返す）
    * @returns {Promise<object>} 抽出されたテキスト情報
    */
   async extractText(imageData, options = {}) {
@@ -17,15 +17,32 @@ from PIL import Image
 import cv2
 import re
 import math
+import numbers
+import hashlib
+import time
+import threading
+import queue
+import concurrent.futures
+import subprocess
+import contextvars
+from contextlib import contextmanager
 from collections import Counter
 import logging
 
 try:
     import pytesseract
-    from pytesseract import Output
-    TESSERACT_AVAILABLE = True
+    PYTESSERACT_AVAILABLE = True
 except ImportError:
-    TESSERACT_AVAILABLE = False
+    PYTESSERACT_AVAILABLE = False
+
+try:
+    # TesseractのC APIバインディング（インストールされていればプロセスを起動せずに認識できる）
+    import tesserocr
+    TESSEROCR_AVAILABLE = True
+except ImportError:
+    TESSEROCR_AVAILABLE = False
+
+TESSERACT_AVAILABLE = TESSEROCR_AVAILABLE or PYTESSERACT_AVAILABLE
 
 try:
     import easyocr
@@ -53,10 +70,102 @@ except ImportError:
     SKIMAGE_SSIM_AVAILABLE = False
 
 # 定数定義
+# 解析結果の形式やアルゴリズムを変更したら上げる（python_serverの結果キャッシュのキーに含まれる）
+ANALYZER_VERSION = '7'
 MAX_COLORS = 5
 RESIZE_WIDTH = 300
 MIN_SECTION_HEIGHT_RATIO = 0.05
 
+# 縦長画像の分割処理（高さがTILED_MIN_HEIGHTを超える画像は水平の帯に分けて処理する）
+TILED_MIN_HEIGHT = 4096
+TILE_HEIGHT = 2048
+TILE_OVERLAP = 160  # 帯の重なり（境界をまたぐテキスト行がどちらかの帯に収まるようにする）
+TILE_HALO = 8  # フィルタ処理（ブラー・Sobel・Canny）の境界用に上下へ余分に読む行数
+# 帯ごとのOCR結果キャッシュや帯の並列OCR（configure_text_tile_cache / configure_ocr_offload）が
+# 有効な場合に、テキスト抽出で使う帯の高さ
+TEXT_STRIP_HEIGHT = 1024
+OCR_OFFLOAD_POLL_SECONDS = 0.2  # 並列OCRの完了を待つ間にキャンセルを確認する間隔（秒）
+
+# テキスト領域の候補抽出（OCRの認識を候補領域だけに絞る）
+TEXT_PROPOSAL_MIN_HEIGHT = 6  # 候補とする行の最小の高さ（px）
+TEXT_PROPOSAL_MAX_HEIGHT = 160  # これより高い領域は写真や図形とみなして除外する
+TEXT_PROPOSAL_MIN_FILL = 0.3  # 候補領域内のエッジ画素の最小割合
+TEXT_PROPOSAL_MARGIN = 0.2  # 行の高さに対する候補領域の余白の割合
+TEXT_PROPOSAL_MAX_COVERAGE = 0.5  # 候補の面積の割合がこれを超える場合は画像全体で検出する
+TEXT_PROPOSAL_BATCH_SIZE = 16  # 認識モデルに一度に渡す候補の数
+
+# extract_textのモード（options.ocr_mode）
+#   text: 検出と認識を行い、テキストと位置を返す
+#   boxes: 検出だけを行い、テキストの位置と大きさを返す（textは空文字列）
+OCR_MODES = ('text', 'boxes')
+DEFAULT_OCR_MODE = 'text'
+
+# Tesseractのワーカープール
+TESSERACT_POOL_SIZE = max(1, min(4, (os.cpu_count() or 2) // 2))  # 同時に実行する認識の数
+TESSERACT_LANG = 'eng'
+TESSERACT_TIMEOUT = 60  # CLIで実行する場合の1回あたりのタイムアウト（秒）
+
+# 要素内のテキストの有無の判定（detect_text_presence）
+TEXT_PRESENCE_INSET_RATIO = 0.1  # 要素の枠線を除くため、短辺に対してこの割合だけ内側を調べる
+TEXT_PRESENCE_MIN_EDGE_DENSITY = 0.04  # 内側のエッジ画素の割合がこれ以上であればテキストありとみなす
+
+# 解析の品質プリセット（options.quality）
+#   max_width: 作業解像度（これより幅の広い画像は縮小して解析し、座標を元の解像度に戻す。Noneで縮小しない）
+#   ocr_engine: 'auto'（EasyOCR→Tesseract）/ 'easyocr' / 'tesseract' / 'none'（OCRしない）
+#   ocr_min_confidence / ocr_decoder: OCR結果の信頼度の閾値とEasyOCRのデコーダー
+#   kmeans_n_init: 色抽出のK-meansの初期値を変えた試行回数
+#   ocr_proposals: テキスト領域の候補だけをEasyOCRで認識するか（Falseの場合は画像全体で検出・認識する）
+#                  候補は横書きの行だけを対象とするため、縦書きやTEXT_PROPOSAL_MAX_HEIGHTを超える大きな見出しは
+#                  認識されない。速度を優先する'fast'でだけ有効にする
+QUALITY_PRESETS = {
+    # UIにすぐ表示するためのプレビュー（OCRを省略し、縮小画像で解析する）
+    'preview': {
+        'max_width': 960,
+        'ocr_engine': 'none',
+        'ocr_min_confidence': 0.4,
+        'ocr_decoder': 'greedy',
+        'kmeans_n_init': 1,
+        'ocr_proposals': False,
+    },
+    # 横書きのテキストの候補領域だけを認識し、OCRを高速化する（縦書きや大きな見出しは認識されない）
+    'fast': {
+        'max_width': None,
+        'ocr_engine': 'auto',
+        'ocr_min_confidence': 0.4,
+        'ocr_decoder': 'greedy',
+        'kmeans_n_init': 10,
+        'ocr_proposals': True,
+    },
+    # 従来どおりの解析
+    'standard': {
+        'max_width': None,
+        'ocr_engine': 'auto',
+        'ocr_min_confidence': 0.4,
+        'ocr_decoder': 'greedy',
+        'kmeans_n_init': 10,
+        'ocr_proposals': False,
+    },
+    # 時間をかけてでも精度を優先する解析
+    'full': {
+        'max_width': None,
+        'ocr_engine': 'auto',
+        'ocr_min_confidence': 0.3,
+        'ocr_decoder': 'beamsearch',
+        'kmeans_n_init': 20,
+        'ocr_proposals': False,
+    },
+}
+DEFAULT_QUALITY = 'standard'
+
+# 差分再解析（analyze_incremental）
+FINGERPRINT_TILE = 64  # 画像の変更箇所を判定するタイルの大きさ（px）
+INCREMENTAL_MARGIN = 16  # 変更領域の周囲に含める余白（px）
+INCREMENTAL_MAX_CHANGED_RATIO = 0.5  # 変更面積の割合がこれを超える場合は全体を再解析する
+INCREMENTAL_PALETTE_CHANGED_RATIO = 0.05  # 変更面積の割合がこれ以下であれば主要色を再利用する
+
+# scale_positionsで拡大縮小する座標のキー
+POSITION_KEYS = ('x', 'y', 'width', 'height', 'top', 'left')
+
 # 色の役割を定義
 COLOR_ROLES = {
     'background': '背景色',
@@ -108,39 +217,535 @@ SECTION_TYPES = {
     'content': '一般コンテンツ'
 }
 
-# EasyOCRのreaderインスタンスをキャッシュ
-_easyocr_reader = None
+# EasyOCRで認識する言語
+EASYOCR_LANGUAGES = ('ja', 'en')
+
+# 現在の解析処理に対応するキャンセルトークン（cancellation_scopeで設定する）
+_current_cancel_token = contextvars.ContextVar('image_analyzer_cancel_token', default=None)
 
 # ロガー設定
 logger = logging.getLogger('image_analyzer')
 
+class AnalysisCancelled(BaseException):
+    """
+    解析処理がキャンセルされた、または期限を過ぎたことを示す例外
+
+    解析関数の多くは例外を広く捕捉して空の結果を返すため、それらに握りつぶされないよう
+    BaseExceptionを継承している（KeyboardInterruptと同じ扱い）。
+    """
+
+    def __init__(self, reason='cancelled'):
+        super().__init__(reason)
+        self.reason = reason  # 'cancelled' または 'deadline'
+
+
+class CancelToken:
+    """
+    解析処理のキャンセル要求と期限を保持するトークン
+
+    Args:
+        deadline: 期限（time.time()基準のエポック秒）。Noneの場合は期限なし
+    """
+
+    def __init__(self, deadline=None):
+        self.deadline = deadline
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        """キャンセルを要求する"""
+        self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def remaining(self):
+        """期限までの残り秒数（期限なしの場合はNone）"""
+        if self.deadline is None:
+            return None
+        return self.deadline - time.time()
+
+    def expired(self, margin=0.0):
+        """期限を過ぎているか（marginを指定すると、残りがmargin秒未満でも期限切れとみなす）"""
+        remaining = self.remaining()
+        return remaining is not None and remaining <= margin
+
+    def check(self):
+        """キャンセル済みまたは期限切れであればAnalysisCancelledを送出する"""
+        if self.cancelled:
+            raise AnalysisCancelled('cancelled')
+        if self.expired():
+            raise AnalysisCancelled('deadline')
+
+
+@contextmanager
+def cancellation_scope(token):
+    """このブロック内で実行される解析処理にキャンセルトークンを設定する"""
+    reset_token = _current_cancel_token.set(token)
+    try:
+        yield token
+    finally:
+        _current_cancel_token.reset(reset_token)
+
+
+def current_cancel_token():
+    """現在のキャンセルトークンを返す（設定されていない場合はNone）"""
+    return _current_cancel_token.get()
+
+
+def check_cancelled():
+    """長いループの途中などで呼び出し、キャンセルや期限切れを検出したら中断する"""
+    token = _current_cancel_token.get()
+    if token is not None:
+        token.check()
+
+
+# 帯ごとのOCR結果キャッシュ（python_serverが設定する。Noneの場合は無効）
+_text_tile_cache = None
+
+def configure_text_tile_cache(cache):
+    """
+    帯ごとのOCR結果キャッシュを設定する
+
+    cacheは make_key(stage, image_hash, options) / get(key) / put(key, value) を持つオブジェクト
+    （python_serverのAnalysisCache）。Noneを渡すと無効になる。
+    """
+    global _text_tile_cache
+    _text_tile_cache = cache
+
+# 帯のOCRを別プロセスで実行する関数（python_serverが設定する。Noneの場合は順に実行する）
+_ocr_offload = None
+
+def configure_ocr_offload(submit):
+    """
+    帯のOCRを並列に実行する関数を設定する
+
+    submitは submit(strip, quality, mode) → concurrent.futures.Future の形で、
+    別プロセスで extract_text(strip, tile_height=0, quality=quality, mode=mode) を実行する
+    （python_serverのOCRプロセスプール）。Noneを渡すと無効になる。
+    """
+    global _ocr_offload
+    _ocr_offload = submit
+
+def resolve_tile_height(height, tile_height=None):
+    """
+    分割処理に使う帯の高さを返す（0の場合は分割しない）
+
+    Args:
+        height: 画像の高さ
+        tile_height: 帯の高さ（Noneの場合、高さがTILED_MIN_HEIGHTを超える画像だけTILE_HEIGHTで分割。0で無効）
+    """
+    if tile_height is None:
+        return TILE_HEIGHT if height > TILED_MIN_HEIGHT else 0
+    tile_height = int(tile_height or 0)
+    if tile_height <= TILE_OVERLAP or height <= tile_height:
+        return 0
+    return tile_height
+
+def iter_tiles(height, tile_height, overlap=TILE_OVERLAP):
+    """
+    画像を重なりのある水平の帯に分割する
+
+    Yields:
+        tuple: (top, bottom, owned_top, owned_bottom)
+            owned_top〜owned_bottomはその帯が担当する範囲で、隣接する帯とは重ならない。
+            重なり部分で両方の帯に検出された結果は、中心が担当範囲にある方だけを採用する。
+    """
+    step = tile_height - overlap
+    top = 0
+    while True:
+        bottom = min(top + tile_height, height)
+        last = bottom >= height
+        owned_top = 0 if top == 0 else top + overlap // 2
+        # 重なりが奇数でも担当範囲が隣の帯と接するよう、残りを下側に割り当てる
+        owned_bottom = height if last else bottom - (overlap - overlap // 2)
+        yield top, bottom, owned_top, owned_bottom
+        if last:
+            break
+        top += step
+
+def get_quality_preset(quality=None):
+    """品質プリセットを返す（未指定・不明な値の場合はstandard）"""
+    if quality is None:
+        return QUALITY_PRESETS[DEFAULT_QUALITY]
+    preset = QUALITY_PRESETS.get(str(quality).lower())
+    if preset is None:
+        logger.warning(f"不明な品質が指定されました: {quality}（{DEFAULT_QUALITY}で解析します）")
+        return QUALITY_PRESETS[DEFAULT_QUALITY]
+    return preset
+
+def to_working_resolution(img, quality=None):
+    """
+    品質プリセットの作業解像度に画像を縮小する
+
+    Returns:
+        tuple: (縮小した画像, 元の座標に戻す倍率)。縮小不要の場合は (img, 1.0)
+    """
+    max_width = get_quality_preset(quality)['max_width']
+    height, width = img.shape[:2]
+    if not max_width or width <= max_width:
+        return img, 1.0
+    scale = max_width / width
+    small = cv2.resize(img, (max_width, max(1, int(round(height * scale)))), interpolation=cv2.INTER_AREA)
+    return small, width / max_width
+
+def _scale_coordinate(value, factor):
+    if isinstance(value, numbers.Number) and not isinstance(value, bool):
+        return int(round(value * factor))
+    return value
+
+def scale_positions(value, factor):
+    """
+    解析結果に含まれる座標（position・dimensions）をfactor倍した結果を返す
+
+    作業解像度で解析した結果を元の画像の座標に戻すために使う。比率などの値は変更しない。
+    """
+    if factor == 1:
+        return value
+    if isinstance(value, list):
+        return [scale_positions(item, factor) for item in value]
+    if not isinstance(value, dict):
+        return value
+
+    scaled = {}
+    for key, item in value.items():
+        if key in ('position', 'dimensions') and isinstance(item, dict):
+            scaled[key] = {
+                coord_key: (_scale_coordinate(coord, factor) if coord_key in POSITION_KEYS
+                            else [_scale_coordinate(c, factor) for c in coord] if coord_key == 'center' and isinstance(coord, (list, tuple))
+                            else coord)
+                for coord_key, coord in item.items()
+            }
+        else:
+            scaled[key] = scale_positions(item, factor)
+    return scaled
+
+class EasyOCRReaderManager:
+    """
+    プロセス内で1つのEasyOCRリーダーを共有して管理する
+
+    リーダーは最初に使われたとき（またはwarmup()の呼び出し時）に1回だけ読み込み、
+    以降の呼び出しでは検出・認識モデルを再読み込みしない。読み込みと推論にかかった時間は
+    stats()で取得できる。
+
+    EasyOCRのリーダー（PyTorchモデル）は複数スレッドからの同時推論に対応していないため、
+    推論は_inference_lockで直列化する。
+    """
+
+    def __init__(self, languages=EASYOCR_LANGUAGES):
+        self.languages = list(languages)
+        self._reader = None
+        self._load_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._inference_lock = threading.Lock()
+        self._load_error = None
+        self._warmup_thread = None
+        self.gpu = None
+        self.load_seconds = None
+        self.loaded_at = None
+        self.warmup_seconds = None
+        self.inferences = 0
+        self.inference_seconds = 0.0
+        self.last_inference_seconds = None
+
+    @property
+    def loaded(self):
+        return self._reader is not None
+
+    def get(self):
+        """リーダーを返す（未読み込みの場合は読み込む。利用できない場合はNone）"""
+        if self._reader is not None or not EASYOCR_AVAILABLE:
+            return self._reader
+
+        with self._load_lock:
+            if self._reader is None:
+                started = time.perf_counter()
+                try:
+                    # GPU利用可能な場合はGPUを使用
+                    self._reader = easyocr.Reader(self.languages, gpu=True)
+                    self.gpu = True
+                except Exception:
+                    try:
+                        # GPU利用失敗時はCPUモードで再試行
+                        self._reader = easyocr.Reader(self.languages, gpu=False)
+                        self.gpu = False
+                        logger.info("EasyOCR: CPUモードで動作します")
+                    except Exception as e:
+                        self._load_error = str(e)
+                        logger.error(f"EasyOCR初期化エラー: {e}")
+                        return None
+                self.load_seconds = time.perf_counter() - started
+                self.loaded_at = time.time()
+                self._load_error = None
+                logger.info(f"EasyOCRリーダーを読み込みました（{self.load_seconds:.2f}秒）")
+        return self._reader
+
+    def readtext(self, image, **kwargs):
+        """
+        共有リーダーでテキストを検出・認識し、推論時間を記録する
+
+        imageはNumPy配列（グレースケールまたはBGR）をそのまま渡す（ファイルを経由しない）。
+        """
+        return self._infer('readtext', image, **kwargs)
+
+    def recognize(self, image, horizontal_list, **kwargs):
+        """
+        検出を省略し、指定した領域（[x_min, x_max, y_min, y_max]のリスト）だけを認識する
+
+        領域の切り出しはまとめて認識モデルに渡され、結果の座標は画像全体の座標で返る。
+        """
+        return self._infer('recognize', image, horizontal_list=horizontal_list, free_list=[], **kwargs)
+
+    def detect(self, image, **kwargs):
+        """認識を行わず、テキスト領域の検出だけを行う（(horizontal_list, free_list)を返す）"""
+        return self._infer('detect', image, **kwargs)
+
+    def _infer(self, method, image, **kwargs):
+        reader = self.get()
+        if reader is None:
+            raise RuntimeError(f"EasyOCRリーダーを利用できません: {self._load_error or '未インストール'}")
+
+        with self._inference_lock:
+            started = time.perf_counter()
+            results = getattr(reader, method)(image, **kwargs)
+            elapsed = time.perf_counter() - started
+        with self._stats_lock:
+            self.inferences += 1
+            self.inference_seconds += elapsed
+            self.last_inference_seconds = elapsed
+        return results
+
+    def warmup(self, background=True):
+        """
+        リーダーを読み込み、小さな画像で1回推論しておく（初回リクエストの待ち時間を減らす）
+
+        background=Trueの場合は別スレッドで実行し、すぐに戻る。
+        """
+        if not EASYOCR_AVAILABLE:
+            return
+        if background:
+            if self._warmup_thread is None or not self._warmup_thread.is_alive():
+                self._warmup_thread = threading.Thread(target=self.warmup, kwargs={'background': False},
+                                                       name='easyocr_warmup', daemon=True)
+                self._warmup_thread.start()
+            return
+
+        started = time.perf_counter()
+        try:
+            if self.get() is None:
+                return
+            blank = np.full((32, 128), 255, dtype=np.uint8)
+            with self._inference_lock:
+                self.get().readtext(blank, detail=1, paragraph=False)
+            self.warmup_seconds = time.perf_counter() - started
+            logger.info(f"EasyOCRのウォームアップが完了しました（{self.warmup_seconds:.2f}秒）")
+        except Exception as e:
+            logger.warning(f"EasyOCRのウォームアップに失敗しました: {e}")
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "available": EASYOCR_AVAILABLE,
+                "loaded": self.loaded,
+                "warming_up": bool(self._warmup_thread and self._warmup_thread.is_alive()),
+                "gpu": self.gpu,
+                "languages": self.languages,
+                "load_seconds": round(self.load_seconds, 3) if self.load_seconds is not None else None,
+                "warmup_seconds": round(self.warmup_seconds, 3) if self.warmup_seconds is not None else None,
+                "load_error": self._load_error,
+                "inferences": self.inferences,
+                "inference_seconds_total": round(self.inference_seconds, 3),
+                "inference_seconds_avg": round(self.inference_seconds / self.inferences, 3) if self.inferences else None,
+                "last_inference_seconds": round(self.last_inference_seconds, 3) if self.last_inference_seconds is not None else None,
+            }
+
+# プロセス内で共有するEasyOCRリーダー
+easyocr_reader = EasyOCRReaderManager()
+
 def get_easyocr_reader():
     """EasyOCRのreaderインスタンスを取得（キャッシュ対応）"""
-    global _easyocr_reader
-    if _easyocr_reader is None and EASYOCR_AVAILABLE:
+    return easyocr_reader.get()
+
+def warmup_easyocr(background=True):
+    """EasyOCRリーダーを事前に読み込む（サーバー起動時に使用）"""
+    easyocr_reader.warmup(background=background)
+
+def easyocr_stats():
+    """EasyOCRリーダーの読み込み時間・推論時間などの統計を返す"""
+    return easyocr_reader.stats()
+
+
+class TesseractPool:
+    """
+    Tesseractの認識を行うワーカープール
+
+    tesserocr（C APIバインディング）がインストールされていれば、初期化済みのPyTessBaseAPIを
+    最大size個まで作って使い回す（言語データの読み込みやプロセスの起動が呼び出しごとに発生しない）。
+    tesserocrは認識中にGILを解放するため、複数のスレッドから同時に呼び出せる。
+
+    tesserocrがない場合は tesseract コマンドに標準入力で画像を渡して実行する
+    （pytesseractと異なり一時ファイルを作らない）。同時に実行するプロセスの数はsize個までに制限する。
+    """
+
+    def __init__(self, size=TESSERACT_POOL_SIZE, lang=TESSERACT_LANG):
+        self.size = max(1, size)
+        self.lang = lang
+        if TESSEROCR_AVAILABLE:
+            self.backend = 'tesserocr'
+        elif PYTESSERACT_AVAILABLE:
+            self.backend = 'cli'
+        else:
+            self.backend = None
+        self._apis = queue.Queue()
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._stats_lock = threading.Lock()
+        self.workers = 0
+        self.calls = 0
+        self.seconds = 0.0
+
+    @contextmanager
+    def _slot(self):
+        self._slots.acquire()
+        started = time.perf_counter()
         try:
-            # GPU利用可能な場合はGPUを使用
-            _easyocr_reader = easyocr.Reader(['ja', 'en'], gpu=True)
-        except:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self._slots.release()
+            with self._stats_lock:
+                self.calls += 1
+                self.seconds += elapsed
+
+    @contextmanager
+    def _api(self):
+        """空いているPyTessBaseAPIを借りる（足りなければ作る。同時に使えるのはsize個まで）"""
+        with self._slot():
             try:
-                # GPU利用失敗時はCPUモードで再試行
-                _easyocr_reader = easyocr.Reader(['ja', 'en'], gpu=False)
-                logger.info("EasyOCR: CPUモードで動作します")
-            except Exception as e:
-                logger.error(f"EasyOCR初期化エラー: {e}")
-                return None
-    return _easyocr_reader
+                api = self._apis.get_nowait()
+            except queue.Empty:
+                api = tesserocr.PyTessBaseAPI(lang=self.lang, oem=tesserocr.OEM.DEFAULT)
+                with self._stats_lock:
+                    self.workers += 1
+            try:
+                yield api
+            finally:
+                api.Clear()
+                self._apis.put(api)
+
+    @staticmethod
+    def _set_image(api, image):
+        """
+        NumPy配列（BGR/BGRA/グレースケール）をAPIに渡す
+
+        tesserocrのSetImageBytesはbytesしか受け取らないため、画像は呼び出しごとに1回コピーされる
+        （カラー画像はRGBへの変換でもコピーが発生する）。
+        """
+        if image.ndim == 3 and image.shape[2] == 4:
+            image = cv2.cvtColor(image, cv2.COLOR_BGRA2RGB)
+        elif image.ndim == 3:
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        image = np.ascontiguousarray(image)
+        height, width = image.shape[:2]
+        channels = 1 if image.ndim == 2 else image.shape[2]
+        api.SetImageBytes(image.tobytes(), width, height, channels, width * channels)
+
+    def _run_cli(self, image, psm, tsv=False):
+        """tesseractコマンドに標準入力でPNGを渡し、標準出力の結果を返す"""
+        ok, encoded = cv2.imencode('.png', image)
+        if not ok:
+            raise ValueError("Tesseractに渡す画像のエンコードに失敗しました")
+        command = [pytesseract.pytesseract.tesseract_cmd, 'stdin', 'stdout',
+                   '--oem', '3', '--psm', str(psm), '-l', self.lang]
+        if tsv:
+            command.append('tsv')
+        # プール側で並列に実行するため、1プロセスあたりのOpenMPスレッドは1つにする
+        env = dict(os.environ, OMP_THREAD_LIMIT='1')
+        with self._slot():
+            completed = subprocess.run(command, input=encoded.tobytes(), stdout=subprocess.PIPE,
+                                       stderr=subprocess.PIPE, env=env, timeout=TESSERACT_TIMEOUT)
+        if completed.returncode != 0:
+            raise RuntimeError(f"tesseractの実行に失敗しました: {completed.stderr.decode('utf-8', 'replace').strip()}")
+        return completed.stdout.decode('utf-8', 'replace')
+
+    def image_to_data(self, image, psm=11):
+        """
+        単語ごとの認識結果を返す
+
+        Returns:
+            list: {'text', 'conf'（0〜100）, 'left', 'top', 'width', 'height'} のリスト
+        """
+        if self.backend is None:
+            raise RuntimeError("Tesseractを利用できません")
+
+        words = []
+        if self.backend == 'tesserocr':
+            level = tesserocr.RIL.WORD
+            with self._api() as api:
+                api.SetPageSegMode(psm)
+                self._set_image(api, image)
+                api.Recognize()
+                for word in tesserocr.iterate_level(api.GetIterator(), level):
+                    text = word.GetUTF8Text(level)
+                    box = word.BoundingBox(level)
+                    if not text or box is None:
+                        continue
+                    x1, y1, x2, y2 = box
+                    words.append({'text': text, 'conf': word.Confidence(level),
+                                  'left': x1, 'top': y1, 'width': x2 - x1, 'height': y2 - y1})
+            return words
+
+        lines = self._run_cli(image, psm, tsv=True).splitlines()
+        for line in lines[1:]:
+            columns = line.split('\t')
+            # level=5 が単語の行（level page_num block_num par_num line_num word_num left top width height conf text）
+            if len(columns) < 12 or columns[0] != '5':
+                continue
+            words.append({'text': columns[11], 'conf': float(columns[10]),
+                          'left': int(columns[6]), 'top': int(columns[7]),
+                          'width': int(columns[8]), 'height': int(columns[9])})
+        return words
+
+    def image_to_string(self, image, psm=3):
+        """画像全体の認識結果をテキストで返す"""
+        if self.backend is None:
+            raise RuntimeError("Tesseractを利用できません")
+
+        if self.backend == 'tesserocr':
+            with self._api() as api:
+                api.SetPageSegMode(psm)
+                self._set_image(api, image)
+                return api.GetUTF8Text()
+        return self._run_cli(image, psm)
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "available": self.backend is not None,
+                "backend": self.backend,
+                "size": self.size,
+                "workers": self.workers,
+                "calls": self.calls,
+                "seconds_total": round(self.seconds, 3),
+                "seconds_avg": round(self.seconds / self.calls, 3) if self.calls else None,
+            }
+
+# プロセス内で共有するTesseractのワーカープール
+tesseract_pool = TesseractPool()
+
+def tesseract_stats():
+    """Tesseractのワーカープールの統計を返す"""
+    return tesseract_pool.stats()
 
 
 def decode_image(image_data):
-    """base64エンコードされた画像データをデコードしてOpenCV画像に変換"""
+    """base64エンコードされた画像データ（またはエンコード済み画像のバイナリ）をデコードしてOpenCV画像に変換"""
     import base64
     import cv2
     import numpy as np
 
     try:
         # bytesの場合も str に変換しない → base64として扱う必要あり
-        if isinstance(image_data, bytes):
+        if isinstance(image_data, (bytes, bytearray, memoryview)):
             # PythonのBridge経由ではbytesで来ることがあるのでここでbase64処理してOK
             decoded = image_data
         elif isinstance(image_data, str):
@@ -157,12 +762,92 @@ def decode_image(image_data):
         raise ValueError(f"画像のデコードエラー: {e}")
 
 
-def extract_colors(image_data):
+def _attach_shared_memory(name):
+    """
+    既存の共有メモリセグメントにアタッチする
+
+    POSIX環境ではアタッチしただけのセグメントもresource_trackerに登録され、
+    プロセス終了時に削除されてしまうため、登録を解除して作成元に管理を任せる。
+    """
+    from multiprocessing import shared_memory
+
+    try:
+        # Python 3.13以降はtrack=Falseで登録自体を抑止できる
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+        if os.name == 'posix':
+            try:
+                from multiprocessing import resource_tracker
+                resource_tracker.unregister(shm._name, 'shared_memory')
+            except Exception:
+                pass
+        return shm
+
+
+def load_image_reference(reference):
+    """
+    画像参照からOpenCV画像を読み込む（Base64やパイプを経由しない）
+
+    Args:
+        reference: 画像参照の辞書。次のいずれかの形式:
+            {'path': '/path/to/image.png'}
+                エンコード済み画像ファイル。cv2.imreadで直接読み込む
+            {'path': '/path/to/pixels.raw', 'shape': [h, w, 3], 'dtype': 'uint8'}
+                生ピクセルファイル。メモリマップしてコピーせずに参照する（.npyはshape不要）
+            {'shm': 'segment_name', 'shape': [h, w, 3], 'dtype': 'uint8'}
+                multiprocessing.shared_memoryのセグメント。コピーせずに参照する
+
+    Returns:
+        tuple: (画像のndarray, 共有メモリオブジェクトまたはNone)
+            共有メモリを使った場合、呼び出し側は画像の利用後にclose()する必要がある
+    """
+    if not isinstance(reference, dict):
+        raise ValueError("画像参照は辞書形式である必要があります")
+
+    shape = reference.get('shape')
+    dtype = np.dtype(reference.get('dtype', 'uint8'))
+
+    if reference.get('shm'):
+        if not shape:
+            raise ValueError("共有メモリ参照にはshapeが必要です")
+        shm = _attach_shared_memory(reference['shm'])
+        required = int(np.prod(shape)) * dtype.itemsize
+        if shm.size < required:
+            shm.close()
+            raise ValueError(f"共有メモリのサイズが不足しています: {shm.size} < {required}")
+        img = np.ndarray(tuple(shape), dtype=dtype, buffer=shm.buf)
+        return img, shm
+
+    path = reference.get('path')
+    if not path:
+        raise ValueError("画像参照にはpathまたはshmが必要です")
+    if not os.path.isfile(path):
+        raise ValueError(f"画像ファイルが見つかりません: {path}")
+
+    if path.lower().endswith('.npy'):
+        return np.load(path, mmap_mode='r'), None
+
+    if shape:
+        return np.memmap(path, dtype=dtype, mode='r', shape=tuple(shape)), None
+
+    img = cv2.imread(path, cv2.IMREAD_COLOR)
+    if img is None:
+        # cv2.imreadは非ASCIIパス（日本語のフォルダ名など）を扱えない環境があるため、バイト列経由で再試行
+        img = cv2.imdecode(np.fromfile(path, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError(f"画像ファイルを読み込めませんでした: {path}")
+    return img, None
+
+
+def extract_colors(image_data, small_img=None, quality=None):
     """
     画像から主要な色を抽出
 
     Args:
         image_data: Base64エンコードされた画像データ、またはOpenCVイメージ
+        small_img: 色抽出用に縮小済みの画像（AnalysisContextで共有されたもの。省略時はここで縮小する）
+        quality: 品質プリセット（K-meansの試行回数が変わる）
 
     Returns:
         list: 主要な色のリスト
@@ -181,11 +866,9 @@ def extract_colors(image_data):
         else:
             return []
 
-        height, width = img.shape[:2]
-
         # 処理を高速化するためにリサイズ
-        scale = RESIZE_WIDTH / width
-        small_img = cv2.resize(img, (0, 0), fx=scale, fy=scale)
+        if small_img is None:
+            small_img = resize_for_colors(img)
 
         # K-meansクラスタリングで色抽出
         if SKLEARN_AVAILABLE:
@@ -194,7 +877,7 @@ def extract_colors(image_data):
             pixels = pixels[:, ::-1]  # BGR to RGB
 
             # K-meansでクラスタリング
-            kmeans = KMeans(n_clusters=MAX_COLORS, n_init=10)
+            kmeans = KMeans(n_clusters=MAX_COLORS, n_init=get_quality_preset(quality)['kmeans_n_init'])
             kmeans.fit(pixels)
 
             # クラスタの中心点（色）を取得
@@ -259,77 +942,344 @@ def extract_colors(image_data):
         traceback.print_exc()
         return []
 
-def extract_text(image_data):
+def resize_for_colors(img):
+    """色抽出用に画像を幅RESIZE_WIDTHへ縮小する"""
+    height, width = img.shape[:2]
+    scale = RESIZE_WIDTH / width
+    return cv2.resize(img, (0, 0), fx=scale, fy=scale)
+
+def resolve_ocr_mode(mode=None):
+    """OCRのモードを返す（未指定・不明な値の場合はtext）"""
+    if mode is None:
+        return DEFAULT_OCR_MODE
+    mode = str(mode).lower()
+    if mode not in OCR_MODES:
+        logger.warning(f"不明なOCRモードが指定されました: {mode}（{DEFAULT_OCR_MODE}で抽出します）")
+        return DEFAULT_OCR_MODE
+    return mode
+
+def empty_text_result(mode=None, degraded=False):
+    """
+    空のテキスト抽出結果を返す（boxesモードの場合は'mode'キーを付ける）
+
+    degraded=Trueは、OCRエンジンが利用できない・失敗したために結果が得られなかったことを示す
+    （テキストがない画像の結果と区別し、結果キャッシュに保存しないようにする）。
+    """
+    result = {'text': '', 'textBlocks': []}
+    if resolve_ocr_mode(mode) == 'boxes':
+        result['mode'] = 'boxes'
+    if degraded:
+        result['degraded'] = True
+    return result
+
+def extract_text(image_data, tile_height=None, quality=None, mode=None):
     """
     画像からテキストを抽出
 
     Args:
         image_data: Base64エンコードされた画像データ、またはOpenCVイメージ
+        tile_height: 縦長画像を分割してOCRする帯の高さ（resolve_tile_heightを参照）
+        quality: 品質プリセット（作業解像度・OCRエンジン・信頼度の閾値が変わる）
+        mode: 'text'（検出と認識）または 'boxes'（検出だけを行い、位置と大きさを返す）
 
     Returns:
         dict: 抽出したテキスト情報
     """
+    # 結果の形（boxesの場合は'mode'キーを持つ）はモードだけで決まるよう、空の結果もモードに合わせる
+    mode = resolve_ocr_mode(mode)
     try:
         # 画像データのデコード処理
         if isinstance(image_data, str):
             img_data = decode_image(image_data)
             if not img_data:
-                return {'text': '', 'textBlocks': []}
+                return empty_text_result(mode)
             img = img_data
         elif isinstance(image_data, dict) and 'opencv' in image_data:
             img = image_data['opencv']
         elif isinstance(image_data, np.ndarray):
             img = image_data
         else:
-            return {'text': '', 'textBlocks': []}
+            return empty_text_result(mode)
+
+        preset = get_quality_preset(quality)
+        if preset['ocr_engine'] == 'none':
+            return empty_text_result(mode)
+
+        # 作業解像度に縮小して解析し、座標を元の画像に戻す
+        working_img, restore = to_working_resolution(img, quality)
+        if restore != 1:
+            return scale_positions(extract_text(working_img, tile_height=tile_height, quality=quality, mode=mode),
+                                   restore)
+
+        # 縦長の画像は帯ごとにOCRする（前処理やOCRエンジンのメモリ使用量を帯のサイズに抑える）
+        requested_tile_height = tile_height
+        tile_height = resolve_tile_height(img.shape[0], tile_height)
+        # 帯ごとのOCR結果キャッシュや帯の並列OCRが有効な場合は、固定の高さの帯に分けて、
+        # 以前に見たことのある帯（デザインの改訂前後で変わらないヘッダーやフッターなど）の結果を
+        # 再利用し、残りの帯を並列にOCRする
+        if (not tile_height and requested_tile_height is None
+                and (_text_tile_cache is not None or _ocr_offload is not None)):
+            tile_height = resolve_tile_height(img.shape[0], TEXT_STRIP_HEIGHT)
+        if tile_height:
+            return extract_text_tiled(img, tile_height, quality=quality, mode=mode)
+
+        # OCRは途中で中断できないため、開始前にキャンセルや期限切れを確認する
+        check_cancelled()
+
+        # 位置だけが必要な場合は認識を省略する
+        if mode == 'boxes':
+            return detect_text_boxes(img)
 
         # まずEasyOCRで試行（利用可能な場合）
         result = None
-        if EASYOCR_AVAILABLE:
+        if EASYOCR_AVAILABLE and preset['ocr_engine'] in ('auto', 'easyocr'):
             try:
-                result = extract_text_with_easyocr(img)
+                result = extract_text_with_easyocr(img, min_confidence=preset['ocr_min_confidence'],
+                                                   decoder=preset['ocr_decoder'],
+                                                   proposals=preset['ocr_proposals'])
                 # ログをprintからloggingに変更
-                logging.info("EasyOCRでテキスト抽出完了")
+                logger.info("EasyOCRでテキスト抽出完了")
             except Exception as e:
-                logging.error(f"EasyOCRでのテキスト抽出に失敗: {e}")
+                logger.error(f"EasyOCRでのテキスト抽出に失敗: {e}")
                 result = None
 
         # EasyOCR失敗またはインストールされていない場合はTesseractにフォールバック
-        if result is None and TESSERACT_AVAILABLE:
+        if result is None and TESSERACT_AVAILABLE and preset['ocr_engine'] in ('auto', 'tesseract'):
             try:
                 result = extract_text_with_tesseract(img)
-                logging.info("Tesseractでテキスト抽出完了")
+                logger.info("Tesseractでテキスト抽出完了")
             except Exception as e:
-                logging.error(f"Tesseractでのテキスト抽出に失敗: {e}")
-                result = {'text': '', 'textBlocks': []}
+                logger.error(f"Tesseractでのテキスト抽出に失敗: {e}")
+                result = empty_text_result(mode, degraded=True)
         elif result is None:
             # どちらのOCRも利用できない場合
-            result = {'text': '', 'textBlocks': []}
+            result = empty_text_result(mode, degraded=True)
 
         return result
 
     except Exception as e:
-        logging.error(f"テキスト抽出エラー: {str(e)}")
+        logger.error(f"テキスト抽出エラー: {str(e)}")
         traceback.print_exc()
-        return {'text': '', 'textBlocks': []}
+        return empty_text_result(mode, degraded=True)
+
+
+def extract_text_tiled(img, tile_height, overlap=TILE_OVERLAP, quality=None, mode=None):
+    """
+    画像を重なりのある水平の帯に分けてOCRし、結果を画像全体の座標に戻して結合する
+
+    重なり部分で両方の帯に検出されたテキストは、ブロックの中心がその帯の担当範囲にある方を採用する。
+
+    Args:
+        img: OpenCV画像
+        tile_height: 帯の高さ
+        overlap: 帯の重なり
+        quality: 品質プリセット
+        mode: OCRのモード（extract_textを参照）
+
+    Returns:
+        dict: 抽出したテキスト情報（extract_textと同じ形式）
+    """
+    text_blocks = []
+    full_text = []
+    tiles = list(iter_tiles(img.shape[0], tile_height, overlap))
+    logger.info(f"縦長画像を{len(tiles)}個の帯に分けてOCRします（高さ={img.shape[0]}px, 帯={tile_height}px）")
+
+    # 帯はビューとして切り出す（コピーしない）
+    strip_results = extract_strips_text([img[top:bottom] for top, bottom, _, _ in tiles], quality=quality, mode=mode)
+
+    for (top, bottom, owned_top, owned_bottom), strip_result in zip(tiles, strip_results):
+        # 重なり部分で両方の帯に検出されたブロックは、中心がこの帯の担当範囲にある場合だけ採用する
+        for block in strip_result.get('textBlocks', []):
+            position = dict(block.get('position', {}))
+            position['y'] = position.get('y', 0) + top
+            center_y = position['y'] + position.get('height', 0) / 2
+            if not (owned_top <= center_y < owned_bottom):
+                continue
+            text_blocks.append({**block, 'position': position})
+            if block.get('text'):
+                full_text.append(block['text'])
+
+    if resolve_ocr_mode(mode) == 'boxes':
+        # 検出だけの結果は信頼度を持たないため、上から順に並べる
+        text_blocks.sort(key=lambda x: (x['position']['y'], x['position']['x']))
+        result = {'text': '', 'textBlocks': text_blocks, 'mode': 'boxes'}
+    else:
+        # テキストブロックを信頼度でソート
+        text_blocks.sort(key=lambda x: x['confidence'], reverse=True)
+        result = {
+            'text': ' '.join(full_text),
+            'textBlocks': text_blocks
+        }
+
+    # OCRに失敗した帯があれば、全体の結果もキャッシュしない
+    if any(strip_result.get('degraded') for strip_result in strip_results):
+        result['degraded'] = True
+    return result
+
+def detect_text_boxes(image):
+    """
+    テキストの認識を行わず、テキストがある位置と大きさだけを求める
+
+    EasyOCRが利用できる場合は検出モデル（CRAFT）だけを実行する。利用できない場合は
+    propose_text_regionsのモルフォロジーによる候補をそのまま返す。
+
+    Args:
+        image: OpenCV画像
+
+    Returns:
+        dict: extract_textと同じ形式（textBlocksのtextは空文字列で、confidenceを持たない）
+    """
+    boxes = None
+    if EASYOCR_AVAILABLE:
+        try:
+            horizontal_list, free_list = easyocr_reader.detect(image)
+            boxes = [[int(x_min), int(x_max), int(y_min), int(y_max)]
+                     for x_min, x_max, y_min, y_max in horizontal_list[0]]
+            # 傾いたテキストは四隅の座標の外接矩形にする
+            for points in free_list[0]:
+                xs = [pt[0] for pt in points]
+                ys = [pt[1] for pt in points]
+                boxes.append([int(min(xs)), int(max(xs)), int(min(ys)), int(max(ys))])
+        except Exception as e:
+            logger.error(f"EasyOCRでのテキスト検出に失敗: {e}")
+            boxes = None
+
+    if boxes is None:
+        gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        boxes = propose_text_regions(gray)
+
+    height, width = image.shape[:2]
+    text_blocks = []
+    for x_min, x_max, y_min, y_max in sorted(boxes, key=lambda b: (b[2], b[0])):
+        x_min, y_min = max(0, x_min), max(0, y_min)
+        x_max, y_max = min(width, x_max), min(height, y_max)
+        if x_max <= x_min or y_max <= y_min:
+            continue
+        text_blocks.append({
+            'text': '',
+            'position': {
+                'x': x_min,
+                'y': y_min,
+                'width': x_max - x_min,
+                'height': y_max - y_min
+            }
+        })
+
+    return {'text': '', 'textBlocks': text_blocks, 'mode': 'boxes'}
+
+def propose_text_regions(gray):
+    """
+    モルフォロジー勾配からテキスト行の候補領域を抽出する
+
+    UIのスクリーンショットは単色の塗りや写真が大半を占め、テキストは一部にしかないため、
+    文字のエッジが横に並んでいる領域だけを候補とする。候補は1行ずつになるよう横方向にだけ連結する。
+
+    Args:
+        gray: グレースケール画像
+
+    Returns:
+        list: 候補領域 [x_min, x_max, y_min, y_max] のリスト（EasyOCRのhorizontal_listの形式）
+    """
+    height, width = gray.shape[:2]
+
+    # 文字の輪郭を強調し、二値化する
+    gradient = cv2.morphologyEx(gray, cv2.MORPH_GRADIENT, cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3)))
+    _, binary = cv2.threshold(gradient, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+
+    # 文字同士を横方向に連結して行にする（縦には連結しない）
+    connected = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, cv2.getStructuringElement(cv2.MORPH_RECT, (9, 1)))
+    contours, _ = cv2.findContours(connected, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    regions = []
+    for contour in contours:
+        x, y, w, h = cv2.boundingRect(contour)
+        if h < TEXT_PROPOSAL_MIN_HEIGHT or h > TEXT_PROPOSAL_MAX_HEIGHT or w < h:
+            continue
+        # エッジがまばらな領域（枠線や大きな図形の輪郭）は除外する
+        if cv2.countNonZero(binary[y:y + h, x:x + w]) / float(w * h) < TEXT_PROPOSAL_MIN_FILL:
+            continue
+        margin = max(2, int(h * TEXT_PROPOSAL_MARGIN))
+        regions.append([max(0, x - margin), min(width, x + w + margin),
+                        max(0, y - margin), min(height, y + h + margin)])
+
+    # 上から順に並べる（認識結果の順序を画像全体で検出した場合に近づける）
+    regions.sort(key=lambda r: (r[2], r[0]))
+    return regions
+
+def _strip_cache_key(cache, strip, quality, mode):
+    """帯のピクセルのハッシュからOCR結果キャッシュのキーを作る"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{strip.shape}:{strip.dtype.str}".encode('utf-8'))
+    digest.update(memoryview(np.ascontiguousarray(strip)).cast('B'))
+    return cache.make_key('text_tile', digest.hexdigest(),
+                          {'quality': str(quality or DEFAULT_QUALITY).lower(), 'mode': resolve_ocr_mode(mode)})
+
+def extract_strips_text(strips, quality=None, mode=None):
+    """
+    複数の帯をOCRする
+
+    帯ごとのOCR結果キャッシュが有効な場合は、帯のピクセルのハッシュで結果を再利用する。
+    キャッシュになかった帯は、並列OCRが有効であれば別プロセスでまとめて実行し、
+    そうでなければ順に実行する。
+
+    Returns:
+        list: 帯ごとの、帯の座標でのテキスト情報（キャッシュから返した値は共有されるため書き換えないこと）
+    """
+    cache = _text_tile_cache
+    offload = _ocr_offload
+    results = [None] * len(strips)
+    keys = [None] * len(strips)
+
+    if cache is not None:
+        for i, strip in enumerate(strips):
+            keys[i] = _strip_cache_key(cache, strip, quality, mode)
+            results[i] = cache.get(keys[i])
+    pending = [i for i, result in enumerate(results) if result is None]
+
+    if offload is not None and len(pending) > 1:
+        futures = {i: offload(strips[i], quality, mode) for i in pending}
+        try:
+            for i, future in futures.items():
+                while results[i] is None:
+                    try:
+                        results[i] = future.result(timeout=OCR_OFFLOAD_POLL_SECONDS)
+                    except concurrent.futures.TimeoutError:
+                        # 別プロセスのOCRは中断できないため、待っている間にキャンセルを確認する
+                        check_cancelled()
+                    except Exception as e:
+                        # ワーカープロセスが異常終了した場合などは、この帯をこのプロセスでOCRする
+                        logger.warning(f"帯の並列OCRに失敗したため、順に実行します: {e}")
+                        results[i] = extract_text(strips[i], tile_height=0, quality=quality, mode=mode)
+        finally:
+            for future in futures.values():
+                future.cancel()
+    else:
+        for i in pending:
+            results[i] = extract_text(strips[i], tile_height=0, quality=quality, mode=mode)
 
+    if cache is not None:
+        for i in pending:
+            cache.put(keys[i], results[i])
+    return results
 
-def extract_text_with_easyocr(image, min_confidence=0.4):
+def extract_text_with_easyocr(image, min_confidence=0.4, decoder='greedy', proposals=False):
     """
     EasyOCRを使用して画像からテキストを抽出する
 
+    proposals=Trueの場合は、propose_text_regionsで求めた候補領域だけを認識し、検出モデルを省略する。
+    候補がない場合や、候補が画像の大部分を占める場合（テキストが密な画像）は画像全体で検出・認識する。
+
     Args:
         image: 入力画像（NumPy配列）
         min_confidence: 検出するテキストの最小信頼度スコア（デフォルト: 0.4）
+        decoder: 認識結果のデコーダー（'greedy' または 'beamsearch'）
+        proposals: テキスト領域の候補だけを認識するか
 
     Returns:
         dict: 抽出したテキスト情報
     """
-    import easyocr
     import numpy as np
     import cv2
-    import tempfile
-    import os
 
     # 画像の前処理を行う
     # グレースケールに変換
@@ -342,16 +1292,25 @@ def extract_text_with_easyocr(image, min_confidence=0.4):
     # バイラテラルフィルタでノイズ低減（エッジは保持）
     filtered = cv2.bilateralFilter(enhanced, 9, 75, 75)
 
-    # 一時ファイルに保存
-    temp_filename = 'temp_ocr_image.jpg'
-    cv2.imwrite(temp_filename, filtered)
-
     try:
-        # EasyOCRリーダーの初期化
-        reader = easyocr.Reader(['ja', 'en'])
-
         # テキスト検出の実行（detail=1でバウンディングボックス、テキスト、信頼度を取得）
-        results = reader.readtext(temp_filename, detail=1, paragraph=False)
+        # 前処理済みの配列をそのまま渡す（一時ファイルへの書き出しとJPEGの再エンコードを避ける）
+        # リーダーはプロセス内で共有し、モデルの再読み込みを避ける
+        regions = propose_text_regions(enhanced) if proposals else None
+        if regions is not None:
+            covered = sum((r[1] - r[0]) * (r[3] - r[2]) for r in regions)
+            coverage = covered / float(filtered.shape[0] * filtered.shape[1])
+            logger.debug(f"テキスト領域の候補: {len(regions)}件（面積の{coverage:.1%}）")
+            # 候補がない場合も、候補の条件に合わないテキスト（縦書きなど）がありうるため画像全体で検出する
+            if not regions or coverage > TEXT_PROPOSAL_MAX_COVERAGE:
+                regions = None
+
+        if regions is None:
+            results = easyocr_reader.readtext(filtered, detail=1, paragraph=False, decoder=decoder)
+        else:
+            # 候補領域の切り出しをまとめて認識し、画像全体の座標で受け取る
+            results = easyocr_reader.recognize(filtered, regions, detail=1, paragraph=False, decoder=decoder,
+                                              batch_size=TEXT_PROPOSAL_BATCH_SIZE)
 
         # 結果の整形とフィルタリング
         text_blocks = []
@@ -407,13 +1366,6 @@ def extract_text_with_easyocr(image, min_confidence=0.4):
         logger.error(f"EasyOCRでの処理中にエラーが発生: {e}")
         traceback.print_exc()
         raise
-    finally:
-        # 一時ファイルの削除
-        try:
-            if os.path.exists(temp_filename):
-                os.remove(temp_filename)
-        except:
-            pass
 
 
 def extract_text_with_tesseract(image):
@@ -429,28 +1381,22 @@ def extract_text_with_tesseract(image):
     if not TESSERACT_AVAILABLE:
         return {'text': '', 'textBlocks': []}
 
-    # Tesseractの設定
-    custom_config = r'--oem 3 --psm 11'
-
-    # OpenCV画像をPIL形式に変換
-    image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-    pil_image = Image.fromarray(image_rgb)
-
-    # Tesseractでテキスト検出
-    data = pytesseract.image_to_data(pil_image, config=custom_config, output_type=Output.DICT)
+    # Tesseractでテキスト検出（--psm 11: 順序を問わずできるだけ多くのテキストを探す）
+    # 画像は配列のままワーカープールに渡す
+    words = tesseract_pool.image_to_data(image, psm=11)
 
     # 結果を整形
     text_blocks = []
     combined_text = []
 
-    for i in range(len(data['text'])):
+    for word in words:
         # 空のテキストをスキップ
-        if data['text'][i].strip() == '':
+        if word['text'].strip() == '':
             continue
 
         # テキスト情報を取得
-        text = data['text'][i].strip()
-        confidence = float(data['conf'][i]) / 100  # 0-1の範囲に正規化
+        text = word['text'].strip()
+        confidence = float(word['conf']) / 100  # 0-1の範囲に正規化
 
         # 信頼度が低いものはスキップ
         if confidence < 0.3:
@@ -460,10 +1406,10 @@ def extract_text_with_tesseract(image):
         text = correct_ocr_text(text)
 
         # バウンディングボックスの情報
-        x = data['left'][i]
-        y = data['top'][i]
-        w = data['width'][i]
-        h = data['height'][i]
+        x = word['left']
+        y = word['top']
+        w = word['width']
+        h = word['height']
 
         text_block = {
             'text': text,
@@ -668,12 +1614,86 @@ def classify_section_type(section_data, all_sections=None, text_blocks=None):
     return basic_type
 
 
-def analyze_sections(image_data):
+def find_section_boundaries(gray, tile_height=None):
+    """
+    グレースケール画像の水平勾配からセクション境界のY座標を求める
+
+    Args:
+        gray: グレースケール画像
+        tile_height: 縦長画像を分割して勾配を計算する帯の高さ（resolve_tile_heightを参照）
+
+    Returns:
+        list: 上端・下端を含む境界のY座標
+    """
+    height = gray.shape[0]
+
+    tile_height = resolve_tile_height(height, tile_height)
+    if tile_height:
+        gradient_means = horizontal_gradient_profile_tiled(gray, tile_height)
+    else:
+        # ブラー処理
+        blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+
+        # 水平方向のエッジを検出
+        sobelx = cv2.Sobel(blurred, cv2.CV_64F, 1, 0, ksize=3)
+        sobelx = np.abs(sobelx)
+        normalized_sobelx = cv2.normalize(sobelx, None, 0, 255, cv2.NORM_MINMAX, cv2.CV_8U)
+
+        # 水平勾配の平均を計算
+        gradient_means = np.mean(normalized_sobelx, axis=1)
+
+    # ピークを検出してセクション境界を特定
+    peak_indices = []
+    min_peak_value = np.mean(gradient_means) * 1.5
+    min_peak_distance = height * 0.05  # 最小ピーク間距離
+
+    for i in range(1, len(gradient_means) - 1):
+        if gradient_means[i] > min_peak_value and gradient_means[i] > gradient_means[i - 1] and gradient_means[i] > gradient_means[i + 1]:
+            if not peak_indices or i - peak_indices[-1] > min_peak_distance:
+                peak_indices.append(i)
+
+    # 追加の境界として上端と下端を設定
+    return [0] + peak_indices + [height - 1]
+
+def horizontal_gradient_profile_tiled(gray, tile_height):
+    """
+    帯ごとに水平勾配を計算し、行ごとの平均（0〜255に正規化）を返す
+
+    画像全体のCV_64FのSobel画像を作らずに、find_section_boundariesと同じ勾配プロファイルを求める。
+    正規化に使う最小値・最大値は全ての帯から求める。
+    """
+    height = gray.shape[0]
+    row_means = np.empty(height, dtype=np.float64)
+    global_min = np.inf
+    global_max = -np.inf
+
+    for top in range(0, height, tile_height):
+        check_cancelled()
+        bottom = min(top + tile_height, height)
+        # ブラーとSobelが帯の境界で変わらないよう、上下に余分な行を含めて計算する
+        halo_top = max(0, top - TILE_HALO)
+        halo_bottom = min(height, bottom + TILE_HALO)
+        blurred = cv2.GaussianBlur(gray[halo_top:halo_bottom], (5, 5), 0)
+        sobelx = np.abs(cv2.Sobel(blurred, cv2.CV_32F, 1, 0, ksize=3))
+        strip = sobelx[top - halo_top:top - halo_top + (bottom - top)]
+        row_means[top:bottom] = strip.mean(axis=1)
+        global_min = min(global_min, float(strip.min()))
+        global_max = max(global_max, float(strip.max()))
+
+    if global_max <= global_min:
+        return np.zeros(height, dtype=np.float64)
+    return (row_means - global_min) * (255.0 / (global_max - global_min))
+
+def analyze_sections(image_data, boundaries=None, text_blocks=None, tile_height=None, quality=None):
     """
     画像のセクションを分析
 
     Args:
         image_data: Base64エンコードされた画像データ、またはOpenCVイメージ
+        boundaries: 計算済みのセクション境界（省略時はここで計算する）
+        text_blocks: 計算済みのテキストブロック（省略時はここでOCRを実行する）
+        tile_height: 縦長画像を分割処理する帯の高さ（resolve_tile_heightを参照）
+        quality: 品質プリセット（作業解像度・OCRの設定が変わる）
 
     Returns:
         dict: セクション情報のリスト
@@ -692,34 +1712,17 @@ def analyze_sections(image_data):
         else:
             return {'error': 'Invalid image data format', 'sections': []}
 
-        height, width = img.shape[:2]
-
-        # グレースケールに変換
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-
-        # ブラー処理
-        blurred = cv2.GaussianBlur(gray, (5, 5), 0)
-
-        # 水平方向のエッジを検出
-        sobelx = cv2.Sobel(blurred, cv2.CV_64F, 1, 0, ksize=3)
-        sobelx = np.abs(sobelx)
-        normalized_sobelx = cv2.normalize(sobelx, None, 0, 255, cv2.NORM_MINMAX, cv2.CV_8U)
-
-        # 水平勾配の平均を計算
-        gradient_means = np.mean(normalized_sobelx, axis=1)
-
-        # ピークを検出してセクション境界を特定
-        peak_indices = []
-        min_peak_value = np.mean(gradient_means) * 1.5
-        min_peak_distance = height * 0.05  # 最小ピーク間距離
+        # 中間結果が渡されていなければ、作業解像度に縮小して解析し、座標を元の画像に戻す
+        if boundaries is None and text_blocks is None:
+            working_img, restore = to_working_resolution(img, quality)
+            if restore != 1:
+                return scale_positions(analyze_sections(working_img, tile_height=tile_height, quality=quality), restore)
 
-        for i in range(1, len(gradient_means) - 1):
-            if gradient_means[i] > min_peak_value and gradient_means[i] > gradient_means[i - 1] and gradient_means[i] > gradient_means[i + 1]:
-                if not peak_indices or i - peak_indices[-1] > min_peak_distance:
-                    peak_indices.append(i)
+        height, width = img.shape[:2]
 
-        # 追加の境界として上端と下端を設定
-        boundaries = [0] + peak_indices + [height - 1]
+        # セクション境界を特定
+        if boundaries is None:
+            boundaries = find_section_boundaries(cv2.cvtColor(img, cv2.COLOR_BGR2GRAY), tile_height=tile_height)
 
         # セクション情報を格納するリスト
         sections = []
@@ -756,11 +1759,12 @@ def analyze_sections(image_data):
             sections.append(section)
 
         # テキスト情報を抽出してセクションに関連付け（分類用）
-        try:
-            text_info = extract_text(image_data)
-            text_blocks = text_info.get('textBlocks', [])
-        except:
-            text_blocks = []
+        if text_blocks is None:
+            try:
+                text_info = extract_text(img, tile_height=tile_height, quality=quality)
+                text_blocks = text_info.get('textBlocks', [])
+            except Exception:
+                text_blocks = []
 
         # セクションの種類を分類
         for section in sections:
@@ -805,12 +1809,17 @@ def get_dominant_color(img):
         'hex': hex_color
     }
 
-def analyze_layout(image_data):
+def analyze_layout(image_data, sections=None, colors=None, edges=None, tile_height=None, quality=None):
     """
     画像のレイアウトパターンを分析
 
     Args:
         image_data: Base64エンコードされた画像データ、またはOpenCVイメージ
+        sections: 計算済みのセクション分析結果（省略時はここで分析する）
+        colors: 計算済みの主要色（省略時はここで抽出する）
+        edges: 計算済みのエッジ画像（省略時はここで検出する）
+        tile_height: 縦長画像を分割処理する帯の高さ（resolve_tile_heightを参照）
+        quality: 品質プリセット（作業解像度・OCR・色抽出の設定が変わる）
 
     Returns:
         dict: レイアウト分析結果
@@ -829,10 +1838,19 @@ def analyze_layout(image_data):
         else:
             return {'error': 'Invalid image data format'}
 
+        # 中間結果が渡されていなければ、作業解像度に縮小して解析し、座標を元の画像に戻す
+        if sections is None and colors is None and edges is None:
+            working_img, restore = to_working_resolution(img, quality)
+            if restore != 1:
+                return scale_positions(analyze_layout(working_img, tile_height=tile_height, quality=quality), restore)
+
         height, width = img.shape[:2]
 
         # セクション分析
-        sections = analyze_sections(image_data)
+        if sections is None:
+            sections = analyze_sections(img, tile_height=tile_height, quality=quality)
+        if colors is None:
+            colors = extract_colors_from_image(img, quality=quality)
 
         # 画像の基本情報
         layout_info = {
@@ -846,7 +1864,7 @@ def analyze_layout(image_data):
                 },
                 'sections': sections['sections'],
                 'styles': {
-                    'colors': extract_colors_from_image(image_data)
+                    'colors': colors
                 }
             }
         }
@@ -872,8 +1890,8 @@ def analyze_layout(image_data):
             layout_info['confidence'] = 0.8
         elif num_sections >= 3:
             # エッジ検出と線検出でグリッドを推測
-            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-            edges = cv2.Canny(gray, 50, 150)
+            if edges is None:
+                edges = detect_edges(cv2.cvtColor(img, cv2.COLOR_BGR2GRAY), tile_height=tile_height)
 
             # ハフ変換で線を検出
             lines = cv2.HoughLinesP(edges, 1, np.pi/180, 100, minLineLength=min(width, height)/4, maxLineGap=20)
@@ -916,12 +1934,38 @@ def analyze_layout(image_data):
             }
         }
 
-def detect_elements(image_data):
+def detect_edges(gray, tile_height=None):
+    """
+    要素検出・レイアウト推定で共通に使うCannyエッジ画像を返す
+
+    縦長の画像は帯ごとに計算して出力画像に書き込む（Cannyの作業領域を帯のサイズに抑える）。
+    """
+    height = gray.shape[0]
+    tile_height = resolve_tile_height(height, tile_height)
+    if not tile_height:
+        return cv2.Canny(gray, 50, 150)
+
+    edges = np.empty_like(gray)
+    for top in range(0, height, tile_height):
+        check_cancelled()
+        bottom = min(top + tile_height, height)
+        halo_top = max(0, top - TILE_HALO)
+        halo_bottom = min(height, bottom + TILE_HALO)
+        strip_edges = cv2.Canny(gray[halo_top:halo_bottom], 50, 150)
+        edges[top:bottom] = strip_edges[top - halo_top:top - halo_top + (bottom - top)]
+    return edges
+
+def detect_elements(image_data, edges=None, tile_height=None, quality=None, min_area=None, text_blocks=None):
     """
     画像からUIの主要な要素を検出
 
     Args:
         image_data: Base64エンコードされた画像データ、またはOpenCVイメージ
+        edges: 計算済みのエッジ画像（省略時はここで検出する）
+        tile_height: 縦長画像を分割処理する帯の高さ（resolve_tile_heightを参照）
+        quality: 品質プリセット（作業解像度が変わる）
+        min_area: 要素とみなす最小面積（省略時は画像の面積の0.5%。部分領域を解析する場合に全体の基準を渡す）
+        text_blocks: 計算済みのページ全体のOCR結果（省略時は要素内のテキストの有無をエッジの密度で判定する）
 
     Returns:
         dict: 検出された要素
@@ -940,21 +1984,32 @@ def detect_elements(image_data):
         else:
             return {'error': 'Invalid image data format', 'elements': []}
 
-        height, width = img.shape[:2]
+        # エッジ画像が渡されていなければ、作業解像度に縮小して解析し、座標を元の画像に戻す
+        if edges is None:
+            working_img, restore = to_working_resolution(img, quality)
+            if restore != 1:
+                working_min_area = min_area / (restore * restore) if min_area is not None else None
+                working_text_blocks = scale_positions(text_blocks, 1 / restore) if text_blocks is not None else None
+                return scale_positions(detect_elements(working_img, tile_height=tile_height, quality=quality,
+                                                       min_area=working_min_area, text_blocks=working_text_blocks),
+                                       restore)
 
-        # グレースケールに変換
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        height, width = img.shape[:2]
 
         # エッジ検出
-        edges = cv2.Canny(gray, 50, 150)
+        if edges is None:
+            edges = detect_edges(cv2.cvtColor(img, cv2.COLOR_BGR2GRAY), tile_height=tile_height)
 
         # 輪郭検出
         contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
 
         # 要素検出結果
         elements = []
-        min_area = (width * height) * 0.005  # 最小面積
+        if min_area is None:
+            min_area = (width * height) * 0.005  # 最小面積
 
+        # 要素とみなす輪郭の外接矩形を先に集める
+        rects = []
         for contour in contours:
             area = cv2.contourArea(contour)
 
@@ -963,8 +2018,14 @@ def detect_elements(image_data):
                 continue
 
             # 輪郭の外接矩形を取得
-            x, y, w, h = cv2.boundingRect(contour)
+            rects.append(cv2.boundingRect(contour))
 
+        check_cancelled()
+
+        # テキストの有無はすべての矩形についてまとめて判定する（要素ごとのOCRは行わない）
+        has_text = detect_text_presence(edges, rects, text_blocks=text_blocks)
+
+        for (x, y, w, h), element_has_text in zip(rects, has_text):
             # アスペクト比を計算
             aspect_ratio = w / h if h > 0 else 0
 
@@ -972,7 +2033,7 @@ def detect_elements(image_data):
             element_img = img[y:y+h, x:x+w]
 
             # 要素の種類を推測
-            element_type = classify_element(element_img, aspect_ratio)
+            element_type = classify_element(element_img, aspect_ratio, has_text=bool(element_has_text))
 
             # 要素情報を追加
             elements.append({
@@ -993,13 +2054,55 @@ def detect_elements(image_data):
         traceback.print_exc()
         return {'error': str(e), 'elements': []}
 
-def classify_element(element_img, aspect_ratio):
+def detect_text_presence(edges, rects, text_blocks=None):
+    """
+    複数の矩形について、テキストを含むかどうかをまとめて判定する
+
+    text_blocksが渡された場合は、テキストブロックの中心が矩形の内側にあるかで判定する。
+    渡されない場合は、エッジ画像の積分画像から矩形の内側（枠線を除く）のエッジの密度を求め、
+    文字のストロークがあるとみなせる密度かで判定する。どちらもOCRは実行しない。
+
+    Args:
+        edges: エッジ画像（detect_edgesの結果）
+        rects: (x, y, width, height) のリスト
+        text_blocks: ページ全体のOCR結果のテキストブロック（rectsと同じ座標系）
+
+    Returns:
+        numpy.ndarray: 矩形ごとのテキストの有無（bool）
+    """
+    if not rects:
+        return np.zeros(0, dtype=bool)
+    x, y, w, h = np.asarray(rects, dtype=np.int64).T
+
+    if text_blocks is not None:
+        centers = np.array([
+            (block['position']['x'] + block['position']['width'] / 2,
+             block['position']['y'] + block['position']['height'] / 2)
+            for block in text_blocks if block.get('position')
+        ], dtype=np.float64).reshape(-1, 2)
+        cx, cy = centers[:, 0], centers[:, 1]
+        inside = ((cx[None, :] >= x[:, None]) & (cx[None, :] < (x + w)[:, None]) &
+                  (cy[None, :] >= y[:, None]) & (cy[None, :] < (y + h)[:, None]))
+        return inside.any(axis=1)
+
+    inset = np.maximum(1, (np.minimum(w, h) * TEXT_PRESENCE_INSET_RATIO).astype(np.int64))
+    x1, y1 = x + inset, y + inset
+    x2, y2 = np.maximum(x1, x + w - inset), np.maximum(y1, y + h - inset)
+
+    integral = cv2.integral((edges > 0).astype(np.uint8))
+    edge_counts = integral[y2, x2] - integral[y1, x2] - integral[y2, x1] + integral[y1, x1]
+    areas = (x2 - x1) * (y2 - y1)
+    density = np.where(areas > 0, edge_counts / np.maximum(areas, 1), 0.0)
+    return density >= TEXT_PRESENCE_MIN_EDGE_DENSITY
+
+def classify_element(element_img, aspect_ratio, has_text=False):
     """
     UI要素の種類を分類
 
     Args:
         element_img: 要素の画像
         aspect_ratio: アスペクト比
+        has_text: 要素がテキストを含むか（detect_text_presenceの判定結果）
 
     Returns:
         str: 要素の種類
@@ -1013,11 +2116,9 @@ def classify_element(element_img, aspect_ratio):
         return 'sidebar'
     elif 0.9 < aspect_ratio < 1.1:
         # ほぼ正方形の場合
-        # テキストを含むかチェック
-        if TESSERACT_AVAILABLE:
-            text = pytesseract.image_to_string(element_img)
-            if len(text.strip()) > 0:
-                return 'button'
+        # テキストを含む場合はボタンとみなす
+        if has_text:
+            return 'button'
         return 'card'
     else:
         # その他の場合
@@ -1025,23 +2126,384 @@ def classify_element(element_img, aspect_ratio):
             return 'button'
         return 'content_section'
 
-def main():
+# ===== 解析ステージグラフ =====
+# analyze_allの各ステージと、ステージ間で共有する中間結果（グレースケール、縮小画像、
+# エッジ、OCR結果、主要色、セクション境界）をノードとして登録する。各ノードは入力ノードを
+# 宣言し、AnalysisContextが1リクエストにつき1回だけ計算して共有する。
+
+ANALYSIS_NODES = {}  # ノード名 → (入力ノード名のタプル, 計算関数, GIL依存か)
+
+# analyze_allが返すステージ（この順で結果を組み立てる）
+ANALYSIS_STAGES = ('colors', 'text', 'sections', 'layout', 'elements')
+
+def analysis_node(name, inputs=(), gil_bound=False):
     """
-    コマンドライン引数から機能を実行
+    解析ノードを登録するデコレーター
+
+    計算関数は func(ctx, **入力ノードの値) の形で呼び出される。
+    gil_bound=Trueのノードは処理の多くがPythonのループで、スレッドでは並列化されにくいため、
+    AnalysisContextにoffloadが設定されていれば別プロセスで計算される。
     """
-    if len(sys.argv) < 3:
-        print('使用法: python image_analyzer.py [機能] [ファイルパス]')
-        return
+    def register(func):
+        ANALYSIS_NODES[name] = (tuple(inputs), func, gil_bound)
+        return func
+    return register
 
-    command = sys.argv[1]
-    file_path = sys.argv[2]
+def compute_analysis_node(name, image, values, options=None):
+    """
+    入力ノードの値を与えて1つのノードを計算する（プロセスプールへのoffload用）
 
-    try:
-        # ファイルからバイナリデータを読み込み
-        with open(file_path, 'rb') as f:
-            image_data = f.read()
+    別プロセスではAnalysisContextを共有できないため、必要な入力は呼び出し側で解決して渡す。
+    """
+    _, func, _ = ANALYSIS_NODES[name]
+    return func(AnalysisContext(image, options), **values)
 
-        # OpenCVで画像を読み込み
+def configure_native_threads(threads):
+    """
+    OpenCV（とロード済みであればPyTorch）の内部スレッド数を設定する
+
+    ステージを並列に実行する場合、各ライブラリが全コアを使おうとすると
+    コア数を大きく超えるスレッドが動いてしまうため、呼び出し側で割り当てた数に制限する。
+    """
+    threads = max(1, int(threads))
+    cv2.setNumThreads(threads)
+    torch = sys.modules.get('torch')
+    if torch is not None:
+        try:
+            torch.set_num_threads(threads)
+        except Exception as e:
+            logger.warning(f"PyTorchのスレッド数を設定できませんでした: {e}")
+    logger.info(f"ネイティブライブラリのスレッド数を{threads}に設定しました")
+
+class AnalysisContext:
+    """
+    1回の解析リクエストで中間結果を共有するコンテキスト
+
+    get(name)で要求されたノードを、宣言された入力ノードを先に解決してから計算し、
+    結果を保持する。同じノードを複数のステージが要求しても計算は1回だけ行われる。
+    """
+
+    def __init__(self, image, options=None, offload=None):
+        self.image = image
+        self.options = options or {}
+        self.offload = offload  # offload(name, image, values, options) → 値（GIL依存ノードの別プロセス実行）
+        # 縦長画像の分割処理の帯の高さ（options.tile_height。省略時は画像の高さから自動で決定）
+        self.tile_height = self.options.get('tile_height')
+        # 品質プリセット（options.quality）。ノードは作業解像度に縮小した画像で計算し、
+        # stage_resultで元の画像の座標に戻す
+        self.quality = self.options.get('quality')
+        self.original_size = image.shape[:2] if image is not None else None
+        self.image, self.restore_scale = to_working_resolution(image, self.quality) if image is not None else (image, 1.0)
+        self._values = {}
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        self.timings = {}  # ノード名 → 計算時間（秒）
+
+    def _lock_for(self, name):
+        with self._locks_guard:
+            lock = self._locks.get(name)
+            if lock is None:
+                lock = self._locks[name] = threading.Lock()
+            return lock
+
+    def has(self, name):
+        return name in self._values
+
+    def provide(self, name, value):
+        """外部（結果キャッシュなど）で得た元の画像の座標の値を、ノードの結果として登録する"""
+        self._values.setdefault(name, scale_positions(value, 1 / self.restore_scale))
+
+    def stage_result(self, name):
+        """ノードの結果を元の画像の座標に戻して返す（analyze_allのステージ結果用）"""
+        return scale_positions(self.get(name), self.restore_scale)
+
+    def get(self, name):
+        """ノードの結果を返す（未計算の場合は入力ノードから順に計算する）"""
+        if name in self._values:
+            return self._values[name]
+        if name not in ANALYSIS_NODES:
+            raise KeyError(f"未登録の解析ノードです: {name}")
+
+        inputs, func, gil_bound = ANALYSIS_NODES[name]
+        # 入力ノードはロックの外で解決する（他のステージと並行して計算できるようにする）
+        values = {input_name: self.get(input_name) for input_name in inputs}
+
+        with self._lock_for(name):
+            if name not in self._values:
+                check_cancelled()
+                started = time.perf_counter()
+                if gil_bound and self.offload is not None:
+                    self._values[name] = self.offload(name, self.image, values, self.options)
+                else:
+                    self._values[name] = func(self, **values)
+                self.timings[name] = time.perf_counter() - started
+        return self._values[name]
+
+@analysis_node('gray')
+def _node_gray(ctx):
+    return cv2.cvtColor(ctx.image, cv2.COLOR_BGR2GRAY)
+
+@analysis_node('small')
+def _node_small(ctx):
+    return resize_for_colors(ctx.image)
+
+@analysis_node('edges', inputs=('gray',))
+def _node_edges(ctx, gray):
+    return detect_edges(gray, tile_height=ctx.tile_height)
+
+@analysis_node('section_boundaries', inputs=('gray',))
+def _node_section_boundaries(ctx, gray):
+    return find_section_boundaries(gray, tile_height=ctx.tile_height)
+
+@analysis_node('colors', inputs=('small',), gil_bound=True)
+def _node_colors(ctx, small):
+    return extract_colors(ctx.image, small_img=small, quality=ctx.quality)
+
+@analysis_node('text')
+def _node_text(ctx):
+    # options.ocr_mode='boxes'の場合は検出だけを行う（単体のextract_textコマンドと結果の形を揃える）
+    return extract_text(ctx.image, tile_height=ctx.tile_height, quality=ctx.quality, mode=ctx.options.get('ocr_mode'))
+
+@analysis_node('sections', inputs=('section_boundaries', 'text'))
+def _node_sections(ctx, section_boundaries, text):
+    return analyze_sections(ctx.image, boundaries=section_boundaries, text_blocks=text.get('textBlocks', []),
+                            quality=ctx.quality)
+
+@analysis_node('layout', inputs=('sections', 'colors', 'edges'))
+def _node_layout(ctx, sections, colors, edges):
+    return analyze_layout(ctx.image, sections=sections, colors=colors, edges=edges, quality=ctx.quality)
+
+@analysis_node('elements', inputs=('edges',), gil_bound=True)
+def _node_elements(ctx, edges):
+    # 単体のdetect_elementsコマンドと同じく要素のリストを返す（結果キャッシュを共有するため）
+    return detect_elements(ctx.image, edges=edges, quality=ctx.quality).get('elements', [])
+
+# ===== 差分再解析 =====
+
+def compute_image_fingerprint(img, tile=FINGERPRINT_TILE):
+    """
+    画像をタイルに分け、タイルごとのピクセルのハッシュを求める
+
+    前回の解析時の画像と比較して、変更されたタイルだけを再解析するために使う。
+
+    Returns:
+        dict: {'tile', 'width', 'height', 'hashes'（行ごとのハッシュのリスト）}
+    """
+    height, width = img.shape[:2]
+    hashes = []
+    for y in range(0, height, tile):
+        row = []
+        for x in range(0, width, tile):
+            block = np.ascontiguousarray(img[y:y + tile, x:x + tile])
+            row.append(hashlib.blake2b(block.data, digest_size=8).hexdigest())
+        hashes.append(row)
+    return {'tile': tile, 'width': width, 'height': height, 'hashes': hashes}
+
+def _rects_intersect(a, b):
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+def _merge_rects(rects):
+    """重なる矩形（x0, y0, x1, y1）をまとめる"""
+    merged = list(rects)
+    changed = True
+    while changed:
+        changed = False
+        result = []
+        for rect in merged:
+            for i, other in enumerate(result):
+                if _rects_intersect(rect, other):
+                    result[i] = (min(rect[0], other[0]), min(rect[1], other[1]),
+                                 max(rect[2], other[2]), max(rect[3], other[3]))
+                    changed = True
+                    break
+            else:
+                result.append(rect)
+        merged = result
+    return merged
+
+def diff_fingerprints(previous, current):
+    """
+    2つの画像のフィンガープリントを比較し、変更された領域を返す
+
+    Returns:
+        list: 変更領域の矩形 (x0, y0, x1, y1) のリスト。画像サイズが異なるなど比較できない場合はNone
+    """
+    if not previous or not current:
+        return None
+    if (previous.get('tile') != current.get('tile') or previous.get('width') != current.get('width')
+            or previous.get('height') != current.get('height')):
+        return None
+
+    tile = current['tile']
+    width, height = current['width'], current['height']
+    rects = []
+    for row_index, (old_row, new_row) in enumerate(zip(previous['hashes'], current['hashes'])):
+        for col_index, (old_hash, new_hash) in enumerate(zip(old_row, new_row)):
+            if old_hash != new_hash:
+                x0, y0 = col_index * tile, row_index * tile
+                # 隣接するタイルがまとまるよう、余白を付けてから結合する
+                rects.append((max(0, x0 - INCREMENTAL_MARGIN), max(0, y0 - INCREMENTAL_MARGIN),
+                              min(width, x0 + tile + INCREMENTAL_MARGIN), min(height, y0 + tile + INCREMENTAL_MARGIN)))
+    return _merge_rects(rects)
+
+def _position_rect(item):
+    position = item.get('position', {})
+    x = position.get('x', position.get('left', 0))
+    y = position.get('y', position.get('top', 0))
+    return (x, y, x + position.get('width', 0), y + position.get('height', 0))
+
+def _expand_region(region, items):
+    """領域と交わる項目（テキストブロック・要素）が途中で切れないよう、領域をそれらを含む大きさに広げる"""
+    while True:
+        expanded = region
+        for item in items:
+            rect = _position_rect(item)
+            if _rects_intersect(expanded, rect):
+                expanded = (min(expanded[0], rect[0]), min(expanded[1], rect[1]),
+                            max(expanded[2], rect[2]), max(expanded[3], rect[3]))
+        if expanded == region:
+            return region
+        region = expanded
+
+def _offset_positions(items, dx, dy):
+    """部分領域で検出した項目の座標を画像全体の座標に戻す"""
+    shifted = []
+    for item in items:
+        position = dict(item.get('position', {}))
+        position['x'] = position.get('x', 0) + dx
+        position['y'] = position.get('y', 0) + dy
+        if 'center' in position:
+            position['center'] = [position['center'][0] + dx, position['center'][1] + dy]
+        shifted.append({**item, 'position': position})
+    return shifted
+
+def _reanalyze_regions(img, regions, previous_items, analyze_region):
+    """
+    変更領域と交わる前回の項目を捨て、領域を再解析した結果と置き換える
+
+    Returns:
+        tuple: (項目のリスト, 再利用した項目数)
+    """
+    height, width = img.shape[:2]
+    crops = _merge_rects([_expand_region(region, previous_items) for region in regions])
+    crops = [(max(0, int(x0)), max(0, int(y0)), min(width, int(x1)), min(height, int(y1))) for x0, y0, x1, y1 in crops]
+
+    kept = [item for item in previous_items if not any(_rects_intersect(crop, _position_rect(item)) for crop in crops)]
+    items = list(kept)
+    for x0, y0, x1, y1 in crops:
+        check_cancelled()
+        if x1 <= x0 or y1 <= y0:
+            continue
+        items.extend(_offset_positions(analyze_region(img[y0:y1, x0:x1]), x0, y0))
+    return items, len(kept)
+
+def analyze_incremental(img, previous, regions, options=None):
+    """
+    前回の解析結果を元に、変更された領域だけを再解析する
+
+    OCRと要素検出は変更領域（と交わる前回のブロック・要素を含むよう広げた範囲）だけで実行し、
+    それ以外のテキストブロック・要素はそのまま再利用する。セクションはマージしたテキストブロックで
+    分類し直し（OCRは行わない）、変更面積が小さければ主要色も再利用する。
+
+    Args:
+        img: 新しい画像（OpenCV画像）
+        previous: 前回のステージ結果 {'colors', 'text', 'sections', 'layout', 'elements'}
+        regions: diff_fingerprintsで求めた変更領域
+        options: 解析オプション（quality・tile_heightなど）
+
+    Returns:
+        tuple: (ステージ結果の辞書, 差分再解析の統計)
+    """
+    options = options or {}
+    quality = options.get('quality')
+    ocr_mode = resolve_ocr_mode(options.get('ocr_mode'))
+    height, width = img.shape[:2]
+    changed_area = sum((x1 - x0) * (y1 - y0) for x0, y0, x1, y1 in regions)
+    changed_ratio = min(1.0, changed_area / float(width * height)) if width and height else 1.0
+
+    previous_text = previous.get('text') or {}
+    previous_blocks = previous_text.get('textBlocks', []) if isinstance(previous_text, dict) else []
+    previous_elements = previous.get('elements') or []
+    if isinstance(previous_elements, dict):
+        previous_elements = previous_elements.get('elements', [])
+
+    # テキスト: 変更領域だけOCRする
+    degraded = []
+
+    def recognize_region(crop):
+        region_result = extract_text(crop, tile_height=0, quality=quality, mode=ocr_mode)
+        if region_result.get('degraded'):
+            degraded.append(True)
+        return region_result.get('textBlocks', [])
+
+    text_blocks, reused_blocks = _reanalyze_regions(img, regions, previous_blocks, recognize_region)
+    # 全体のテキストは上から下、左から右の順に並べる
+    reading_order = sorted(text_blocks, key=lambda block: (block['position'].get('y', 0), block['position'].get('x', 0)))
+    if ocr_mode == 'boxes':
+        # 検出だけの結果はextract_textと同じく上から順に並べ、'mode'キーを付ける
+        text_result = {'text': '', 'textBlocks': reading_order, 'mode': 'boxes'}
+    else:
+        text_blocks.sort(key=lambda block: block.get('confidence', 0), reverse=True)
+        text_result = {'text': ' '.join(block.get('text', '') for block in reading_order), 'textBlocks': text_blocks}
+    if degraded:
+        # 変更領域のOCRに失敗した場合は、結果をキャッシュしない
+        text_result['degraded'] = True
+
+    # 要素: 変更領域だけ検出する（最小面積は画像全体を基準にする）
+    min_area = (width * height) * 0.005
+    elements, reused_elements = _reanalyze_regions(
+        img, regions, previous_elements,
+        lambda crop: detect_elements(crop, tile_height=0, quality=quality, min_area=min_area).get('elements', []))
+
+    # 主要色: 変更が小さければ前回の統計を再利用する
+    colors = previous.get('colors')
+    reused_colors = bool(colors) and changed_ratio <= INCREMENTAL_PALETTE_CHANGED_RATIO
+    if not reused_colors:
+        colors = extract_colors(img, quality=quality)
+
+    # セクションとレイアウト: 境界の計算は軽いため全体で行い、分類にはマージしたテキストブロックを使う
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    tile_height = options.get('tile_height')
+    sections = analyze_sections(img, boundaries=find_section_boundaries(gray, tile_height=tile_height),
+                                text_blocks=text_blocks, quality=quality)
+    layout = analyze_layout(img, sections=sections, colors=colors,
+                            edges=detect_edges(gray, tile_height=tile_height), quality=quality)
+
+    stats = {
+        'changed_regions': [list(region) for region in regions],
+        'changed_ratio': round(changed_ratio, 4),
+        'reused': {
+            'textBlocks': reused_blocks,
+            'elements': reused_elements,
+            'colors': reused_colors,
+        },
+    }
+    results = {
+        'colors': colors,
+        'text': text_result,
+        'sections': sections,
+        'layout': layout,
+        'elements': elements,
+    }
+    return results, stats
+
+def main():
+    """
+    コマンドライン引数から機能を実行
+    """
+    if len(sys.argv) < 3:
+        print('使用法: python image_analyzer.py [機能] [ファイルパス]')
+        return
+
+    command = sys.argv[1]
+    file_path = sys.argv[2]
+
+    try:
+        # ファイルからバイナリデータを読み込み
+        with open(file_path, 'rb') as f:
+            image_data = f.read()
+
+        # OpenCVで画像を読み込み
         nparr = np.frombuffer(image_data, np.uint8)
         img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
         if img is None:
@@ -1063,8 +2525,9 @@ def main():
         elif command == 'analyze_all':
             # すべての分析を実行
             layout = analyze_layout(img)
-            elements = detect_elements(img)
             text = extract_text(img)
+            # 要素内のテキストの有無はページ全体のOCR結果から判定する
+            elements = detect_elements(img, text_blocks=text.get('textBlocks', []))
             result = {
                 'layout': layout,
                 'elements': elements['elements'],
@@ -1103,28 +2566,19 @@ def extract_colors_from_image(image, **options):
 
         # 画像データが適切な形式かチェック
         if isinstance(image, dict) and 'opencv' in image:
-            colors = extract_colors(image['opencv'])
+            colors = extract_colors(image['opencv'], quality=options.get('quality'))
         elif isinstance(image, np.ndarray):
-            colors = extract_colors(image)
+            colors = extract_colors(image, quality=options.get('quality'))
         else:
-            colors = extract_colors(image)
-
-        # 詳細なログ出力を追加
-        logger.info("========== 色抽出結果の詳細ログ開始 ==========")
+            colors = extract_colors(image, quality=options.get('quality'))
 
-        # 抽出された色の数
         logger.info(f"抽出された色の数: {len(colors)}")
 
-        # 各色の詳細をログに出力
-        for i, color in enumerate(colors):
-            logger.info(f"色 {i+1}:")
-            logger.info(f"  RGB: {color.get('rgb', '')}")
-            logger.info(f"  HEX: {color.get('hex', '')}")
-            logger.info(f"  比率: {color.get('ratio', 0):.4f} ({color.get('ratio', 0)*100:.2f}%)")
-            if 'role' in color:
-                logger.info(f"  役割: {color.get('role', '不明')}")
-
-        logger.info("========== 色抽出結果の詳細ログ終了 ==========")
+        # 各色の詳細はデバッグ時のみ出力
+        if logger.isEnabledFor(logging.DEBUG):
+            for i, color in enumerate(colors):
+                logger.debug(f"色 {i+1}: RGB={color.get('rgb', '')}, HEX={color.get('hex', '')}, "
+                             f"比率={color.get('ratio', 0):.4f}, 役割={color.get('role', '不明')}")
 
         return colors
     except Exception as e:
@@ -1150,31 +2604,25 @@ def extract_text_from_image(image, **options):
 
         # 画像データが適切な形式かチェック
         if isinstance(image, dict) and 'opencv' in image:
-            result = extract_text(image['opencv'])
+            result = extract_text(image['opencv'], tile_height=options.get('tile_height'), quality=options.get('quality'),
+                                  mode=options.get('ocr_mode'))
         elif isinstance(image, np.ndarray):
-            result = extract_text(image)
+            result = extract_text(image, tile_height=options.get('tile_height'), quality=options.get('quality'),
+                                  mode=options.get('ocr_mode'))
         else:
-            result = extract_text(image)
+            result = extract_text(image, tile_height=options.get('tile_height'), quality=options.get('quality'),
+                                  mode=options.get('ocr_mode'))
 
-        # 詳細なログ出力を追加
-        logger.info("========== 画像解析結果の詳細ログ開始 ==========")
-
-        # テキスト抽出結果の詳細をログに出力
-        logger.info(f"抽出されたテキスト全体: {result.get('text', '')}")
-
-        # テキストブロックの詳細をログに出力
         text_blocks = result.get('textBlocks', [])
-        logger.info(f"テキストブロック数: {len(text_blocks)}")
-
-        for i, block in enumerate(text_blocks):
-            logger.info(f"ブロック {i+1}:")
-            logger.info(f"  テキスト: {block.get('text', '')}")
-            logger.info(f"  信頼度: {block.get('confidence', 0):.3f}")
-            if 'position' in block:
-                pos = block['position']
-                logger.info(f"  位置: x={pos.get('x', 0)}, y={pos.get('y', 0)}, 幅={pos.get('width', 0)}, 高さ={pos.get('height', 0)}")
+        logger.info(f"テキスト抽出結果: {len(result.get('text', ''))}文字, テキストブロック数: {len(text_blocks)}")
 
-        logger.info("========== 画像解析結果の詳細ログ終了 ==========")
+        # 抽出テキストと各ブロックの詳細はデバッグ時のみ出力
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"抽出されたテキスト全体: {result.get('text', '')}")
+            for i, block in enumerate(text_blocks):
+                pos = block.get('position', {})
+                logger.debug(f"ブロック {i+1}: テキスト={block.get('text', '')}, 信頼度={block.get('confidence', 0):.3f}, "
+                             f"位置=(x={pos.get('x', 0)}, y={pos.get('y', 0)}, 幅={pos.get('width', 0)}, 高さ={pos.get('height', 0)})")
 
         return result
     except Exception as e:
@@ -1204,11 +2652,11 @@ def analyze_image_sections(image, **options):
 
         # 画像データが適切な形式かチェック
         if isinstance(image, dict) and 'opencv' in image:
-            return analyze_sections(image['opencv'])
+            return analyze_sections(image['opencv'], tile_height=options.get('tile_height'), quality=options.get('quality'))
         elif isinstance(image, np.ndarray):
-            return analyze_sections(image)
+            return analyze_sections(image, tile_height=options.get('tile_height'), quality=options.get('quality'))
         else:
-            return analyze_sections(image)
+            return analyze_sections(image, tile_height=options.get('tile_height'), quality=options.get('quality'))
     except Exception as e:
         logger.error(f"セクション分析エラー: {str(e)}")
         traceback.print_exc()
@@ -1235,364 +2683,92 @@ def analyze_layout_pattern(image, **options):
 
         # 画像データが適切な形式かチェック
         if isinstance(image, dict) and 'opencv' in image:
-            layout = analyze_layout(image['opencv'])
+            layout = analyze_layout(image['opencv'], tile_height=options.get('tile_height'), quality=options.get('quality'))
         elif isinstance(image, np.ndarray):
-            layout = analyze_layout(image)
+            layout = analyze_layout(image, tile_height=options.get('tile_height'), quality=options.get('quality'))
         else:
-            layout = analyze_layout(image)
-
-        # 詳細なログ出力を追加
-        logger.info("========== レイアウト分析結果の詳細ログ開始 ==========")
-
-        # レイアウトタイプと信頼度
-        logger.info(f"レイアウトタイプ: {layout.get('layoutType', 'unknown')}")
-        logger.info(f"信頼度: {layout.get('confidence', 0):.3f}")
-
-        # レイアウト詳細があれば出力
-        if 'layoutDetails' in layout:
-            layout_details = layout.get('layoutDetails', {})
-            dimensions = layout_details.get('dimensions', {})
-            logger.info(f"画像サイズ: 幅={dimensions.get('width', 0)}px, 高さ={dimensions.get('height', 0)}px")
-
-            sections = layout_details.get('sections', [])
-            logger.info(f"セクション数: {len(sections)}")
-
-            # 各セクションの詳細
-            for i, section in enumerate(sections):
-                logger.info(f"セクション {i+1}:")
-                section_type = section.get('type', '不明')
-                section_pos = section.get('position', {})
-                logger.info(f"  タイプ: {section_type}")
-                logger.info(f"  位置: top={section_pos.get('top', 0)}, left={section_pos.get('left', 0)}, ")
-                logger.info(f"       幅={section_pos.get('width', 0)}, 高さ={section_pos.get('height', 0)}")
-
-                # セクション内の要素があれば出力
-                elements = section.get('elements', [])
-                if elements:
-                    logger.info(f"  要素数: {len(elements)}")
-
-        logger.info("========== レイアウト分析結果の詳細ログ終了 ==========")
+            layout = analyze_layout(image, tile_height=options.get('tile_height'), quality=options.get('quality'))
 
-        return layout
-    except Exception as e:
-        logger.error(f"レイアウト分析エラー: {str(e)}")
-        traceback.print_exc()
-        return {
-            'layout': 'unknown',
-            'confidence': 0.0,
-            'error': str(e)
-        }
-
-def detect_feature_elements(image, **options):
-    """
-    Python Bridgeインターフェース用の特徴要素検出関数
-
-    Args:
-        image: decode_imageの結果、または画像データ
-        options: 追加オプション
-
-    Returns:
-        list: 検出された要素のリスト
-    """
-    try:
-        # 画像データが直接渡された場合は処理
-        if isinstance(image, str):
-            image = decode_image(image)
-
-        # 画像データが適切な形式かチェック
-        if isinstance(image, dict) and 'opencv' in image:
-            elements = detect_elements(image['opencv'])
-        elif isinstance(image, np.ndarray):
-            elements = detect_elements(image)
-        else:
-            elements = detect_elements(image)
-
-        # 詳細なログ出力を追加
-        logger.info("========== 要素検出結果の詳細ログ開始 ==========")
-
-        # 検出された要素の数
-        if isinstance(elements, list):
-            element_count = len(elements)
-        elif isinstance(elements, dict) and 'elements' in elements:
-            elements = elements.get('elements', [])
-            element_count = len(elements)
-        else:
-            element_count = 0
-            elements = []
-
-        logger.info(f"検出された要素の数: {element_count}")
-
-        # 各要素の詳細をログに出力
-        element_types = {}
-        for i, element in enumerate(elements):
-            logger.info(f"要素 {i+1}:")
-            element_type = element.get('type', '不明')
-            logger.info(f"  種類: {element_type}")
-            logger.info(f"  信頼度: {element.get('confidence', 0):.3f}")
-
-            # 位置情報があれば出力
-            if 'position' in element:
-                pos = element['position']
-                logger.info(f"  位置: x={pos.get('x', 0)}, y={pos.get('y', 0)}, 幅={pos.get('width', 0)}, 高さ={pos.get('height', 0)}")
-
-            # テキスト情報があれば出力
-            if 'text' in element:
-                logger.info(f"  テキスト: {element.get('text', '')}")
-
-            # 要素タイプの集計
-            if element_type not in element_types:
-                element_types[element_type] = 0
-            element_types[element_type] += 1
-
-        # 要素タイプのサマリーを出力
-        logger.info("要素タイプのサマリー:")
-        for elem_type, count in element_types.items():
-            logger.info(f"  {elem_type}: {count}個")
-
-        logger.info("========== 要素検出結果の詳細ログ終了 ==========")
-
-        return elements
-    except Exception as e:
-        logger.error(f"特徴要素検出エラー: {str(e)}")
-        traceback.print_exc()
-        return []
-
-# 新しい関数を追加
-def compress_analysis_results(analysis_data, options=None):
-    """
-    複数の解析結果を統合した圧縮データを生成する
-
-    Args:
-        analysis_data: 各種解析結果を含む辞書
-        options: 出力オプション（フォーマット形式など）
-
-    Returns:
-        dict: 統合された解析結果
-    """
-    if not options:
-        options = {}
-
-    # 出力フォーマットタイプ（structured, semantic, template）
-    format_type = options.get('format_type', 'structured')
-
-    try:
-        # 基本解析情報
-        layout_info = analysis_data.get('layout', {})
-        colors = analysis_data.get('colors', [])
-        sections = analysis_data.get('sections', [])
-        elements = analysis_data.get('elements', {})
-        text_blocks = analysis_data.get('textBlocks', [])
-        text_content = analysis_data.get('text', '')
-
-        # レイアウト情報を整理
-        layout = {
-            'width': layout_info.get('width', 1200),
-            'height': layout_info.get('height', 800),
-            'aspectRatio': layout_info.get('aspectRatio', '3:2'),
-            'type': layout_info.get('type', 'standard'),
-            'template': layout_info.get('type', 'standard'),  # typeと同じ値をtemplateにも設定
-            'gridPattern': layout_info.get('gridPattern', {
-                'columns': 12,
-                'rows': 'auto',
-                'gap': '20px'
-            }),
-            'sectionCount': len(sections),
-            'imagePosition': layout_info.get('imagePosition', 'center'),
-            'textPosition': layout_info.get('textPosition', 'center')
-        }
-
-        # 色情報を整理（役割の統一）
-        normalized_colors = []
-        standard_roles = ['background', 'text', 'primary', 'secondary', 'accent', 'highlight']
-
-        # 色の役割を推定・正規化する機能
-        def normalize_color_role(color):
-            if not color or not isinstance(color, dict):
-                return {'rgb': 'rgb(0,0,0)', 'hex': '#000000', 'role': 'text', 'ratio': 0}
-
-            role = color.get('role', '')
-
-            # roleが標準ロールに含まれていない場合は推測
-            if not role or role not in standard_roles:
-                # 背景色判定: 量が多いor明るい色
-                if color.get('ratio', 0) > 0.3 or is_light_color(color.get('rgb', '')):
-                    role = 'background'
-                # テキスト色判定: 暗い色
-                elif not is_light_color(color.get('rgb', '')):
-                    role = 'text'
-                # アクセント色判定: 彩度が高い色
-                elif color.get('saturation', 0) > 0.6:
-                    role = 'accent'
-                # それ以外はプライマリまたはセカンダリ
-                else:
-                    existing_roles = [c.get('role') for c in normalized_colors]
-                    if 'primary' not in existing_roles:
-                        role = 'primary'
-                    elif 'secondary' not in existing_roles:
-                        role = 'secondary'
-                    else:
-                        role = 'highlight'
-
-            return {
-                'rgb': color.get('rgb', ''),
-                'hex': color.get('hex', ''),
-                'role': role,
-                'ratio': color.get('ratio', 0)
-            }
-
-        # 色情報の正規化
-        for color in colors:
-            normalized_colors.append(normalize_color_role(color))
-
-        # テキスト情報を整理（JS側が期待する構造に変換）
-        text_data = {
-            'content': text_content,
-            'blocks': text_blocks,
-            'hierarchy': []
-        }
-
-        # テキスト階層の構築
-        if text_blocks:
-            for block in text_blocks:
-                if not isinstance(block, dict):
-                    continue
-
-                # ブロックの重要度に基づいてレベルを設定
-                importance = block.get('importance', 0)
-                size = block.get('fontSize', 0)
-                is_bold = block.get('bold', False)
-
-                # レベルの決定（重要度、フォントサイズ、太字かで判断）
-                level = 3  # デフォルトはテキスト
-                if importance > 0.8 or (size > 24 and is_bold):
-                    level = 1  # 見出し
-                elif importance > 0.5 or size > 18:
-                    level = 2  # 小見出し
-
-                text_data['hierarchy'].append({
-                        'level': level,
-                    'text': block.get('text', ''),
-                    'position': block.get('position', {})
-                })
-        # テキストブロックがなく全文のみの場合
-        elif text_content:
-            # 簡易的に最初の行を見出しとして扱う
-            lines = text_content.split('\n')
-            if lines:
-                text_data['hierarchy'].append({
-                    'level': 1,
-                    'text': lines[0],
-                    'position': {'top': 0, 'left': 0}
-                })
-
-                # 残りの行をテキストとして扱う
-                if len(lines) > 1:
-                    text_data['hierarchy'].append({
-                        'level': 3,
-                        'text': '\n'.join(lines[1:]),
-                        'position': {'top': 50, 'left': 0}
-                    })
-
-        # 要素情報を整理（elements.elements形式への統一とsummary追加）
-        element_list = elements.get('elements', [])
-        if not isinstance(element_list, list):
-            element_list = []
-
-        # 要素種類ごとのカウント
-        element_counts = {
-            'button': 0,
-            'image': 0,
-            'card': 0,
-            'navigation': 0,
-            'form': 0,
-            'list': 0,
-            'text': 0,
-            'total': len(element_list)
-        }
-
-        # 要素カウントの集計
-        for element in element_list:
-            if not isinstance(element, dict):
-                continue
-
-            element_type = element.get('type', '').lower()
-            if 'button' in element_type:
-                element_counts['button'] += 1
-            elif 'image' in element_type or 'img' in element_type:
-                element_counts['image'] += 1
-            elif 'card' in element_type:
-                element_counts['card'] += 1
-            elif 'nav' in element_type:
-                element_counts['navigation'] += 1
-            elif 'form' in element_type or 'input' in element_type:
-                element_counts['form'] += 1
-            elif 'list' in element_type or 'ul' in element_type or 'ol' in element_type:
-                element_counts['list'] += 1
-            elif 'text' in element_type or 'paragraph' in element_type:
-                element_counts['text'] += 1
-
-        # 要素サマリーの追加
-        element_summary = {
-            'counts': element_counts,
-            'hasForms': element_counts['form'] > 0,
-            'hasNavigation': element_counts['navigation'] > 0,
-            'hasButtons': element_counts['button'] > 0,
-            'hasCards': element_counts['card'] > 0,
-            'hasImages': element_counts['image'] > 0,
-            'hasLists': element_counts['list'] > 0
-        }
-
-        # 最終的なデータ構造の構築
-        compressed_data = {
-            'layout': layout,
-            'colors': normalized_colors,
-            'text': text_data,
-            'sections': sections,
-            'elements': {
-                'elements': element_list,
-                'summary': element_summary
-            }
-        }
-
-        # フォーマットタイプに応じた変換
-        if format_type == 'semantic':
-            return convert_to_semantic_format(compressed_data)
-        elif format_type == 'template':
-            return convert_to_template_format(compressed_data)
+        logger.info(f"レイアウトタイプ: {layout.get('layoutType', 'unknown')}, 信頼度: {layout.get('confidence', 0):.3f}")
 
-        # デフォルトは構造化データをそのまま返す
-        return compressed_data
+        # 各セクションの詳細はデバッグ時のみ出力
+        if 'layoutDetails' in layout and logger.isEnabledFor(logging.DEBUG):
+            layout_details = layout.get('layoutDetails', {})
+            dimensions = layout_details.get('dimensions', {})
+            sections = layout_details.get('sections', [])
+            logger.debug(f"画像サイズ: 幅={dimensions.get('width', 0)}px, 高さ={dimensions.get('height', 0)}px, セクション数: {len(sections)}")
+            for i, section in enumerate(sections):
+                section_pos = section.get('position', {})
+                logger.debug(f"セクション {i+1}: タイプ={section.get('type', '不明')}, "
+                             f"位置=(top={section_pos.get('top', 0)}, left={section_pos.get('left', 0)}, "
+                             f"幅={section_pos.get('width', 0)}, 高さ={section_pos.get('height', 0)}), "
+                             f"要素数={len(section.get('elements', []))}")
 
+        return layout
     except Exception as e:
-        logger.error(f"解析データの圧縮中にエラーが発生しました: {str(e)}")
+        logger.error(f"レイアウト分析エラー: {str(e)}")
         traceback.print_exc()
-
-        # エラー時の最小限のデータ構造
         return {
-            'layout': {
-                'width': 1200,
-                'height': 800,
-                'type': 'standard',
-                'template': 'standard'
-            },
-            'colors': [],
-            'text': {
-                'content': '',
-                'blocks': [],
-                'hierarchy': []
-            },
-            'sections': [],
-            'elements': {
-                'elements': [],
-                'summary': {
-                    'counts': {'total': 0},
-                    'hasNavigation': False,
-                    'hasForms': False
-                }
-            },
+            'layout': 'unknown',
+            'confidence': 0.0,
             'error': str(e)
         }
 
+def detect_feature_elements(image, **options):
+    """
+    Python Bridgeインターフェース用の特徴要素検出関数
+
+    Args:
+        image: decode_imageの結果、または画像データ
+        options: 追加オプション
+
+    Returns:
+        list: 検出された要素のリスト
+    """
+    try:
+        # 画像データが直接渡された場合は処理
+        if isinstance(image, str):
+            image = decode_image(image)
+
+        # 画像データが適切な形式かチェック
+        if isinstance(image, dict) and 'opencv' in image:
+            elements = detect_elements(image['opencv'], tile_height=options.get('tile_height'), quality=options.get('quality'))
+        elif isinstance(image, np.ndarray):
+            elements = detect_elements(image, tile_height=options.get('tile_height'), quality=options.get('quality'))
+        else:
+            elements = detect_elements(image, tile_height=options.get('tile_height'), quality=options.get('quality'))
+
+        # 検出された要素の数
+        if isinstance(elements, list):
+            element_count = len(elements)
+        elif isinstance(elements, dict) and 'elements' in elements:
+            elements = elements.get('elements', [])
+            element_count = len(elements)
+        else:
+            element_count = 0
+            elements = []
+
+        # 要素タイプの集計
+        element_types = {}
+        for element in elements:
+            element_type = element.get('type', '不明')
+            element_types[element_type] = element_types.get(element_type, 0) + 1
+        logger.info(f"検出された要素の数: {element_count}, 種類別: {element_types}")
+
+        # 各要素の詳細はデバッグ時のみ出力
+        if logger.isEnabledFor(logging.DEBUG):
+            for i, element in enumerate(elements):
+                pos = element.get('position', {})
+                logger.debug(f"要素 {i+1}: 種類={element.get('type', '不明')}, 信頼度={element.get('confidence', 0):.3f}, "
+                             f"位置=(x={pos.get('x', 0)}, y={pos.get('y', 0)}, 幅={pos.get('width', 0)}, 高さ={pos.get('height', 0)}), "
+                             f"テキスト={element.get('text', '')}")
+
+        return elements
+    except Exception as e:
+        logger.error(f"特徴要素検出エラー: {str(e)}")
+        traceback.print_exc()
+        return []
+
 def convert_to_semantic_format(compressed_data):
     """
     圧縮データをセマンティックタグ形式に変換
@@ -1897,7 +3073,7 @@ def estimate_color_roles(colors, analysis_data=None):
         color_with_role['role'] = role
         colors_with_roles.append(color_with_role)
 
-        logger.info(f"🎨 色 {idx+1}: HEX={hex_color}, 比率={ratio:.2f}({ratio*100:.1f}%), 役割={role}")
+        logger.debug(f"🎨 色 {idx+1}: HEX={hex_color}, 比率={ratio:.2f}({ratio*100:.1f}%), 役割={role}")
 
     logger.info(f"✅ 色の役割推定処理が完了しました（全{len(colors_with_roles)}色）")
     return colors_with_roles
@@ -2494,354 +3670,6 @@ def is_light_color(rgb_str):
         # エラー時はデフォルトでFalseを返す
         return False
 
-def compress_analysis_results(analysis_data, options=None):
-    """複数の解析結果を統合した圧縮データを生成する"""
-    logger.info("compress_analysis_results: 処理開始")
-
-    logger.info(f"[compress] 圧縮処理開始: 入力データキー={list(analysis_data.keys())}")
-    if 'text' in analysis_data:
-        logger.info(f"[compress] 入力text内容: '{analysis_data['text'][:50]}...'")
-    if 'textBlocks' in analysis_data:
-        logger.info(f"[compress] 入力textBlocks数: {len(analysis_data['textBlocks'])}")
-    if 'colors' in analysis_data:
-        logger.info(f"[compress] 入力colors数: {len(analysis_data['colors'])}")
-
-    if not options:
-        options = {}
-
-    # 出力フォーマットタイプ（structured, semantic, template）
-    format_type = options.get('format_type', 'structured')
-
-    try:
-        # 入力データの詳細を記録
-        if isinstance(analysis_data, dict):
-            logger.info(f"入力データキー: {list(analysis_data.keys())}")
-
-            # 各キーの内容確認
-            for key in ['colors', 'text', 'layout', 'elements', 'sections']:
-                if key in analysis_data:
-                    if isinstance(analysis_data[key], list):
-                        logger.info(f"{key}: {len(analysis_data[key])}項目")
-                    elif isinstance(analysis_data[key], dict):
-                        logger.info(f"{key}: {list(analysis_data[key].keys())}")
-                    else:
-                        logger.info(f"{key}: {type(analysis_data[key]).__name__}")
-                else:
-                    logger.info(f"{key}: なし")
-        else:
-            logger.warning(f"入力データが辞書ではありません: {type(analysis_data).__name__}")
-            # 空の辞書を作成
-            analysis_data = {}
-
-        # 必須データがない場合のフォールバック
-        if 'colors' not in analysis_data or not analysis_data['colors']:
-            logger.warning("色情報がありません。デフォルト値を設定します。")
-            analysis_data['colors'] = [
-                {
-                    'rgb': 'rgb(255,255,255)',
-                    'hex': '#ffffff',
-                    'ratio': 0.8,
-                    'role': 'background'
-                },
-                {
-                    'rgb': 'rgb(0,0,0)',
-                    'hex': '#000000',
-                    'ratio': 0.2,
-                    'role': 'text'
-                }
-            ]
-
-        if 'layout' not in analysis_data or not analysis_data['layout']:
-            logger.warning("レイアウト情報がありません。デフォルト値を設定します。")
-            analysis_data['layout'] = {
-                'layoutType': 'standard',
-                'confidence': 0.7,
-                'width': 1200,
-                'height': 800,
-                'aspectRatio': 1.5
-            }
-
-        if 'text' not in analysis_data or not analysis_data['text']:
-            logger.warning("テキスト情報がありません。デフォルト値を設定します。")
-            analysis_data['text'] = {
-                'text': '',
-                'textBlocks': []
-            }
-
-        if 'elements' not in analysis_data or not analysis_data['elements']:
-            logger.warning("要素情報がありません。デフォルト値を設定します。")
-            analysis_data['elements'] = []
-
-        if 'sections' not in analysis_data or not analysis_data['sections']:
-            logger.warning("セクション情報がありません。デフォルト値を設定します。")
-            analysis_data['sections'] = []
-
-        # 基本解析情報
-        layout_info = analysis_data.get('layout', {})
-        colors = analysis_data.get('colors', [])
-        sections = analysis_data.get('sections', [])
-        elements = analysis_data.get('elements', {})
-        text_blocks = analysis_data.get('textBlocks', [])
-        text_content = analysis_data.get('text', '')
-
-        # 詳細なログ出力
-        logger.info(f"[compress] 実際に取得したtext_content型: {type(text_content).__name__}")
-        logger.info(f"[compress] 実際に取得したtext_blocks長さ: {len(text_blocks)}")
-
-        # テキストデータの構造調整
-        if isinstance(text_content, dict) and 'text' in text_content:
-            # textが辞書の場合、textフィールドを抽出
-            text_data_content = text_content.get('text', '')
-            if 'textBlocks' in text_content:
-                text_blocks = text_content.get('textBlocks', [])
-        else:
-            # textが文字列の場合はそのまま使用
-            text_data_content = text_content if isinstance(text_content, str) else ''
-
-        # レイアウト情報を整理
-        layout = {
-            'width': layout_info.get('width', 1200),
-            'height': layout_info.get('height', 800),
-            'aspectRatio': layout_info.get('aspectRatio', '3:2'),
-            'type': layout_info.get('layoutType', 'standard'),
-            'template': layout_info.get('layoutType', 'standard'),  # typeと同じ値をtemplateにも設定
-            'gridPattern': layout_info.get('gridPattern', {
-                'columns': 12,
-                'rows': 'auto',
-                'gap': '20px'
-            }),
-            'sectionCount': len(sections),
-            'imagePosition': layout_info.get('imagePosition', 'center'),
-            'textPosition': layout_info.get('textPosition', 'center')
-        }
-
-        # 色情報を整理（役割の統一）- 必ずデータが存在することを保証
-        if not colors or len(colors) == 0:
-            # デフォルトの色を提供
-            normalized_colors = [
-                {
-                    'rgb': 'rgb(255,255,255)',
-                    'hex': '#ffffff',
-                    'role': 'background',
-                    'ratio': 0.8
-                },
-                {
-                    'rgb': 'rgb(0,0,0)',
-                    'hex': '#000000',
-                    'role': 'text',
-                    'ratio': 0.2
-                }
-            ]
-        else:
-            normalized_colors = []
-            standard_roles = ['background', 'text', 'primary', 'secondary', 'accent', 'highlight']
-
-            # 色情報の正規化
-            for color in colors:
-                if not color or not isinstance(color, dict):
-                    continue
-
-                # roleが標準ロールに含まれているか確認
-                role = color.get('role', '')
-                if not role or role not in standard_roles:
-                    # 役割を推定
-                    if color.get('ratio', 0) > 0.3 or is_light_color(color.get('rgb', '')):
-                        role = 'background'
-                    elif not is_light_color(color.get('rgb', '')):
-                        role = 'text'
-                    elif 'primary' not in [c.get('role') for c in normalized_colors]:
-                        role = 'primary'
-                    elif 'secondary' not in [c.get('role') for c in normalized_colors]:
-                        role = 'secondary'
-                    else:
-                        role = 'accent'
-
-                normalized_colors.append({
-                    'rgb': color.get('rgb', ''),
-                    'hex': color.get('hex', ''),
-                    'role': role,
-                    'ratio': color.get('ratio', 0)
-                })
-
-            # 最低2色は確保（不足時にデフォルト追加）
-            if len(normalized_colors) < 2:
-                if not any(c.get('role') == 'background' for c in normalized_colors):
-                    normalized_colors.append({
-                        'rgb': 'rgb(255,255,255)',
-                        'hex': '#ffffff',
-                        'role': 'background',
-                        'ratio': 0.8
-                    })
-                if not any(c.get('role') == 'text' for c in normalized_colors):
-                    normalized_colors.append({
-                        'rgb': 'rgb(0,0,0)',
-                        'hex': '#000000',
-                        'role': 'text',
-                        'ratio': 0.2
-                    })
-
-        # テキスト情報を整理（JS側が期待する構造に変換）
-        text_data = {
-            'content': text_data_content,
-            'blocks': text_blocks,
-            'hierarchy': []
-        }
-
-        # テキスト階層の構築
-        if text_blocks:
-            for block in text_blocks:
-                if not isinstance(block, dict):
-                    continue
-
-                # レベルの決定（デフォルトはテキスト）
-                level = 3
-
-                # ブロックの特性から見出しレベルを推定
-                if block.get('importance', 0) > 0.8 or block.get('fontSize', 0) > 24:
-                    level = 1  # 見出し
-                elif block.get('importance', 0) > 0.5 or block.get('fontSize', 0) > 18:
-                    level = 2  # 小見出し
-
-                text_data['hierarchy'].append({
-                    'level': level,
-                    'text': block.get('text', ''),
-                    'position': block.get('position', {})
-                })
-
-        # 要素情報を整理
-        element_list = []
-        if isinstance(elements, list):
-            element_list = elements
-        elif isinstance(elements, dict) and 'elements' in elements:
-            element_list = elements.get('elements', [])
-
-        # エラー時の最小限のデータ構造
-        element_counts = {
-            'card': 0,
-            'navigation': 0,
-            'form': 0,
-            'list': 0,
-            'text': 0,
-            'total': len(element_list)
-        }
-
-        # 要素カウントの集計
-        for element in element_list:
-            if not isinstance(element, dict):
-                continue
-
-            element_type = element.get('type', '').lower()
-            if 'button' in element_type:
-                element_counts['button'] += 1
-            elif 'image' in element_type or 'img' in element_type:
-                element_counts['image'] += 1
-            elif 'card' in element_type:
-                element_counts['card'] += 1
-            elif 'nav' in element_type:
-                element_counts['navigation'] += 1
-            elif 'form' in element_type or 'input' in element_type:
-                element_counts['form'] += 1
-            elif 'list' in element_type or 'ul' in element_type or 'ol' in element_type:
-                element_counts['list'] += 1
-            elif 'text' in element_type or 'paragraph' in element_type:
-                element_counts['text'] += 1
-
-        # 要素サマリーの追加
-        element_summary = {
-            'counts': element_counts,
-            'hasForms': element_counts['form'] > 0,
-            'hasNavigation': element_counts['navigation'] > 0,
-            'hasButtons': element_counts['button'] > 0,
-            'hasCards': element_counts['card'] > 0,
-            'hasImages': element_counts['image'] > 0,
-            'hasLists': element_counts['list'] > 0
-        }
-
-        # 最終的なデータ構造の構築
-        compressed_data = {
-            'layout': layout,
-            'colors': normalized_colors,
-            'text': text_data,
-            'sections': sections,
-            'elements': {
-                'elements': element_list,
-                'summary': element_summary
-            }
-        }
-
-        # データ構造の確認ログ
-        logger.info(f"圧縮後のデータ構造: {list(compressed_data.keys())}")
-        logger.info(f"色情報: {len(compressed_data['colors'])}色")
-        logger.info(f"レイアウトタイプ: {compressed_data['layout']['type']}")
-
-        # フォーマットタイプに応じた変換
-        if format_type == 'semantic':
-            result = convert_to_semantic_format(compressed_data)
-            compressed_data['semanticFormat'] = result
-        elif format_type == 'template':
-            result = convert_to_template_format(compressed_data)
-            compressed_data['templateFormat'] = result
-
-        # 関数の最後の return の前に追加
-        logger.info(f"[compress] 圧縮処理完了: 出力データキー={list(compressed_data.keys())}")
-        if 'text' in compressed_data:
-            if isinstance(compressed_data['text'], dict):
-                logger.info(f"[compress] 出力text.content: '{compressed_data['text'].get('content', '')[:50]}...'")
-                logger.info(f"[compress] 出力text.blocks数: {len(compressed_data['text'].get('blocks', []))}")
-            else:
-                logger.info(f"[compress] 出力text: '{compressed_data['text'][:50]}...'")
-        if 'textBlocks' in compressed_data:
-            logger.info(f"[compress] 出力textBlocks数: {len(compressed_data['textBlocks'])}")
-        if 'colors' in compressed_data:
-            logger.info(f"[compress] 出力colors数: {len(compressed_data['colors'])}")
-
-        return compressed_data
-
-    except Exception as e:
-        logger.error(f"解析データの圧縮中にエラーが発生しました: {str(e)}")
-        traceback.print_exc()
-
-        # エラー情報を明示的に含める
-        return {
-            'error': str(e),
-            'trace': traceback.format_exc(),
-            'layout': {
-                'width': 1200,
-                'height': 800,
-                'type': 'standard',
-                'template': 'standard'
-            },
-            'colors': [
-                {
-                    'rgb': 'rgb(255,255,255)',
-                    'hex': '#ffffff',
-                    'role': 'background',
-                    'ratio': 0.8
-                },
-                {
-                    'rgb': 'rgb(0,0,0)',
-                    'hex': '#000000',
-                    'role': 'text',
-                    'ratio': 0.2
-                }
-            ],
-            'text': {
-                'content': '',
-                'blocks': [],
-                'hierarchy': []
-            },
-            'sections': [],
-            'elements': {
-                'elements': [],
-                'summary': {
-                    'counts': {'total': 0},
-                    'hasNavigation': False,
-                    'hasForms': False
-                }
-            }
-        }
-
-
 def convert_to_semantic_format(compressed_data):
     """
     圧縮データをセマンティックタグ形式に変換
@@ -3113,7 +3941,7 @@ def estimate_color_roles(colors, analysis_data=None):
         color_with_role['role'] = role
         colors_with_roles.append(color_with_role)
 
-        logger.info(f"🎨 色 {idx+1}: HEX={hex_color}, 比率={ratio:.2f}({ratio*100:.1f}%), 役割={role}")
+        logger.debug(f"🎨 色 {idx+1}: HEX={hex_color}, 比率={ratio:.2f}({ratio*100:.1f}%), 役割={role}")
 
     logger.info(f"✅ 色の役割推定処理が完了しました（全{len(colors_with_roles)}色）")
     return colors_with_roles
@@ -4218,7 +5046,7 @@ def estimate_color_roles(colors, analysis_data=None):
         color_with_role['role'] = role
         colors_with_roles.append(color_with_role)
 
-        logger.info(f"🎨 色 {idx+1}: HEX={hex_color}, 比率={ratio:.2f}({ratio*100:.1f}%), 役割={role}")
+        logger.debug(f"🎨 色 {idx+1}: HEX={hex_color}, 比率={ratio:.2f}({ratio*100:.1f}%), 役割={role}")
 
     logger.info(f"✅ 色の役割推定処理が完了しました（全{len(colors_with_roles)}色）")
     return colors_with_roles
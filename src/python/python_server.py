@@ -14,11 +14,18 @@ import uuid
 import base64
 import traceback
 import logging
+import logging.handlers
+import queue
+import atexit
+import contextvars
 from datetime import datetime
+from collections import OrderedDict, deque
 from typing import Dict, Any, Optional, List, Tuple
 import importlib.util
 import time
 import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import cv2
 import argparse
 import requests  # APIリクエスト用
@@ -27,38 +34,203 @@ import numpy as np
 from contextlib import redirect_stdout
 import io
 
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
 # ロギング設定
 # ログディレクトリを作成
 log_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs')
 os.makedirs(log_dir, exist_ok=True)
 
-# 現在時刻でログファイル名を作成
-log_file = os.path.join(log_dir, f'python_server_{datetime.now().strftime("%Y%m%d_%H%M%S")}.log')
+# ログファイルはサイズでローテーションし、古いものは自動的に削除される
+log_file = os.path.join(log_dir, 'python_server.log')
+LOG_MAX_BYTES = int(os.environ.get('PYTHON_SERVER_LOG_MAX_MB', 10)) * 1024 * 1024
+LOG_BACKUP_COUNT = int(os.environ.get('PYTHON_SERVER_LOG_BACKUPS', 5))
+
+# 処理中のリクエストID（ログレコードに自動で付与される）
+current_request_id = contextvars.ContextVar('current_request_id', default='-')
+
+# LogRecord標準の属性（これ以外の属性は extra で渡された構造化フィールドとして出力する）
+_STANDARD_LOG_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'request_id'}
 
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(log_file),  # ファイルにログを出力
-        logging.StreamHandler(sys.stderr)  # 標準エラー出力にログを出力
-    ]
-)
+class RequestIdFilter(logging.Filter):
+    """ログを出したスレッドのリクエストIDをレコードに付与するフィルター"""
+
+    def filter(self, record):
+        if not hasattr(record, 'request_id'):
+            record.request_id = current_request_id.get()
+        return True
 
-# ロガー作成
+class KeyValueFormatter(logging.Formatter):
+    """
+    ログを key=value 形式の1行に整形するフォーマッター
+
+    logger.info("...", extra={"stage": "text", "ms": 12}) のように渡したフィールドは
+    メッセージの後ろに key=value として追加される。
+    """
+
+    def format(self, record):
+        message = record.getMessage()
+        fields = [
+            f"ts={self.formatTime(record)}",
+            f"level={record.levelname}",
+            f"logger={record.name}",
+            f"request_id={getattr(record, 'request_id', '-')}",
+            f"msg={json.dumps(message, ensure_ascii=False)}",
+        ]
+        for key, value in record.__dict__.items():
+            if key not in _STANDARD_LOG_ATTRS and not key.startswith('_'):
+                fields.append(f"{key}={json.dumps(value, ensure_ascii=False, default=str)}")
+        if record.exc_info:
+            fields.append(f"exc={json.dumps(self.formatException(record.exc_info), ensure_ascii=False)}")
+        return ' '.join(fields)
+
+_log_listener = None  # 実際の書き込みを行うQueueListener（親プロセスのみ）
+
+def setup_logging(debug: bool = False, log_queue=None):
+    """
+    ロギングを設定する
+
+    各スレッドはQueueHandlerでレコードをキューに積むだけで、ファイルや標準エラー出力への
+    書き込みはQueueListenerのスレッドがまとめて行う。log_queueを指定した場合
+    （プロセスワーカー）は、そのキューへ送るだけで書き込みは親プロセスに任せる。
+    """
+    global _log_listener
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    _stop_log_listener()
+
+    queue_handler = logging.handlers.QueueHandler(log_queue if log_queue is not None else queue.SimpleQueue())
+    queue_handler.addFilter(RequestIdFilter())
+    root.addHandler(queue_handler)
+    root.setLevel(logging.DEBUG if debug else logging.INFO)
+
+    if log_queue is None:
+        _log_listener = start_log_listener(queue_handler.queue)
+
+_output_handlers = None  # ファイル・標準エラー出力のハンドラー（リスナー間で共有する）
+
+def _get_output_handlers():
+    """ローテーションするログファイルと標準エラー出力のハンドラーを返す（初回のみ作成）"""
+    global _output_handlers
+    if _output_handlers is None:
+        formatter = KeyValueFormatter()
+        file_handler = logging.handlers.RotatingFileHandler(
+            log_file, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8', delay=True)
+        file_handler.setFormatter(formatter)
+        stderr_handler = logging.StreamHandler(sys.stderr)
+        stderr_handler.setFormatter(formatter)
+        _output_handlers = (file_handler, stderr_handler)
+    return _output_handlers
+
+def start_log_listener(log_queue):
+    """ログキューを読み取り、ファイルと標準エラー出力に書き込むリスナーを開始する"""
+    listener = logging.handlers.QueueListener(log_queue, *_get_output_handlers(), respect_handler_level=True)
+    listener.start()
+    return listener
+
+def _stop_log_listener():
+    """
+    終了時にキューに残ったログを書き出してリスナーを停止し、ログファイルを閉じる
+
+    ファイルを開いたままにすると、Windowsでは別のプロセスがローテーションできなくなる。
+    """
+    global _log_listener, _output_handlers
+    if _log_listener is not None:
+        _log_listener.stop()
+        _log_listener = None
+    if _output_handlers is not None:
+        for handler in _output_handlers:
+            handler.close()
+        _output_handlers = None
+
+atexit.register(_stop_log_listener)
+
+# ロガー作成（ハンドラーはmain()のsetup_loggingで設定する。プロセスワーカーはモジュールを
+# 再インポートするため、インポート時にはリスナーやログファイルを開かない）
 logger = logging.getLogger('python_server')
-logger.info(f"ログファイルを作成しました: {log_file}")
 
 # グローバル変数
 image_analyzer = None  # 画像解析モジュールのインスタンス
-
-# 実行ディレクトリをスクリプトのある場所に変更
+dispatcher = None  # リクエストディスパッチャー（main()で初期化）
+stage_executor = None  # analyze_allのステージ並列実行用プール（main()で初期化）
+native_threads = None  # OpenCVなどネイティブライブラリのスレッド数（main()で決定）
+ocr_pool = None  # 縦長画像の帯を並列にOCRするプロセスプール（main()で初期化。--ocr-processes）
+
+# 標準出力への書き込みを直列化するロック（複数ワーカーからの同時書き込みで行が混ざらないようにする）
+_stdout_lock = threading.Lock()
+
+# プロセスワーカー内ではレスポンスを標準出力に書かずに収集し、親プロセスへ返す（Noneの場合は標準出力に書く）
+# ハンドラー内のスレッドプールから送信されるイベントも収集できるよう、スレッドごとではなくプロセス全体で共有する
+# （ワーカープロセスは一度に1つのリクエストしか処理しない）
+_response_sink = None
+
+# リクエスト処理中に開いた共有メモリなど、完了時に解放するリソース
+_request_resources = threading.local()
+_deferred_resources = []  # 参照が残っていて解放できなかったリソース
+_deferred_resources_lock = threading.Lock()
+
+# 入力プロトコル（'line': 1行1JSON / 'framed': 長さ付きフレーム）。negotiate_protocolで切り替える
+input_protocol = 'line'
+SUPPORTED_PROTOCOLS = ('line', 'framed')
+FRAME_LENGTH_SIZE = 4  # フレーム長のバイト数（ビッグエンディアンの符号なし整数）
+MAX_FRAME_HEADER_SIZE = 16 * 1024 * 1024  # ヘッダーとして許容する最大サイズ（同期ずれの検出用）
+MAX_FRAME_SIZE = 256 * 1024 * 1024  # バイナリフレーム1つの最大サイズ（超えたフレームはメモリに読み込まない）
+FRAME_DISCARD_CHUNK_SIZE = 1024 * 1024  # 上限を超えたフレームを読み捨てる単位
+
+# 画像パラメータとして受け付けるキー名
+IMAGE_PARAM_KEYS = ('image_data', 'imageData', 'image')
+
+# 画像ストア（register_image）の既定の上限サイズ（MB）
+DEFAULT_IMAGE_STORE_MB = 256
+
+# 解析結果キャッシュの既定値
+DEFAULT_CACHE_MEMORY_ENTRIES = 256  # メモリ上に保持するエントリ数
+DEFAULT_CACHE_DISK_MB = 200  # ディスクキャッシュの上限サイズ（MB）
+CACHE_PRUNE_INTERVAL = 50  # この回数書き込むごとにディスクキャッシュを整理する
+DEFAULT_OCR_TILE_CACHE_MEMORY_ENTRIES = 512  # 帯ごとのOCR結果をメモリ上に保持するエントリ数
+DEFAULT_OCR_TILE_CACHE_DISK_MB = 50  # 帯ごとのOCR結果のディスクキャッシュの上限サイズ（MB）
+
+# deadline_ms指定時、残り時間がこの秒数を切ったら次のステージを開始せず途中結果を返す
+DEADLINE_MARGIN_SECONDS = 0.5
+
+# ワーカープールの既定値（環境変数またはコマンドライン引数で上書き可能）
+DEFAULT_WORKERS = max(1, min(4, (os.cpu_count() or 2) // 2))
+DEFAULT_WORKER_MODE = 'thread'
+
+# analyze_batchの既定値
+DEFAULT_BATCH_DECODE_THREADS = 2  # 画像のデコードを先行して行うスレッド数
+BATCH_PREFETCH_PER_WORKER = 2  # ワーカー1つあたり先行してデコードしておく画像の数（メモリ使用量の上限）
+
+# analyze_allのステージ並列実行の既定値
+DEFAULT_STAGE_THREADS = max(1, min(4, os.cpu_count() or 2))
+DEFAULT_STAGE_MODE = 'thread'  # process: GIL依存のノード（色抽出・要素検出）を別プロセスで計算する
+
+# 帯の並列OCRのプロセス数（0で無効。ワーカーごとにOCRモデルを読み込むため、既定では無効にしておく）
+DEFAULT_OCR_PROCESSES = 0
+
+# ログ・キャッシュなどのパスはスクリプトのある場所を基準に組み立てる（カレントディレクトリは変更しない）
 script_dir = os.path.dirname(os.path.abspath(__file__))
-os.chdir(script_dir)
 
-def initialize_image_analyzer():
-    """画像解析モジュールを初期化する"""
+def initialize_image_analyzer(reload: bool = False):
+    """
+    画像解析モジュールを初期化する
+
+    読み込み済みの場合は何もしない（setup_environmentから何度呼ばれても、OCRリーダーやプール、
+    configure_ocr_offloadなどの設定、キャンセル例外のクラスを作り直さないようにする）。
+    reload=Trueの場合は読み込み直す（fork したワーカープロセスで親プロセスの設定を引き継がないため）。
+    """
     global image_analyzer
 
+    if image_analyzer is not None and not reload:
+        logger.debug("image_analyzer モジュールは初期化済みです")
+        return True
+
     try:
         # 画像解析モジュールのパスを特定
         script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -92,6 +264,8 @@ def initialize_image_analyzer():
 
         # モジュールをグローバル変数に設定
         image_analyzer = image_analyzer_module
+        # テキスト抽出で帯ごとのOCR結果を再利用できるようにする
+        image_analyzer.configure_text_tile_cache(ocr_tile_cache)
 
         logger.info("image_analyzer モジュールが正常に初期化されました")
         return True
@@ -101,10 +275,106 @@ def initialize_image_analyzer():
         logger.error(traceback.format_exc())
         return False
 
+def _read_exact(stream, length: int) -> Optional[bytearray]:
+    """ストリームから指定バイト数を読み取る（途中でEOFになった場合はNone）"""
+    buffer = bytearray(length)
+    view = memoryview(buffer)
+    received = 0
+    while received < length:
+        count = stream.readinto(view[received:])
+        if not count:
+            return None
+        received += count
+    return buffer
+
+class FrameTooLargeError(ValueError):
+    """バイナリフレームがMAX_FRAME_SIZEを超えたことを示す例外（フレームは読み捨て済み）"""
+
+    def __init__(self, request_id: Any, keys: List[str]):
+        super().__init__(f"フレームが大きすぎます（上限 {MAX_FRAME_SIZE}バイト）: {keys}")
+        self.request_id = request_id
+        self.keys = keys
+
+def _discard_exact(stream, length: int) -> bool:
+    """ストリームから指定バイト数をメモリに保持せずに読み捨てる（途中でEOFになった場合はFalse）"""
+    buffer = bytearray(min(length, FRAME_DISCARD_CHUNK_SIZE))
+    view = memoryview(buffer)
+    remaining = length
+    while remaining > 0:
+        count = stream.readinto(view[:min(remaining, len(buffer))])
+        if not count:
+            return False
+        remaining -= count
+    return True
+
+def _read_framed_request(stream) -> Optional[Dict[str, Any]]:
+    """
+    フレーム形式のリクエストを読み取る
+
+    形式: [4バイト長][JSONヘッダー] に続けて、ヘッダーの "frames" に列挙された
+    パラメータ名の順に [4バイト長][バイナリデータ] が並ぶ（長さはすべてビッグエンディアン）。
+    バイナリデータはBase64を経由せず、bytes互換のままパラメータに格納される。
+    MAX_FRAME_SIZEを超えるフレームは読み捨ててフレーム境界を保ち、FrameTooLargeErrorを送出する。
+    """
+    prefix = _read_exact(stream, FRAME_LENGTH_SIZE)
+    if prefix is None:
+        return None
+
+    header_length = int.from_bytes(prefix, 'big')
+    if header_length > MAX_FRAME_HEADER_SIZE:
+        raise ValueError(f"フレームヘッダーが大きすぎます: {header_length}バイト")
+
+    header_bytes = _read_exact(stream, header_length)
+    if header_bytes is None:
+        return None
+
+    request = json.loads(header_bytes.decode('utf-8'))
+
+    oversized = []
+    for key in request.pop('frames', []):
+        frame_prefix = _read_exact(stream, FRAME_LENGTH_SIZE)
+        if frame_prefix is None:
+            return None
+        frame_length = int.from_bytes(frame_prefix, 'big')
+        if frame_length > MAX_FRAME_SIZE:
+            if not _discard_exact(stream, frame_length):
+                return None
+            oversized.append(key)
+            continue
+        payload = _read_exact(stream, frame_length)
+        if payload is None:
+            return None
+        request[key] = payload
+
+    if oversized:
+        raise FrameTooLargeError(request.get('id'), oversized)
+    return request
+
 def read_request() -> Optional[Dict[str, Any]]:
-    """標準入力からJSONリクエストを読み取る"""
+    """
+    標準入力からリクエストを読み取る
+
+    Returns:
+        リクエスト辞書。標準入力が閉じられた場合（またはフレーム同期が失われた場合）はNone。
+        行プロトコルで不正なJSONを受け取った場合は空の辞書を返し、次の行から読み取りを続ける。
+        上限を超えるフレームを受け取った場合は、idと_frame_error（エラーメッセージ）だけの辞書を返す。
+    """
+    stream = sys.stdin.buffer
+
+    if input_protocol == 'framed':
+        try:
+            return _read_framed_request(stream)
+        except FrameTooLargeError as e:
+            # フレームは読み捨て済みで境界は保たれているため、このリクエストだけをエラーにする
+            logger.error(f"フレームが大きすぎるためリクエストを破棄しました: {str(e)}")
+            return {'id': e.request_id, '_frame_error': str(e)}
+        except Exception as e:
+            # フレーム境界が分からなくなるため、以降の読み取りは継続できない
+            logger.error(f"フレーム読み取り中にエラーが発生しました: {str(e)}")
+            return None
+
     try:
-        line = sys.stdin.readline()
+        line = stream.readline()
         if not line:
             return None
 
@@ -112,141 +382,107 @@ def read_request() -> Optional[Dict[str, Any]]:
 
     except json.JSONDecodeError as e:
         logger.error(f"JSONデコードエラー: {str(e)}")
-        return None
+        return {}
 
     except Exception as e:
         logger.error(f"リクエスト読み取り中にエラーが発生しました: {str(e)}")
         return None
 
-def send_response(request_id: str, result: Any = None, error: str = None):
-    """JSONレスポンスを標準出力に送信する"""
-    response = {
-        "id": request_id,
-        "result": result,
-        "error": error
-    }
+def write_line(line):
+    """1行分のメッセージ（strまたはUTF-8のbytes）を標準出力に書き込む（スレッドセーフ）"""
+    if isinstance(line, str):
+        line = line.encode('utf-8')
+
+    with _stdout_lock:
+        # プロセスワーカー内では親プロセスに返すために収集する
+        sink = _response_sink
+        if sink is not None:
+            sink.append(line)
+            return
 
-    # 関数開始時の詳細なデバッグログを追加
-    logger.debug(f"===== send_response開始 =====")
-    logger.debug(f"リクエストID: {request_id}")
-    logger.debug(f"レスポンスタイプ: {'成功' if error is None else 'エラー'}")
-    logger.debug(f"結果データタイプ: {type(result).__name__ if result is not None else 'None'}")
+        # コンソールのエンコーディング（Windowsのcp932など）に左右されないよう、バイト列で書き込む
+        sys.stdout.buffer.write(line + b'\n')
+        sys.stdout.buffer.flush()
 
+def dumps_json(obj: Any) -> bytes:
+    """
+    レスポンスを1回だけシリアライズする（orjsonがあれば使用し、NumPy型もそのまま変換する）
+    """
+    if ORJSON_AVAILABLE:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            # orjsonが扱えない値（64bitを超える整数など）は標準のjsonで再試行する
+            pass
+    return json.dumps(obj, default=_json_default).encode('utf-8')
+
+def _normalize_result(request_id: str, result: Any) -> Any:
+    """JS側が期待する形式に結果を整える（配列であるべきキーの型を補正する）"""
+    if isinstance(result, dict):
+        if 'colors' in result and not isinstance(result['colors'], list):
+            logger.warning(f"警告: colorsデータを配列に変換します: {type(result['colors']).__name__} → list")
+            result['colors'] = []
+
+        if 'text' in result and not isinstance(result['text'], str):
+            logger.warning(f"警告: textデータを文字列に変換します: {type(result['text']).__name__} → str")
+            result['text'] = str(result['text'])
+
+        if 'textBlocks' in result and not isinstance(result['textBlocks'], list):
+            logger.warning(f"警告: textBlocksデータを配列に変換します: {type(result['textBlocks']).__name__} → list")
+            result['textBlocks'] = []
+
+        for key in ('elements', 'sections'):
+            if key in result and not isinstance(result[key], list):
+                logger.warning(f"警告: {key}データを配列に変換します: {type(result[key]).__name__} → list")
+                if isinstance(result[key], dict) and key in result[key]:
+                    result[key] = result[key][key]
+                else:
+                    result[key] = []
+
+    # extract_colors_from_imageの直接の呼び出し結果（色の配列）はオブジェクトに変換する
+    elif isinstance(result, list) and result and isinstance(result[0], dict):
+        if 'hex' in result[0] and request_id.startswith('analyze_'):
+            logger.debug("色情報データを構造化: 配列→オブジェクト変換")
+            result = {"colors": result}
+
+    return result
+
+def _log_result_summary(result: Any):
+    """送信する結果の概要をログに出力する（DEBUGレベルが有効な場合のみ呼ばれる）"""
+    if isinstance(result, dict):
+        logger.debug(f"Python→JS送信データ構造: キー={list(result.keys())}")
+        if isinstance(result.get('colors'), list):
+            logger.debug(f"Python→JS送信色情報: {len(result['colors'])}色")
+        if isinstance(result.get('text'), str):
+            logger.debug(f"Python→JS送信テキスト: {len(result['text'])}文字")
+        if isinstance(result.get('textBlocks'), list):
+            logger.debug(f"Python→JS送信テキストブロック: {len(result['textBlocks'])}個")
+    elif isinstance(result, list):
+        logger.debug(f"Python→JS送信データ構造: 配列（要素数={len(result)}）")
+
+def send_response(request_id: str, result: Any = None, error: str = None):
+    """JSONレスポンスを標準出力に送信する（シリアライズは1回だけ行う）"""
     try:
-        # データの概要をログに記録
         if result is not None:
-            if isinstance(result, dict):
-                logger.info(f"Python→JS送信データ構造: キー={list(result.keys())}")
-
-                # 画像解析結果データの構造をさらに詳細に検証
-                if 'colors' in result:
-                    if isinstance(result['colors'], list):
-                        logger.info(f"Python→JS送信色情報: {len(result['colors'])}色")
-                        for i, color in enumerate(result['colors'][:3]):  # 最初の3色だけ表示
-                            if isinstance(color, dict):
-                                logger.info(f"色{i+1}: {color.get('hex', 'なし')} ({color.get('role', 'なし')})")
-                    else:
-                        logger.warning(f"警告: colors値が配列ではありません: {type(result['colors']).__name__}")
-
-                if 'text' in result:
-                    if isinstance(result['text'], str):
-                        logger.info(f"Python→JS送信テキスト: '{result['text'][:50]}...'" if len(result['text']) > 50 else result['text'])
-                    else:
-                        logger.warning(f"警告: textデータが文字列ではありません: {type(result['text']).__name__}")
-
-                if 'textBlocks' in result:
-                    if isinstance(result['textBlocks'], list):
-                        logger.info(f"Python→JS送信テキストブロック: {len(result['textBlocks'])}個")
-                        if len(result['textBlocks']) > 0:
-                            logger.info(f"最初のブロック: {result['textBlocks'][0]}")
-                    else:
-                        logger.warning(f"警告: textBlocksデータが配列ではありません: {type(result['textBlocks']).__name__}")
-
-                # analyze_all応答の詳細ログ
-                if 'colors' in result and 'text' in result and 'textBlocks' in result:
-                    logger.info(f"Python→JS送信analyze_all応答検証: colors={len(result['colors'])}, text長={len(result['text']) if isinstance(result['text'], str) else 'N/A'}, textBlocks={len(result['textBlocks']) if isinstance(result['textBlocks'], list) else 'N/A'}")
-
-                # データの完全性検証とフォールバック
-                logger.info(f"Python→JS送信データの完全性検証:")
-
-                # 各主要プロパティのチェックと必要に応じて修正
-                if 'colors' in result and not isinstance(result['colors'], list):
-                    logger.warning(f"警告: colorsデータを配列に変換します: {type(result['colors']).__name__} → list")
-                    result['colors'] = []
-
-                if 'text' in result:
-                    if not isinstance(result['text'], str):
-                        logger.warning(f"警告: textデータを文字列に変換します: {type(result['text']).__name__} → str")
-                        result['text'] = str(result['text'])
-
-                if 'textBlocks' in result and not isinstance(result['textBlocks'], list):
-                    logger.warning(f"警告: textBlocksデータを配列に変換します: {type(result['textBlocks']).__name__} → list")
-                    result['textBlocks'] = []
-
-                if 'elements' in result and not isinstance(result['elements'], list):
-                    logger.warning(f"警告: elementsデータを配列に変換します: {type(result['elements']).__name__} → list")
-                    if isinstance(result['elements'], dict) and 'elements' in result['elements']:
-                        result['elements'] = result['elements']['elements']
-                    else:
-                        result['elements'] = []
-
-                if 'sections' in result and not isinstance(result['sections'], list):
-                    logger.warning(f"警告: sectionsデータを配列に変換します: {type(result['sections']).__name__} → list")
-                    if isinstance(result['sections'], dict) and 'sections' in result['sections']:
-                        result['sections'] = result['sections']['sections']
-                    else:
-                        result['sections'] = []
-
-            # 配列の場合は色情報として処理（extract_colorsの直接返り値対応）
-            elif isinstance(result, list) and len(result) > 0 and isinstance(result[0], dict):
-                logger.info(f"Python→JS送信データ構造: 配列（要素数={len(result)}）")
-                # 配列が色情報である可能性をチェック（最初の要素にhexキーがあるか）
-                if 'hex' in result[0] or 'rgb' in result[0]:
-                    logger.info(f"Python→JS送信色情報: {len(result)}色")
-                    for i, color in enumerate(result[:3]):  # 最初の3色だけ表示
-                        logger.info(f"色{i+1}: {color.get('hex', 'なし')} ({color.get('role', 'なし')})")
-
-                # API応答の場合は配列のままreturnするが、colorsの場合はオブジェクトに変換する可能性
-                # extract_colors_from_imageの直接の呼び出し結果への対応
-                if 'hex' in result[0] and request_id.startswith('analyze_'):
-                    logger.info(f"色情報データを構造化: 配列→オブジェクト変換")
-                    result = {"colors": result}
-
-            # データサイズの記録
-            try:
-                json_string = json.dumps(result)
-                json_size = len(json_string)
-                logger.debug(f"結果データサイズ: 約{json_size/1024:.2f}KB")
-                # 大きなJSONの場合はプレビューを出力
-                if json_size > 10000:  # 10KB以上の場合
-                    logger.debug(f"大きなJSONデータのプレビュー: {json_string[:500]}...")
-            except Exception as size_err:
-                logger.debug(f"データサイズ計算エラー: {str(size_err)}")
-
-        # 送信前の最終確認
-        logger.info(f"Python→JS送信直前: request_id={request_id}, 成功={error is None}")
-
-        # 最終的なレスポンス構造のチェック
-        try:
-            response_keys = list(response.keys())
-            logger.info(f"最終レスポンス構造: {response_keys}")
-
-            # 結果データがdictでキーを持つ場合
-            if isinstance(response['result'], dict):
-                result_keys = list(response['result'].keys())
-                logger.info(f"結果データのキー: {result_keys}")
-
-            # リクエストIDに基づいてコマンドタイプをログに出力
-            if 'analyze_all' in request_id:
-                logger.info(f"analyze_all応答の送信確認: 構造={response_keys}, resultのキー={list(response['result'].keys()) if isinstance(response['result'], dict) else 'dict以外'}")
-        except Exception as check_err:
-            logger.error(f"レスポンス確認エラー: {str(check_err)}")
-
-        # JSONをシリアライズして標準出力に送信
-        json_response = json.dumps(response)
-        logger.debug(f"JSONシリアライズ成功: {len(json_response)}バイト")
-        print(json_response + '\n', flush=True)
-        logger.debug(f"標準出力への書き込み完了")
+            result = _normalize_result(request_id, result)
+
+        debug_enabled = logger.isEnabledFor(logging.DEBUG)
+        if debug_enabled:
+            _log_result_summary(result)
+
+        payload = dumps_json({
+            "id": request_id,
+            "result": result,
+            "error": error
+        })
+
+        if debug_enabled:
+            logger.debug(f"Python→JS送信: request_id={request_id}, 成功={error is None}, サイズ={len(payload) / 1024:.2f}KB")
+            # 大きなJSONの場合はプレビューを出力
+            if len(payload) > 10000:
+                logger.debug(f"大きなJSONデータのプレビュー: {payload[:500].decode('utf-8', 'replace')}...")
+
+        write_line(payload)
 
     except Exception as e:
         logger.error(f"レスポンス送信中にエラーが発生しました: {str(e)}")
@@ -257,9 +493,22 @@ def send_response(request_id: str, result: Any = None, error: str = None):
             "result": None,
             "error": f"レスポンス送信エラー: {str(e)}"
         }
-        print(json.dumps(fallback_response), flush=True)
-    finally:
-        logger.debug(f"===== send_response終了 =====")
+        write_line(json.dumps(fallback_response))
+
+def send_event(request_id: str, event: str, **fields):
+    """
+    最終レスポンスの前に途中経過（partial / progress など）を送信する
+
+    形式: {"id": ..., "event": ..., ...fields}。JS側は"event"キーの有無で最終レスポンスと区別する。
+    プロセスワーカーモードでは、イベントは最終レスポンスと一緒にまとめて送信される。
+    fieldsにidやeventが含まれていても、リクエストIDとイベント名は上書きしない。
+    """
+    try:
+        message = {"id": request_id, "event": event}
+        message.update((key, value) for key, value in fields.items() if key not in message)
+        write_line(dumps_json(message))
+    except Exception as e:
+        logger.error(f"イベント送信中にエラーが発生しました: {str(e)}")
 
 def handle_check_environment(request_id: str, params: Dict[str, Any]):
     """Pythonサーバー環境が正常に動作しているか確認する"""
@@ -310,12 +559,71 @@ def handle_setup_environment(request_id: str, params: Dict[str, Any]):
         logger.error(f"環境セットアップ中にエラーが発生しました: {str(e)}")
         send_response(request_id, None, f"環境セットアップエラー: {str(e)}")
 
-def base64_to_image_data(image_data_base64: str) -> Tuple[Any, str]:
-    """Base64エンコードされた画像データをデコードする"""
+def _track_request_resource(resource):
+    """現在のリクエストの完了時に解放するリソース（共有メモリなど）を登録する"""
+    resources = getattr(_request_resources, 'items', None)
+    if resources is None:
+        resources = _request_resources.items = []
+    resources.append(resource)
+
+def release_request_resources():
+    """現在のリクエストで開いたリソースを解放する"""
+    resources = getattr(_request_resources, 'items', None) or []
+    _request_resources.items = []
+
+    with _deferred_resources_lock:
+        pending = resources + _deferred_resources
+        _deferred_resources.clear()
+
+    for resource in pending:
+        try:
+            resource.close()
+        except BufferError:
+            # 画像への参照がまだ残っている場合は次回に解放を再試行する
+            with _deferred_resources_lock:
+                _deferred_resources.append(resource)
+        except Exception as e:
+            logger.warning(f"リソース解放中にエラーが発生しました: {str(e)}")
+
+def _detect_image_format(image_bytes) -> str:
+    """バイナリ画像データの先頭バイトから画像形式を判定する"""
+    head = bytes(image_bytes[:12])
+    if head.startswith(b'\x89PNG'):
+        return 'png'
+    if head.startswith(b'GIF8'):
+        return 'gif'
+    if head.startswith(b'RIFF') and head[8:12] == b'WEBP':
+        return 'webp'
+    return 'jpeg'
+
+def base64_to_image_data(image_data_base64: Any) -> Tuple[Any, str]:
+    """
+    画像データをデコードする
+
+    Base64文字列（Data URI形式を含む）のほか、フレームプロトコルで受信した
+    バイナリデータ（bytes / bytearray / memoryview）もBase64を経由せずに受け付ける。
+    {'path': ...} や {'shm': ..., 'shape': ..., 'dtype': ...} の画像参照は
+    image_analyzer.load_image_reference() で直接読み込む。
+    """
     if not image_analyzer:
         raise ValueError("画像解析モジュールが初期化されていません")
 
     try:
+        # ファイルパスや共有メモリへの参照は直接読み込む
+        if isinstance(image_data_base64, dict):
+            image, shm = image_analyzer.load_image_reference(image_data_base64)
+            if shm is not None:
+                # リクエスト完了後にrelease_request_resources()で解放する
+                _track_request_resource(shm)
+            path = image_data_base64.get('path') or ''
+            image_format = os.path.splitext(path)[1].lstrip('.').lower() or 'raw'
+            return image, image_format
+
+        # フレームプロトコルで受信したバイナリはそのままデコードする
+        if isinstance(image_data_base64, (bytes, bytearray, memoryview)):
+            image = image_analyzer.decode_image(image_data_base64)
+            return image, _detect_image_format(image_data_base64)
+
         # Base64形式チェック
         if ',' in image_data_base64:
             # Data URI形式の場合（例: data:image/jpeg;base64,/9j/4AAQSkZ...）
@@ -338,6 +646,362 @@ def base64_to_image_data(image_data_base64: str) -> Tuple[Any, str]:
         logger.error(f"画像データのデコード中にエラーが発生しました: {str(e)}")
         raise
 
+class ImageStore:
+    """
+    デコード済み画像を保持するLRUストア（register_imageで登録し、ハンドルで参照する）
+
+    同じ画像を複数のコマンドで解析する際に、Base64デコードとcv2.imdecodeを
+    1回で済ませるために使う。合計サイズが上限を超えると古いものから破棄する。
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._images = OrderedDict()  # handle → ndarray
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    def put(self, image: np.ndarray) -> str:
+        """画像を登録してハンドルを返す"""
+        if image.nbytes > self.max_bytes:
+            raise ValueError(f"画像サイズがストアの上限を超えています: {image.nbytes / (1024 * 1024):.1f}MB")
+
+        # 共有メモリやメモリマップ上の画像はリクエスト後に解放されるため、ストア用に複製する
+        if not image.flags.owndata:
+            image = image.copy()
+        # 複数のリクエストから共有されるため、誤って書き換えられないよう読み取り専用にする
+        image.flags.writeable = False
+
+        handle = uuid.uuid4().hex
+        with self._lock:
+            self._images[handle] = image
+            self._total_bytes += image.nbytes
+            while self._total_bytes > self.max_bytes and self._images:
+                evicted_handle, evicted = self._images.popitem(last=False)
+                self._total_bytes -= evicted.nbytes
+                logger.info(f"画像ストアの上限に達したため破棄しました: handle={evicted_handle}")
+        return handle
+
+    def get(self, handle: str) -> np.ndarray:
+        """ハンドルから画像を取得する（最近使ったものとして扱う）"""
+        with self._lock:
+            image = self._images.get(handle)
+            if image is None:
+                raise ValueError(f"画像ハンドルが見つかりません（解放済みまたは破棄済み）: {handle}")
+            self._images.move_to_end(handle)
+            return image
+
+    def release(self, handle: str) -> bool:
+        """ハンドルの画像を解放する"""
+        with self._lock:
+            image = self._images.pop(handle, None)
+            if image is None:
+                return False
+            self._total_bytes -= image.nbytes
+            return True
+
+    def clear(self) -> int:
+        """すべての画像を解放し、解放した件数を返す"""
+        with self._lock:
+            count = len(self._images)
+            self._images.clear()
+            self._total_bytes = 0
+            return count
+
+    def stats(self) -> Dict[str, Any]:
+        """ストアの使用状況を返す"""
+        with self._lock:
+            return {
+                "handles": len(self._images),
+                "size_mb": round(self._total_bytes / (1024 * 1024), 2),
+                "max_size_mb": round(self.max_bytes / (1024 * 1024), 2)
+            }
+
+image_store = ImageStore(int(os.environ.get('PYTHON_SERVER_IMAGE_STORE_MB', DEFAULT_IMAGE_STORE_MB)) * 1024 * 1024)
+
+def _json_default(obj):
+    """json.dumpsで直接扱えないNumPy型を標準の型に変換する"""
+    if isinstance(obj, np.integer):
+        return int(obj)
+    if isinstance(obj, np.floating):
+        return float(obj)
+    if isinstance(obj, np.bool_):
+        return bool(obj)
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def compute_image_hash(image: np.ndarray) -> str:
+    """デコード済み画像のピクセル内容からSHA-256ハッシュを計算する"""
+    digest = hashlib.sha256()
+    digest.update(f"{image.shape}:{image.dtype.str}".encode('utf-8'))
+    digest.update(memoryview(np.ascontiguousarray(image)).cast('B'))
+    return digest.hexdigest()
+
+def _default_cache_dir() -> str:
+    """解析結果キャッシュの保存先（アプリのデータディレクトリ配下）"""
+    if os.environ.get('PYTHON_SERVER_CACHE_DIR'):
+        return os.environ['PYTHON_SERVER_CACHE_DIR']
+    if os.environ.get('APP_DATA_DIR'):
+        return os.path.join(os.environ['APP_DATA_DIR'], 'analysis_cache')
+    return os.path.join(script_dir, 'cache', 'analysis')
+
+def _default_ocr_tile_cache_dir() -> str:
+    """帯ごとのOCR結果キャッシュの保存先"""
+    if os.environ.get('PYTHON_SERVER_OCR_TILE_CACHE_DIR'):
+        return os.environ['PYTHON_SERVER_OCR_TILE_CACHE_DIR']
+    if os.environ.get('APP_DATA_DIR'):
+        return os.path.join(os.environ['APP_DATA_DIR'], 'ocr_tile_cache')
+    return os.path.join(script_dir, 'cache', 'ocr_tiles')
+
+class AnalysisCache:
+    """
+    解析結果の2段キャッシュ（メモリ上のLRU + ディスク）
+
+    キーは画像ピクセルのSHA-256、正規化したオプション、解析モジュールのバージョン、
+    ステージ名（colors / text / sections / layout / elements）から作る。
+    同じスクリーンショットを再解析する場合、ステージ単位で結果を再利用できる。
+    キャッシュから返した値は共有されるため、呼び出し側で書き換えないこと。
+    """
+
+    def __init__(self, cache_dir: str, max_memory_entries: int = DEFAULT_CACHE_MEMORY_ENTRIES,
+                 max_disk_bytes: int = DEFAULT_CACHE_DISK_MB * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes_since_prune = 0
+        self.hits = {"memory": 0, "disk": 0}
+        self.misses = 0
+
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+        except Exception as e:
+            logger.warning(f"キャッシュディレクトリを作成できません。ディスクキャッシュを無効化します: {str(e)}")
+            self.cache_dir = None
+
+    def make_key(self, stage: str, image_hash: str, options: Optional[Dict[str, Any]] = None) -> str:
+        """
+        ステージ・画像ハッシュ・オプションからキャッシュキーを作る
+
+        ステージの選択（stages・type）や画像そのものは結果に影響しないためキーに含めない。
+        単体のステージコマンドとanalyze_allが同じ画像・オプションで同じキーになる。
+        """
+        options = {k: v for k, v in (options or {}).items() if k != 'image' and k not in STAGE_SELECTION_KEYS}
+        normalized_options = json.dumps(options, sort_keys=True, ensure_ascii=False, default=str)
+        analyzer_version = getattr(image_analyzer, 'ANALYZER_VERSION', '0')
+        material = f"{stage}\n{image_hash}\n{normalized_options}\n{analyzer_version}"
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def get(self, key: str) -> Any:
+        """キャッシュから値を取得する（見つからない場合はNone）"""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits["memory"] += 1
+                return self._memory[key]
+
+        if self.cache_dir:
+            try:
+                with open(self._path(key), 'r', encoding='utf-8') as f:
+                    value = json.load(f)
+                self._remember(key, value)
+                with self._lock:
+                    self.hits["disk"] += 1
+                return value
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                logger.warning(f"ディスクキャッシュの読み込みに失敗しました: {str(e)}")
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, value: Any):
+        """
+        値をキャッシュに保存する
+
+        エラー結果、空の結果、OCRエンジンの失敗で得られなかった結果（degraded）は保存しない
+        （保存すると、エンジンが使えるようになっても同じ画像が再解析されなくなる）。
+        """
+        if not value or (isinstance(value, dict) and (value.get('error') or value.get('degraded'))):
+            return
+
+        self._remember(key, value)
+
+        if not self.cache_dir:
+            return
+        try:
+            path = self._path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # 書き込み途中のファイルを読まれないよう、一時ファイルに書いてから置き換える
+            temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(value, f, ensure_ascii=False, default=_json_default)
+            os.replace(temp_path, path)
+        except Exception as e:
+            logger.warning(f"ディスクキャッシュの書き込みに失敗しました: {str(e)}")
+            return
+
+        with self._lock:
+            self._writes_since_prune += 1
+            should_prune = self._writes_since_prune >= CACHE_PRUNE_INTERVAL
+            if should_prune:
+                self._writes_since_prune = 0
+        if should_prune:
+            self.prune()
+
+    def _remember(self, key: str, value: Any):
+        with self._lock:
+            self._memory[key] = value
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_memory_entries:
+                self._memory.popitem(last=False)
+
+    def prune(self):
+        """ディスクキャッシュが上限を超えている場合、古いものから削除する"""
+        if not self.cache_dir:
+            return
+        try:
+            entries = []
+            total = 0
+            for root, _, files in os.walk(self.cache_dir):
+                for name in files:
+                    path = os.path.join(root, name)
+                    stat = os.stat(path)
+                    entries.append((stat.st_mtime, stat.st_size, path))
+                    total += stat.st_size
+
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_disk_bytes:
+                    break
+                os.remove(path)
+                total -= size
+        except Exception as e:
+            logger.warning(f"ディスクキャッシュの整理に失敗しました: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        """キャッシュの利用状況を返す"""
+        with self._lock:
+            return {
+                "memory_entries": len(self._memory),
+                "hits": dict(self.hits),
+                "misses": self.misses,
+                "cache_dir": self.cache_dir
+            }
+
+analysis_cache = AnalysisCache(_default_cache_dir())
+# 帯（画像を水平に分割した領域）ごとのOCR結果のキャッシュ。キーは帯のピクセルのハッシュで、
+# 改訂前後のデザインで共通するヘッダーやフッターなどのOCRを省略する
+ocr_tile_cache = AnalysisCache(_default_ocr_tile_cache_dir(),
+                               max_memory_entries=DEFAULT_OCR_TILE_CACHE_MEMORY_ENTRIES,
+                               max_disk_bytes=DEFAULT_OCR_TILE_CACHE_DISK_MB * 1024 * 1024)
+
+def cached_stage(stage: str, image_hash: Optional[str], options: Dict[str, Any], compute):
+    """
+    解析ステージの結果をキャッシュ経由で取得する
+
+    image_hashがNoneの場合（キャッシュ無効時）は常に計算する。
+    """
+    if image_hash is None:
+        return compute()
+
+    key = analysis_cache.make_key(stage, image_hash, options)
+    cached = analysis_cache.get(key)
+    if cached is not None:
+        logger.info(f"キャッシュヒット: stage={stage}")
+        return cached
+
+    value = compute()
+    analysis_cache.put(key, value)
+    return value
+
+def request_image_hash(params: Dict[str, Any], image: np.ndarray) -> Optional[str]:
+    """キャッシュが有効なリクエストであれば画像ハッシュを返す（cache=falseで無効化）"""
+    if params.get('cache', True) is False or image is None:
+        return None
+    return compute_image_hash(image)
+
+def has_request_image(params: Dict[str, Any], keys: Tuple[str, ...] = IMAGE_PARAM_KEYS,
+                      handle_key: str = 'image_handle') -> bool:
+    """リクエストに画像（ハンドルまたは画像データ）が含まれているか"""
+    if params.get(handle_key) is not None:
+        return True
+    return any(key in params and params[key] for key in keys)
+
+def get_request_image(params: Dict[str, Any], keys: Tuple[str, ...] = IMAGE_PARAM_KEYS,
+                      handle_key: str = 'image_handle') -> Tuple[Any, str]:
+    """
+    リクエストパラメータから画像を取得する
+
+    画像ハンドル（register_imageで登録したもの）があればそれを優先し、
+    なければインライン画像データまたは画像参照をデコードする。
+    """
+    handle = params.get(handle_key)
+    if handle is not None:
+        # プロセスモードではディスパッチャーがハンドルを画像に解決して渡す
+        if isinstance(handle, np.ndarray):
+            return handle, 'raw'
+        return image_store.get(handle), 'raw'
+
+    for key in keys:
+        if key in params and params[key]:
+            return base64_to_image_data(params[key])
+
+    raise ValueError("画像データが提供されていません")
+
+def handle_register_image(request_id: str, params: Dict[str, Any]):
+    """画像をデコードしてストアに登録し、以降のコマンドで使うハンドルを返す"""
+    try:
+        if not image_analyzer:
+            raise ValueError("画像解析モジュールが初期化されていません")
+
+        image, image_format = get_request_image(params)
+        if image is None:
+            raise ValueError("画像のデコードに失敗しました")
+
+        handle = image_store.put(image)
+        height, width = image.shape[:2]
+        logger.info(f"画像を登録しました: handle={handle}, サイズ={width}x{height}")
+
+        send_response(request_id, {
+            "image_handle": handle,
+            "width": width,
+            "height": height,
+            "format": image_format,
+            "store": image_store.stats()
+        })
+
+    except Exception as e:
+        logger.error(f"画像登録中にエラーが発生しました: {str(e)}")
+        logger.error(traceback.format_exc())
+        send_response(request_id, None, f"画像登録エラー: {str(e)}")
+
+def handle_release_image(request_id: str, params: Dict[str, Any]):
+    """登録済み画像を解放する（all=trueですべて解放）"""
+    try:
+        if params.get('all'):
+            released = image_store.clear()
+        else:
+            handle = params.get('image_handle')
+            if not handle:
+                raise ValueError("image_handleが指定されていません")
+            released = 1 if image_store.release(handle) else 0
+
+        send_response(request_id, {
+            "released": released,
+            "store": image_store.stats()
+        })
+
+    except Exception as e:
+        logger.error(f"画像解放中にエラーが発生しました: {str(e)}")
+        send_response(request_id, None, f"画像解放エラー: {str(e)}")
+
 def handle_extract_colors(request_id: str, params: Dict[str, Any]):
     """画像から主要な色を抽出する"""
     try:
@@ -345,24 +1009,11 @@ def handle_extract_colors(request_id: str, params: Dict[str, Any]):
             raise ValueError("画像解析モジュールが初期化されていません")
 
         # パラメータを取得
-        image_data = None
-        # 複数の可能なキー名をチェック
-        for key in ['image_data', 'imageData', 'image']:
-            if key in params and params[key]:
-                image_data = params[key]
-                logger.info(f"受信パラメータのキー: {list(params.keys())}")
-                logger.info(f"画像データ形式: {type(image_data).__name__}")
-                logger.info(f"画像データサイズ: {len(image_data) if isinstance(image_data, str) else 'N/A'}")
-                logger.info(f"画像データプレビュー: {image_data[:50]}..." if isinstance(image_data, str) and len(image_data) > 50 else 'N/A')
-                break
-
+        logger.debug(f"受信パラメータのキー: {list(params.keys())}")
         options = params.get('options', {})
 
-        if not image_data:
-            raise ValueError("画像データが提供されていません")
-
-        # Base64データを画像に変換
-        image, _ = base64_to_image_data(image_data)
+        # 画像ハンドルまたは画像データから画像を取得
+        image, _ = get_request_image(params)
 
         # image_analyzer.pyのextract_colors_from_image関数を呼び出す
         # オプションのimageを除外して衝突回避
@@ -370,17 +1021,19 @@ def handle_extract_colors(request_id: str, params: Dict[str, Any]):
             logger.warning("[debug] options に 'image' が含まれているため除去します")
             options.pop('image')
 
-        colors = image_analyzer.extract_colors_from_image(image=image, **options)
+        colors = cached_stage('colors', request_image_hash(params, image), options,
+                              lambda: image_analyzer.extract_colors_from_image(image=image, **options))
 
-        # 抽出結果のデータ型と構造を詳細に検証
-        logger.info(f"色抽出結果（生データ）: {len(colors)}色")
-        logger.info(f"色抽出結果データ型: {type(colors).__name__}")
+        logger.info(f"色抽出結果: {len(colors)}色")
 
-        if len(colors) > 0:
-            logger.info(f"最初の色データ構造: {type(colors[0]).__name__}")
-            if isinstance(colors[0], dict):
-                logger.info(f"最初の色データキー: {list(colors[0].keys())}")
-                logger.info(f"最初の色データ値: hex={colors[0].get('hex', 'なし')}, rgb={colors[0].get('rgb', 'なし')}")
+        # 抽出結果のデータ型と構造の詳細はデバッグ時のみ出力
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"色抽出結果データ型: {type(colors).__name__}")
+            if len(colors) > 0:
+                logger.debug(f"最初の色データ構造: {type(colors[0]).__name__}")
+                if isinstance(colors[0], dict):
+                    logger.debug(f"最初の色データキー: {list(colors[0].keys())}")
+                    logger.debug(f"最初の色データ値: hex={colors[0].get('hex', 'なし')}, rgb={colors[0].get('rgb', 'なし')}")
 
         # JavaScriptに返す際のデータ構造を修正（colors配列をcolorsプロパティの値とする）
         logger.debug(f"色抽出結果をJSに適した形式に変換: {len(colors)}色 → colors辞書プロパティ")
@@ -402,24 +1055,11 @@ def handle_extract_text(request_id: str, params: Dict[str, Any]):
         logger.info(f"テキスト抽出リクエスト受信: {request_id}")
 
         # パラメータを取得
-        image_data = None
-        # 複数の可能なキー名をチェック
-        for key in ['image_data', 'imageData', 'image']:
-            if key in params and params[key]:
-                image_data = params[key]
-                logger.info(f"受信パラメータのキー: {list(params.keys())}")
-                logger.info(f"画像データ形式: {type(image_data).__name__}")
-                logger.info(f"画像データサイズ: {len(image_data) if isinstance(image_data, str) else 'N/A'}")
-                logger.info(f"画像データプレビュー: {image_data[:50]}..." if isinstance(image_data, str) and len(image_data) > 50 else 'N/A')
-                break
-
+        logger.debug(f"受信パラメータのキー: {list(params.keys())}")
         options = params.get('options', {})
 
-        if not image_data:
-            raise ValueError("画像データが提供されていません")
-
-        # Base64データを画像に変換
-        image, _ = base64_to_image_data(image_data)
+        # 画像ハンドルまたは画像データから画像を取得
+        image, _ = get_request_image(params)
 
         # image_analyzer.pyのextract_text_from_image関数を呼び出す
         # オプションのimageを除外して衝突回避
@@ -427,24 +1067,26 @@ def handle_extract_text(request_id: str, params: Dict[str, Any]):
             logger.warning("[debug] options に 'image' が含まれているため除去します")
             options.pop('image')
 
-        text_result = image_analyzer.extract_text_from_image(image=image, **options)
-
-        # 抽出結果のデータ型と構造を詳細に検証
-        logger.info(f"テキスト抽出結果（生データ）: {type(text_result).__name__}")
-
+        text_result = cached_stage('text', request_image_hash(params, image), options,
+                                   lambda: image_analyzer.extract_text_from_image(image=image, **options))
+        # キャッシュ上の結果を書き換えないようコピーしてから整形する
         if isinstance(text_result, dict):
-            logger.info(f"テキスト結果キー: {list(text_result.keys())}")
+            text_result = dict(text_result)
+
+        # 抽出結果のデータ型・構造・内容の詳細はデバッグ時のみ出力
+        if logger.isEnabledFor(logging.DEBUG) and isinstance(text_result, dict):
+            logger.debug(f"テキスト結果キー: {list(text_result.keys())}")
 
             if 'text' in text_result:
-                logger.info(f"抽出テキスト: '{text_result['text']}'")
+                logger.debug(f"抽出テキスト: '{text_result['text']}'")
 
             if 'textBlocks' in text_result:
-                logger.info(f"テキストブロック数: {len(text_result['textBlocks'])}")
+                logger.debug(f"テキストブロック数: {len(text_result['textBlocks'])}")
                 if len(text_result['textBlocks']) > 0:
-                    logger.info(f"最初のブロック構造: {type(text_result['textBlocks'][0]).__name__}")
+                    logger.debug(f"最初のブロック構造: {type(text_result['textBlocks'][0]).__name__}")
                     if isinstance(text_result['textBlocks'][0], dict):
-                        logger.info(f"最初のブロックキー: {list(text_result['textBlocks'][0].keys())}")
-                        logger.info(f"最初のブロックテキスト: '{text_result['textBlocks'][0].get('text', 'なし')}'")
+                        logger.debug(f"最初のブロックキー: {list(text_result['textBlocks'][0].keys())}")
+                        logger.debug(f"最初のブロックテキスト: '{text_result['textBlocks'][0].get('text', 'なし')}'")
 
         # 必要なキーが存在することを確認
         if isinstance(text_result, dict):
@@ -475,14 +1117,10 @@ def handle_analyze_sections(request_id: str, params: Dict[str, Any]):
             raise ValueError("画像解析モジュールが初期化されていません")
 
         # パラメータを取得
-        image_data_base64 = params.get('image_data', '')
         options = params.get('options', {})
 
-        if not image_data_base64:
-            raise ValueError("画像データが提供されていません")
-
-        # Base64データを画像に変換
-        image, _ = base64_to_image_data(image_data_base64)
+        # 画像ハンドルまたは画像データから画像を取得
+        image, _ = get_request_image(params)
 
         # image_analyzer.pyのanalyze_sections関数を呼び出す
         # オプションのimageを除外して衝突回避
@@ -490,7 +1128,8 @@ def handle_analyze_sections(request_id: str, params: Dict[str, Any]):
             logger.warning("[debug] options に 'image' が含まれているため除去します")
             options.pop('image')
 
-        sections = image_analyzer.analyze_image_sections(image=image, **options)
+        sections = cached_stage('sections', request_image_hash(params, image), options,
+                                lambda: image_analyzer.analyze_image_sections(image=image, **options))
 
         send_response(request_id, sections)
 
@@ -506,14 +1145,10 @@ def handle_analyze_layout(request_id: str, params: Dict[str, Any]):
             raise ValueError("画像解析モジュールが初期化されていません")
 
         # パラメータを取得
-        image_data_base64 = params.get('image_data', '')
         options = params.get('options', {})
 
-        if not image_data_base64:
-            raise ValueError("画像データが提供されていません")
-
-        # Base64データを画像に変換
-        image, _ = base64_to_image_data(image_data_base64)
+        # 画像ハンドルまたは画像データから画像を取得
+        image, _ = get_request_image(params)
 
         # image_analyzer.pyのanalyze_layout_pattern関数を呼び出す
         # オプションのimageを除外して衝突回避
@@ -521,7 +1156,8 @@ def handle_analyze_layout(request_id: str, params: Dict[str, Any]):
             logger.warning("[debug] options に 'image' が含まれているため除去します")
             options.pop('image')
 
-        layout = image_analyzer.analyze_layout_pattern(image=image, **options)
+        layout = cached_stage('layout', request_image_hash(params, image), options,
+                              lambda: image_analyzer.analyze_layout_pattern(image=image, **options))
 
         send_response(request_id, layout)
 
@@ -537,14 +1173,10 @@ def handle_detect_main_sections(request_id: str, params: Dict[str, Any]):
             raise ValueError("画像解析モジュールが初期化されていません")
 
         # パラメータを取得
-        image_data_base64 = params.get('image_data', '')
         options = params.get('options', {})
 
-        if not image_data_base64:
-            raise ValueError("画像データが提供されていません")
-
-        # Base64データを画像に変換
-        image, _ = base64_to_image_data(image_data_base64)
+        # 画像ハンドルまたは画像データから画像を取得
+        image, _ = get_request_image(params)
 
         # オプションのimageを除外して衝突回避
         if 'image' in options:
@@ -568,14 +1200,10 @@ def handle_detect_card_elements(request_id: str, params: Dict[str, Any]):
             raise ValueError("画像解析モジュールが初期化されていません")
 
         # パラメータを取得
-        image_data_base64 = params.get('image_data', '')
         options = params.get('options', {})
 
-        if not image_data_base64:
-            raise ValueError("画像データが提供されていません")
-
-        # Base64データを画像に変換
-        image, _ = base64_to_image_data(image_data_base64)
+        # 画像ハンドルまたは画像データから画像を取得
+        image, _ = get_request_image(params)
 
         # image_analyzer.pyのdetect_card_elements関数を呼び出す
         # オプションのimageを除外して衝突回避
@@ -599,14 +1227,10 @@ def handle_detect_elements(request_id: str, params: Dict[str, Any]):
             raise ValueError("画像解析モジュールが初期化されていません")
 
         # パラメータを取得
-        image_data_base64 = params.get('image_data', '')
         options = params.get('options', {})
 
-        if not image_data_base64:
-            raise ValueError("画像データが提供されていません")
-
-        # Base64データを画像に変換
-        image, _ = base64_to_image_data(image_data_base64)
+        # 画像ハンドルまたは画像データから画像を取得
+        image, _ = get_request_image(params)
 
         # image_analyzer.pyのdetect_feature_elements関数を呼び出す
         # オプションのimageを除外して衝突回避
@@ -614,7 +1238,8 @@ def handle_detect_elements(request_id: str, params: Dict[str, Any]):
             logger.warning("[debug] options に 'image' が含まれているため除去します")
             options.pop('image')
 
-        elements = image_analyzer.detect_feature_elements(image=image, **options)
+        elements = cached_stage('elements', request_image_hash(params, image), options,
+                                lambda: image_analyzer.detect_feature_elements(image=image, **options))
 
         send_response(request_id, elements)
 
@@ -627,6 +1252,105 @@ def clean_options(options):
     """imageキーを除去した安全なoptionsを返す"""
     return {k: v for k, v in options.items() if k != 'image'}
 
+# analyze_allのステージ指定で受け付ける別名
+STAGE_ALIASES = {
+    'color': 'colors',
+    'ocr': 'text',
+    'section': 'sections',
+    'element': 'elements',
+}
+
+# ステージ → analyze_allの結果に含めるキー
+STAGE_RESULT_KEYS = {
+    'colors': ('colors',),
+    'text': ('text', 'textBlocks'),
+    'sections': ('sections',),
+    'layout': ('layout',),
+    'elements': ('elements',),
+}
+
+# ステージの選択に使うキー（結果キャッシュのキーには含めない）
+STAGE_SELECTION_KEYS = ('stages', 'type')
+
+def assemble_analysis_result(stage_results: Dict[str, Any], stage_names: List[str]) -> Dict[str, Any]:
+    """
+    ステージごとの結果をanalyze_allのレスポンス形式（colors, text, textBlocks, sections, layout, elements）に整える
+
+    指定されたステージの結果だけを返す（依存として計算しただけのステージは含めない）。
+    """
+    colors = stage_results.get('colors') or []
+
+    text_content = ''
+    text_blocks = []
+    text_result = stage_results.get('text')
+    if isinstance(text_result, dict):
+        text_content = text_result.get('text', '')
+        text_blocks = text_result.get('textBlocks', [])
+
+    sections = stage_results.get('sections')
+    if not isinstance(sections, dict):
+        sections = {'sections': []}
+
+    layout = stage_results.get('layout')
+    if not isinstance(layout, dict):
+        layout = {"width": 1200, "height": 800, "type": "standard"}
+
+    elements = stage_results.get('elements')
+    if isinstance(elements, list):
+        elements = {"elements": elements}
+    elif not isinstance(elements, dict):
+        elements = {"elements": []}
+
+    full_result = {
+        "colors": colors,
+        "text": text_content,
+        "textBlocks": text_blocks,
+        "sections": sections.get("sections", []),
+        "layout": layout,
+        "elements": elements.get("elements", []),
+    }
+    return {key: full_result[key] for stage in stage_names for key in STAGE_RESULT_KEYS[stage]}
+
+def has_analysis_content(result: Dict[str, Any], stage_names: List[str]) -> bool:
+    """解析結果に中身があるか（テキスト・色・要素のいずれか。これらを含まない指定の場合はそのステージの結果で判定）"""
+    checked_keys = [key for key in ("text", "colors", "elements") if key in result]
+    if not checked_keys:
+        checked_keys = [key for stage in stage_names for key in STAGE_RESULT_KEYS[stage]]
+    return any(result.get(key) for key in checked_keys)
+
+def resolve_requested_stages(params: Dict[str, Any], options: Dict[str, Any]) -> List[str]:
+    """
+    analyze_allで実行するステージを決定する
+
+    stages（配列またはカンマ区切り）を優先し、なければtypeを見る。typeが'all'や'compress'など
+    ステージ名でない場合は全ステージを実行する。依存するステージの中間結果は
+    AnalysisContextが必要に応じて計算するため、ここでは結果に含めるステージだけを返す。
+    """
+    all_stages = list(image_analyzer.ANALYSIS_STAGES)
+    explicit = params.get('stages', options.get('stages'))
+    requested = explicit if explicit is not None else params.get('type', options.get('type'))
+
+    if isinstance(requested, str):
+        requested = [name.strip() for name in requested.split(',') if name.strip()]
+    if not isinstance(requested, (list, tuple)):
+        return all_stages
+
+    selected = set()
+    unknown = []
+    for name in requested:
+        name = str(name).lower()
+        name = STAGE_ALIASES.get(name, name)
+        if name in all_stages:
+            selected.add(name)
+        elif name != 'all':
+            unknown.append(name)
+
+    if unknown and explicit is not None:
+        raise ValueError(f"不明なステージが指定されました: {unknown}（指定可能: {all_stages}）")
+    if not selected:
+        return all_stages
+    return [stage for stage in all_stages if stage in selected]
+
 def handle_analyze_all(request_id, params):
     try:
         logger.info(f"analyze_all処理開始: request_id={request_id}")
@@ -634,18 +1358,13 @@ def handle_analyze_all(request_id, params):
         if not image_analyzer:
             raise ValueError("画像解析モジュールが初期化されていません")
 
-        logger.info(f"[debug] 受信データ構造: キー={list(params.keys())}")
-        image_data = None
-        for key in ['image', 'image_data', 'imageData']:
-            if key in params and params[key]:
-                image_data = params[key]
-                logger.info(f"[debug] 画像データを'{key}'キーから取得")
-                break
+        logger.debug(f"受信データ構造: キー={list(params.keys())}")
+        has_image = has_request_image(params)
 
-        analysis_type = params.get('type', 'all')
         options = params.get('options', {})
+        requested_stages = resolve_requested_stages(params, options)
 
-        if not image_data:
+        if not has_image:
             logger.warning("[debug] 画像データが提供されていません - 空の結果を返します")
             empty_result = {
                 "colors": [],
@@ -661,104 +1380,120 @@ def handle_analyze_all(request_id, params):
             return
 
         try:
-            image, _ = base64_to_image_data(image_data)
+            image, _ = get_request_image(params)
             logger.info("[debug] 画像データのデコードに成功")
         except Exception as decode_err:
             logger.error(f"[debug] 画像デコード失敗: {str(decode_err)}")
             traceback.print_exc()
             raise ValueError(f"画像デコード失敗: {str(decode_err)}")
 
-        def analyze_all(image, options):
-            colors = []
-            text_content = ''
-            text_blocks = []
-            sections = {'sections': []}
-            layout = {"width": 1200, "height": 800, "type": "standard"}
-            elements = {"elements": []}
-
-            try:
-                colors = image_analyzer.extract_colors_from_image(image=image, **clean_options(options))
-            except Exception as e:
-                logger.error(f"[debug] 色抽出失敗: {str(e)}")
-
-            try:
-                text_result = image_analyzer.extract_text_from_image(image=image, **clean_options(options))
-                if isinstance(text_result, dict):
-                    text_content = text_result.get('text', '')
-                    text_blocks = text_result.get('textBlocks', [])
-            except Exception as e:
-                logger.error(f"[debug] テキスト抽出失敗: {str(e)}")
-
+        # ステージ単位の結果キャッシュのキー（cache=falseの場合はNone）
+        image_hash = request_image_hash(params, image)
+
+        # stream=trueの場合、各ステージの完了ごとに途中結果を送信する
+        stream = bool(params.get('stream'))
+        stage_names = requested_stages
+
+        completed_stages = []
+        completed_lock = threading.Lock()
+
+        def emit_partial(stage, stage_result):
+            if stream:
+                # ステージは並列に完了するため、completedは完了した順の件数
+                with completed_lock:
+                    completed_stages.append(stage)
+                    completed = len(completed_stages)
+                send_event(request_id, 'partial', stage=stage, result=stage_result,
+                           completed=completed, total=len(stage_names))
+
+        # deadline_msが指定されている場合、期限が近づいたら残りのステージをスキップして途中結果を返す
+        token = image_analyzer.current_cancel_token()
+        skipped_stages = []
+
+        # ステージ間で共有する中間結果（OCR、主要色、エッジなど）は1回だけ計算する
+        stage_options = {k: v for k, v in clean_options(options).items() if k not in STAGE_SELECTION_KEYS}
+        context = image_analyzer.AnalysisContext(image, stage_options,
+                                                 offload=stage_executor.offload if stage_executor else None)
+
+        def run_stage(stage):
+            """期限内であればステージを実行する（期限切れの場合はスキップしてNoneを返す）"""
+            if token is not None:
+                if token.cancelled:
+                    raise image_analyzer.AnalysisCancelled('cancelled')
+                if token.expired(DEADLINE_MARGIN_SECONDS):
+                    skipped_stages.append(stage)
+                    return None
             try:
-                sections = image_analyzer.analyze_image_sections(image=image, **clean_options(options))
-                if not isinstance(sections, dict):
-                    sections = {'sections': []}
-            except Exception as e:
-                logger.error(f"[debug] セクション抽出失敗: {str(e)}")
+                stage_result = cached_stage(stage, image_hash, stage_options, lambda: context.stage_result(stage))
+            except image_analyzer.AnalysisCancelled as cancelled:
+                if cancelled.reason != 'deadline':
+                    raise
+                skipped_stages.append(stage)
+                return None
+            # キャッシュから得た結果も後続ステージの入力として使う
+            context.provide(stage, stage_result)
+            emit_partial(stage, stage_result)
+            return stage_result
+
+        stage_labels = {
+            'colors': '色抽出',
+            'text': 'テキスト抽出',
+            'sections': 'セクション抽出',
+            'layout': 'レイアウト解析',
+            'elements': '要素検出',
+        }
 
+        def run_stage_safely(stage):
             try:
-                layout = image_analyzer.analyze_layout_pattern(image=image, **clean_options(options))
-                if not isinstance(layout, dict):
-                    layout = {"width": 1200, "height": 800, "type": "standard"}
+                return run_stage(stage)
             except Exception as e:
-                logger.error(f"[debug] レイアウト解析失敗: {str(e)}")
+                logger.error(f"[debug] {stage_labels.get(stage, stage)}失敗: {str(e)}")
+                return None
 
-            try:
-                elements = image_analyzer.detect_feature_elements(image=image, **clean_options(options))
-                if isinstance(elements, list):
-                    elements = {"elements": elements}
-                elif not isinstance(elements, dict):
-                    elements = {"elements": []}
-            except Exception as e:
-                logger.error(f"[debug] 要素検出失敗: {str(e)}")
+        def analyze_all(image, options):
+            # 依存関係のないステージは並列に実行する（共有の中間結果はcontextが1回だけ計算する）
+            if stage_executor is not None:
+                futures = {stage: stage_executor.submit(run_stage_safely, stage) for stage in stage_names}
+                stage_results = {stage: future.result() for stage, future in futures.items()}
+            else:
+                stage_results = {stage: run_stage_safely(stage) for stage in stage_names}
 
+            stage_output = assemble_analysis_result(stage_results, stage_names)
             return {
-                "colors": colors,
-                "text": text_content,
-                "textBlocks": text_blocks,
-                "sections": sections.get("sections", []),
-                "layout": layout,
-                "elements": elements.get("elements", []),
+                **stage_output,
                 "timestamp": datetime.now().isoformat(),
-                "status": "success"
+                "status": "partial" if skipped_stages else "success"
             }
 
         result = analyze_all(image, options)
-        # 中身がなさすぎる場合 fallback させる
-        if not result.get("text") and not result.get("colors") and not result.get("elements"):
+        if len(stage_names) < len(image_analyzer.ANALYSIS_STAGES):
+            result["stages"] = stage_names
+        if context.timings:
+            logger.info("analyze_allの中間結果を計算しました",
+                        extra={"timings_ms": {name: round(seconds * 1000, 1) for name, seconds in context.timings.items()}})
+        if image_hash:
+            result["cache_key"] = image_hash
+            # analyze_incrementalで変更箇所を判定できるよう、画像のフィンガープリントも保存しておく
+            cached_stage('fingerprint', image_hash, {}, lambda: image_analyzer.compute_image_fingerprint(image))
+        if skipped_stages:
+            skipped_stages.sort(key=stage_names.index)
+            logger.warning(f"期限が近いためステージをスキップしました: {skipped_stages}")
+            result["partial"] = True
+            result["skipped_stages"] = skipped_stages
+        # 中身がなさすぎる場合 fallback させる（ステージを指定した場合はそのステージの結果で判定する）
+        if not has_analysis_content(result, stage_names):
             result["success"] = False
             result["context"] = "fallback_from_analyzeAll"
             result["error"] = "画像分析エラー: 情報が取得できませんでした"
         else:
             result["success"] = True
 
-        try:
-            logger.error("✅✅✅ analyze_all結果の構造:")
-            logger.error(f"✅✅✅ 結果のキー: {list(result.keys() if result else [])}")
-            logger.error(f"✅✅✅ colors: {type(result.get('colors', []))} ({len(result.get('colors', []))}個)")
-            logger.error(f"✅✅✅ text: {type(result.get('text', ''))} ({len(result.get('text', ''))}文字)")
-            logger.error(f"✅✅✅ textBlocks: {type(result.get('textBlocks', []))} ({len(result.get('textBlocks', []))}個)")
-
-            # colorsの内容詳細
-            if result.get('colors'):
-                logger.error(f"✅✅✅ 最初の色: {result['colors'][0] if result['colors'] else 'なし'}")
-
-            # textBlocksの内容詳細
-            if result.get('textBlocks'):
-                logger.error(f"✅✅✅ 最初のテキストブロック: {result['textBlocks'][0] if result['textBlocks'] else 'なし'}")
-
-            json_dump = json.dumps(result, ensure_ascii=False, indent=2)
-            logger.error("✅✅✅ 結果JSON (一部):")
-            logger.error(json_dump[:1000] + ('...' if len(json_dump) > 1000 else ''))
-        except Exception as log_err:
-            logger.error(f"✅✅✅ 結果ログ出力エラー: {str(log_err)}")
-
-        try:
-            json_dump = json.dumps(result, ensure_ascii=False, indent=2)
-            logger.info("===== 最終送信データ (一部) =====")
-            logger.info(json_dump[:1000] + ('...' if len(json_dump) > 1000 else ''))
-        except Exception as json_err:
-            logger.error(f"[debug] JSONシリアライズエラー: {str(json_err)}")
+        # 結果の概要（件数のみ）を記録する。JSON全体はsend_responseで1回だけシリアライズする
+        logger.info(
+            f"analyze_all結果: colors={len(result.get('colors', []))}, "
+            f"text={len(result.get('text', ''))}文字, textBlocks={len(result.get('textBlocks', []))}, "
+            f"sections={len(result.get('sections', []))}, elements={len(result.get('elements', []))}"
+        )
 
         logger.info(f"analyze_all処理完了: request_id={request_id}")
         send_response(request_id, result)
@@ -778,6 +1513,344 @@ def handle_analyze_all(request_id, params):
             "error": str(e)
         }, f"総合分析エラー: {str(e)}")
 
+def _previous_stage_results(params: Dict[str, Any], previous_key: Optional[str],
+                            stage_options: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    analyze_incrementalの前回の解析結果をステージ単位の形式で返す
+
+    previous（analyze_allの結果）があればそれを使い、なければキャッシュキー（前回の画像ハッシュ）で
+    結果キャッシュから読み込む。揃わない場合はNone。
+    変更されていない領域の結果は前回の結果から引き継ぐため、ステージを絞った結果や期限切れの途中結果
+    （partial / skipped_stages）、エラーの結果は使わない（使うと変更領域以外の結果が失われる）。
+    """
+    previous = params.get('previous')
+    if isinstance(previous, dict) and previous:
+        missing = [key for stage in image_analyzer.ANALYSIS_STAGES for key in STAGE_RESULT_KEYS[stage]
+                   if key not in previous]
+        if missing or previous.get('partial') or previous.get('skipped_stages') or previous.get('error'):
+            logger.info(f"前回の解析結果が全ステージ揃っていないため使用しません: missing={missing}, "
+                        f"partial={bool(previous.get('partial'))}, skipped={previous.get('skipped_stages')}")
+            return None
+        return {
+            'colors': previous.get('colors', []),
+            'text': {'text': previous.get('text', ''), 'textBlocks': previous.get('textBlocks', [])},
+            'sections': {'sections': previous.get('sections', [])},
+            'layout': previous.get('layout', {}),
+            'elements': previous.get('elements', []),
+        }
+
+    if not previous_key:
+        return None
+    stages = {}
+    for stage in image_analyzer.ANALYSIS_STAGES:
+        value = analysis_cache.get(analysis_cache.make_key(stage, previous_key, stage_options))
+        if value is None:
+            logger.info(f"前回の解析結果がキャッシュにありません: stage={stage}")
+            return None
+        stages[stage] = value
+    return stages
+
+def _previous_fingerprint(params: Dict[str, Any], previous_key: Optional[str]) -> Optional[Dict[str, Any]]:
+    """前回の画像のフィンガープリントを、前回の画像またはキャッシュから取得する"""
+    if has_request_image(params, keys=('previous_image',), handle_key='previous_image_handle'):
+        previous_image, _ = get_request_image(params, keys=('previous_image',), handle_key='previous_image_handle')
+        return image_analyzer.compute_image_fingerprint(previous_image)
+    if previous_key:
+        return analysis_cache.get(analysis_cache.make_key('fingerprint', previous_key, {}))
+    return None
+
+def handle_analyze_incremental(request_id: str, params: Dict[str, Any]):
+    """
+    前回の解析結果を元に、画像の変更された領域だけを再解析する
+
+    前回の結果は previous（analyze_allの結果）または previous_cache_key（analyze_allの結果のcache_key）で、
+    変更箇所の判定に使う前回の画像は previous_image / previous_image_handle、またはキャッシュに保存した
+    フィンガープリントで指定する。前回の情報が揃わない場合や変更が大きい場合は analyze_all と同じ全体解析を行う。
+    """
+    try:
+        if not image_analyzer:
+            raise ValueError("画像解析モジュールが初期化されていません")
+        if not has_request_image(params):
+            raise ValueError("画像データが提供されていません")
+
+        image, _ = get_request_image(params)
+        options = params.get('options', {})
+        stage_options = {k: v for k, v in clean_options(options).items() if k not in STAGE_SELECTION_KEYS}
+
+        previous = params.get('previous') if isinstance(params.get('previous'), dict) else {}
+        previous_key = params.get('previous_cache_key') or previous.get('cache_key')
+        previous_stages = _previous_stage_results(params, previous_key, stage_options)
+        previous_fingerprint = _previous_fingerprint(params, previous_key)
+
+        fingerprint = image_analyzer.compute_image_fingerprint(image)
+        regions = None
+        if previous_stages is not None:
+            regions = image_analyzer.diff_fingerprints(previous_fingerprint, fingerprint)
+
+        height, width = image.shape[:2]
+        changed_area = sum((x1 - x0) * (y1 - y0) for x0, y0, x1, y1 in regions or [])
+        if regions is None or changed_area > width * height * image_analyzer.INCREMENTAL_MAX_CHANGED_RATIO:
+            reason = "前回の解析結果または画像がありません" if regions is None else "変更が大きいため"
+            logger.info(f"差分再解析を行わず全体を解析します（{reason}）")
+            handle_analyze_all(request_id, params)
+            return
+
+        results, stats = image_analyzer.analyze_incremental(image, previous_stages, regions, stage_options)
+        logger.info("差分再解析が完了しました", extra={
+            "changed_regions": len(regions),
+            "changed_ratio": stats['changed_ratio'],
+            "reused": stats['reused'],
+        })
+
+        # 次回の差分再解析や同じ画像の再解析で使えるよう、結果をキャッシュに保存する
+        image_hash = request_image_hash(params, image)
+        if image_hash:
+            for stage, value in results.items():
+                analysis_cache.put(analysis_cache.make_key(stage, image_hash, stage_options), value)
+            analysis_cache.put(analysis_cache.make_key('fingerprint', image_hash, {}), fingerprint)
+
+        elements = results['elements']
+        if isinstance(elements, dict):
+            elements = elements.get('elements', [])
+        result = {
+            "colors": results['colors'] or [],
+            "text": results['text'].get('text', ''),
+            "textBlocks": results['text'].get('textBlocks', []),
+            "sections": results['sections'].get('sections', []),
+            "layout": results['layout'],
+            "elements": elements,
+            "incremental": stats,
+            "timestamp": datetime.now().isoformat(),
+            "status": "success",
+            "success": True
+        }
+        if image_hash:
+            result["cache_key"] = image_hash
+        send_response(request_id, result)
+
+    except Exception as e:
+        logger.error(f"差分再解析中にエラーが発生しました: {str(e)}")
+        logger.error(traceback.format_exc())
+        send_response(request_id, None, f"差分再解析エラー: {str(e)}")
+
+def decode_batch_item(item: Any) -> Tuple[np.ndarray, List[Any]]:
+    """
+    analyze_batchの1件分の画像をデコードする
+
+    itemはBase64文字列、ファイルパス、または {'image_data' | 'image' | 'image_handle' | 'path' | 'shm', ...} の辞書。
+    戻り値は (画像, 解析後に解放するリソースのリスト)。
+    """
+    if isinstance(item, str) and not item.startswith('data:') and len(item) < 4096 and os.path.isfile(item):
+        item = {'path': item}
+
+    if isinstance(item, dict):
+        handle = item.get('image_handle')
+        if handle is not None:
+            # プロセスモードではディスパッチャーがハンドルを画像に解決して渡す
+            return (handle if isinstance(handle, np.ndarray) else image_store.get(handle)), []
+        source = next((item[key] for key in IMAGE_PARAM_KEYS if item.get(key) is not None), item)
+    else:
+        source = item
+
+    image, _ = base64_to_image_data(source)
+    if image is None:
+        raise ValueError("画像をデコードできませんでした")
+
+    # 共有メモリなどはこのスレッドではなく、解析を終えたワーカーが解放する
+    resources = getattr(_request_resources, 'items', None) or []
+    _request_resources.items = []
+    return image, resources
+
+def analyze_image_stages(image: np.ndarray, stage_names: List[str], stage_options: Dict[str, Any],
+                         image_hash: Optional[str]) -> Dict[str, Any]:
+    """1枚の画像の指定されたステージを順に実行し、analyze_allと同じ形式の結果を返す（ストリーミング・期限処理なし）"""
+    context = image_analyzer.AnalysisContext(image, stage_options)
+    stage_results = {}
+    for stage in stage_names:
+        image_analyzer.check_cancelled()
+        try:
+            stage_results[stage] = cached_stage(stage, image_hash, stage_options, lambda: context.stage_result(stage))
+            context.provide(stage, stage_results[stage])
+        except Exception as e:
+            logger.error(f"ステージの実行に失敗しました: stage={stage}, error={str(e)}")
+    result = assemble_analysis_result(stage_results, stage_names)
+    if image_hash:
+        result["cache_key"] = image_hash
+    return result
+
+def resolve_batch_workers(value: Any) -> int:
+    """
+    analyze_batchの解析ワーカー数を決める
+
+    未指定の場合はステージ並列数（なければDEFAULT_WORKERS）を使う。1リクエストで大量のスレッドを
+    作らないよう、ステージ並列数（なければコア数）を上限にする。不正な値はValueError。
+    """
+    limit = stage_executor.threads if stage_executor else max(1, os.cpu_count() or 1)
+    if value is None:
+        return min(stage_executor.threads if stage_executor else DEFAULT_WORKERS, limit)
+    message = f"workers には1以上の整数を指定してください: {value!r}"
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise ValueError(message)
+    if isinstance(value, float) and not value.is_integer():
+        raise ValueError(message)
+    try:
+        workers = int(value)
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError(message) from None
+    if workers < 1:
+        raise ValueError(message)
+    if workers > limit:
+        logger.warning(f"workers={workers} は上限を超えているため {limit} に制限します")
+        workers = limit
+    return workers
+
+def handle_analyze_batch(request_id: str, params: Dict[str, Any]):
+    """
+    複数の画像をまとめて解析する
+
+    images の各要素（Base64文字列・ファイルパス・画像参照の辞書）を、デコード用スレッドで先行して
+    デコードしながら解析ワーカーで並列に解析する。stream=true（既定）の場合は1件ごとに
+    itemイベントで結果を送信し、最後のレスポンスには件数と処理速度（images/s）を返す。
+    各画像の識別子は item_id で返す（イベントの id はリクエストIDのため上書きしない）。
+    deadline_msの期限を過ぎた画像とそれ以降の画像はskippedとし、解析済みの結果は返す。
+    """
+    try:
+        if not image_analyzer:
+            raise ValueError("画像解析モジュールが初期化されていません")
+
+        items = params.get('images')
+        if not isinstance(items, list) or not items:
+            raise ValueError("images に解析する画像のリストを指定してください")
+
+        options = params.get('options', {})
+        stage_names = resolve_requested_stages(params, options)
+        stage_options = {k: v for k, v in clean_options(options).items() if k not in STAGE_SELECTION_KEYS}
+        stream = params.get('stream', True) is not False
+        use_cache = params.get('cache', True) is not False
+        workers = resolve_batch_workers(params.get('workers'))
+        total = len(items)
+        token = image_analyzer.current_cancel_token()
+
+        logger.info(f"analyze_batch処理開始: {total}件, ワーカー数={workers}")
+        started = time.perf_counter()
+        results = [None] * total
+        counters = {"completed": 0, "failed": 0, "skipped": 0}
+        counters_lock = threading.Lock()
+        window = threading.BoundedSemaphore(workers * BATCH_PREFETCH_PER_WORKER)
+
+        def item_id(index):
+            item = items[index]
+            return item.get('id', index) if isinstance(item, dict) else index
+
+        def skip_item(entry, decoded):
+            entry.pop("result", None)
+            entry["status"] = "skipped"
+            entry["error"] = "期限が近いため解析しませんでした"
+            # 開始前のデコードは取り消し、デコード済みの場合は共有メモリなどを解放する
+            if decoded is not None and not decoded.cancel():
+                try:
+                    return decoded.result()[1]
+                except Exception:
+                    pass
+            return []
+
+        def analyze_item(index, decoded):
+            entry = {"index": index, "item_id": item_id(index)}
+            resources = []
+            try:
+                if token is not None and token.expired(DEADLINE_MARGIN_SECONDS):
+                    resources = skip_item(entry, decoded)
+                else:
+                    item_started = time.perf_counter()
+                    image, resources = decoded.result()
+                    image_hash = compute_image_hash(image) if use_cache else None
+                    entry["result"] = analyze_image_stages(image, stage_names, stage_options, image_hash)
+                    del image
+                    entry["status"] = "success" if has_analysis_content(entry["result"], stage_names) else "empty"
+                    entry["elapsed_ms"] = round((time.perf_counter() - item_started) * 1000, 1)
+            except image_analyzer.AnalysisCancelled as cancelled:
+                # 期限切れはこの画像だけをskippedにして、解析済みの結果は返す（キャンセルはバッチ全体を中断する）
+                if cancelled.reason != 'deadline':
+                    raise
+                logger.warning(f"期限切れのためバッチ内の画像の解析を中断しました: index={index}")
+                skip_item(entry, None)
+            except Exception as e:
+                logger.error(f"バッチ内の画像の解析に失敗しました: index={index}, error={str(e)}")
+                entry["status"] = "error"
+                entry["error"] = str(e)
+            finally:
+                window.release()
+                if resources:
+                    _request_resources.items = list(resources)
+                    release_request_resources()
+
+            with counters_lock:
+                counters["completed"] += 1
+                if entry["status"] == "error":
+                    counters["failed"] += 1
+                elif entry["status"] == "skipped":
+                    counters["skipped"] += 1
+                completed = counters["completed"]
+
+            if stream:
+                # entryにはidを含めない（イベントのidはリクエストIDで、JS側の対応付けに使われる）
+                send_event(request_id, 'item', completed=completed, total=total, **entry)
+                entry.pop("result", None)
+            results[index] = entry
+
+        # デコードと解析をパイプライン化する（デコード済みで待機する画像の数はwindowで制限する）
+        decode_pool = ThreadPoolExecutor(max_workers=DEFAULT_BATCH_DECODE_THREADS, thread_name_prefix='batch_decode')
+        analysis_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='batch_worker')
+        try:
+            futures = []
+            for index, item in enumerate(items):
+                window.acquire()
+                if token is not None and token.cancelled:
+                    window.release()
+                    break
+                # 期限を過ぎた後の画像はデコードせずにskippedとする
+                if token is not None and token.expired(DEADLINE_MARGIN_SECONDS):
+                    decoded = None
+                else:
+                    decoded = decode_pool.submit(contextvars.copy_context().run, decode_batch_item, item)
+                futures.append(analysis_pool.submit(contextvars.copy_context().run, analyze_item, index, decoded))
+            for future in futures:
+                future.result()
+        finally:
+            analysis_pool.shutdown(wait=True)
+            decode_pool.shutdown(wait=True)
+
+        if token is not None and token.cancelled:
+            raise image_analyzer.AnalysisCancelled('cancelled')
+
+        elapsed = time.perf_counter() - started
+        analyzed = counters["completed"] - counters["failed"] - counters["skipped"]
+        summary = {
+            "total": total,
+            "completed": counters["completed"],
+            "succeeded": analyzed,
+            "failed": counters["failed"],
+            "skipped": counters["skipped"],
+            "elapsed_ms": round(elapsed * 1000, 1),
+            "images_per_second": round(analyzed / elapsed, 3) if elapsed > 0 else 0.0,
+            "workers": workers,
+            "items": results,
+            "timestamp": datetime.now().isoformat(),
+            "success": counters["failed"] < total,
+        }
+        if counters["skipped"]:
+            summary["partial"] = True
+        logger.info("analyze_batch処理完了", extra={
+            "total": total, "failed": counters["failed"], "skipped": counters["skipped"],
+            "images_per_second": summary["images_per_second"],
+        })
+        send_response(request_id, summary)
+
+    except Exception as e:
+        logger.error(f"バッチ解析中にエラーが発生しました: {str(e)}")
+        logger.error(traceback.format_exc())
+        send_response(request_id, None, f"バッチ解析エラー: {str(e)}")
+
 def handle_compress_analysis(request_id: str, params: Dict[str, Any]):
     """画像解析結果を圧縮して重要な情報だけを抽出する"""
     try:
@@ -792,16 +1865,13 @@ def handle_compress_analysis(request_id: str, params: Dict[str, Any]):
             raise ValueError("解析データが提供されていません")
 
         # 圧縮処理を実行
-        logger.info("!!!!! 圧縮処理の直前 !!!!!")
-        logger.error("!!!!! 圧縮処理の直前 !!!!!")  # errorレベルにして確実に出力
         compressed_data = image_analyzer.compress_analysis_results(analysis_data, options)
-        logger.info("!!!!! 圧縮処理の直後 !!!!!")
-        logger.error("!!!!! 圧縮処理の直後 !!!!!")  # errorレベルにして確実に出力
 
-        # デバッグ: 圧縮データの全容をログに出力
-        logger.info("===== 圧縮・構造化データの全容 (compress_analysis) =====")
-        logger.info(json.dumps(compressed_data, ensure_ascii=False, default=str))
-        logger.info("===== 圧縮・構造化データの出力終了 =====")
+        # デバッグ: 圧縮データの全容をログに出力（DEBUGレベルが有効な場合のみシリアライズする）
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("===== 圧縮・構造化データの全容 (compress_analysis) =====")
+            logger.debug(dumps_json(compressed_data).decode('utf-8'))
+            logger.debug("===== 圧縮・構造化データの出力終了 =====")
 
         # タイムスタンプを追加
         if 'timestamp' not in compressed_data:
@@ -820,16 +1890,9 @@ def handle_compare_images(request_id: str, params: Dict[str, Any]):
         if not image_analyzer:
             raise ValueError("画像解析モジュールが初期化されていません")
 
-        # パラメータを取得
-        original_image_data = params.get('original_image', '')
-        rendered_image_data = params.get('rendered_image', '')
-
-        if not original_image_data or not rendered_image_data:
-            raise ValueError("画像データが提供されていません")
-
-        # Base64データを画像に変換
-        original_image, _ = base64_to_image_data(original_image_data)
-        rendered_image, _ = base64_to_image_data(rendered_image_data)
+        # 画像ハンドルまたは画像データから画像を取得
+        original_image, _ = get_request_image(params, keys=('original_image',), handle_key='original_image_handle')
+        rendered_image, _ = get_request_image(params, keys=('rendered_image',), handle_key='rendered_image_handle')
 
         # 画像比較を実行
         comparison_result = image_analyzer.compare_images(original_image, rendered_image)
@@ -854,28 +1917,87 @@ def handle_compare_images(request_id: str, params: Dict[str, Any]):
         send_response(request_id, None, f"画像比較エラー: {str(e)}")
 
 def handle_exit(request_id: str, params: Dict[str, Any]):
-    """Pythonサーバーを終了する"""
+    """
+    Pythonサーバーを終了する
+
+    メインスレッドで実行され、レスポンスを返した後にmain()のループが終了処理を行う
+    （待機中のリクエストは取り消し、実行中のリクエストにはキャンセルを要求する）。
+    """
     try:
         logger.info("サーバー終了コマンドを受信しました")
         send_response(request_id, {"status": "shutting_down"})
 
-        # 非同期に終了するためのタイマー関数
-        def delayed_exit():
-            logger.info("終了処理を実行します...")
-            # 少し待ってから終了
-            time.sleep(0.5)
-            sys.exit(0)
-
-        exit_timer = threading.Timer(1, delayed_exit)
-        exit_timer.daemon = True
-        exit_timer.start()
-
     except Exception as e:
         logger.error(f"終了処理中にエラーが発生しました: {str(e)}")
         send_response(request_id, None, f"終了処理エラー: {str(e)}")
-        # エラーが発生しても1秒後に終了
-        time.sleep(1)
-        sys.exit(1)
+
+def handle_negotiate_protocol(request_id: str, params: Dict[str, Any]):
+    """
+    入力プロトコルを切り替える
+
+    クライアントはこのコマンドのレスポンスを受け取ってから、新しいプロトコルで
+    次のリクエストを送信する。レスポンスは常に1行1JSONで送信される。
+    """
+    global input_protocol
+
+    try:
+        protocol = params.get('protocol', 'line')
+        if protocol not in SUPPORTED_PROTOCOLS:
+            raise ValueError(f"未対応のプロトコルです: {protocol}")
+
+        input_protocol = protocol
+        logger.info(f"入力プロトコルを切り替えました: {protocol}")
+
+        send_response(request_id, {
+            "protocol": protocol,
+            "supported_protocols": list(SUPPORTED_PROTOCOLS),
+            "frame_length_size": FRAME_LENGTH_SIZE,
+            "timestamp": datetime.now().isoformat()
+        })
+
+    except Exception as e:
+        logger.error(f"プロトコル切り替え中にエラーが発生しました: {str(e)}")
+        send_response(request_id, None, f"プロトコル切り替えエラー: {str(e)}")
+
+def handle_cancel(request_id: str, params: Dict[str, Any]):
+    """処理中または待機中のリクエストをキャンセルする（target_idでリクエストIDを指定）"""
+    try:
+        target_id = params.get('target_id')
+        if not target_id:
+            raise ValueError("target_idが指定されていません")
+
+        state = dispatcher.cancel(target_id) if dispatcher else 'not_found'
+        logger.info(f"キャンセル要求: target_id={target_id}, state={state}")
+
+        send_response(request_id, {
+            "target_id": target_id,
+            "cancelled": state == 'cancelled',
+            "state": state
+        })
+
+    except Exception as e:
+        logger.error(f"キャンセル処理中にエラーが発生しました: {str(e)}")
+        send_response(request_id, None, f"キャンセルエラー: {str(e)}")
+
+def handle_server_stats(request_id: str, params: Dict[str, Any]):
+    """スケジューラーのキューの深さ・待ち時間や、キャッシュの利用状況を返す"""
+    try:
+        result = {
+            "scheduler": dispatcher.stats() if dispatcher else None,
+            "stages": stage_executor.stats() if stage_executor else None,
+            "ocr_pool": ocr_pool.stats() if ocr_pool else None,
+            "ocr": image_analyzer.easyocr_stats() if image_analyzer else None,
+            "tesseract": image_analyzer.tesseract_stats() if image_analyzer else None,
+            "image_store": image_store.stats(),
+            "analysis_cache": analysis_cache.stats(),
+            "ocr_tile_cache": ocr_tile_cache.stats(),
+            "timestamp": datetime.now().isoformat()
+        }
+        send_response(request_id, result)
+
+    except Exception as e:
+        logger.error(f"サーバー統計の取得中にエラーが発生しました: {str(e)}")
+        send_response(request_id, None, f"サーバー統計エラー: {str(e)}")
 
 def handle_check_memory(request_id: str, params: Dict[str, Any]):
     """Pythonプロセスのメモリ使用状況をチェックする"""
@@ -902,6 +2024,9 @@ def handle_check_memory(request_id: str, params: Dict[str, Any]):
             "virtual_memory_mb": round(vms_mb, 2),
             "gc_objects_collected": collected,
             "restart_needed": restart_needed,
+            "image_store": image_store.stats(),
+            "analysis_cache": analysis_cache.stats(),
+            "ocr_tile_cache": ocr_tile_cache.stats(),
             "timestamp": datetime.now().isoformat()
         }
 
@@ -941,14 +2066,436 @@ COMMAND_HANDLERS = {
     "detect_card_elements": handle_detect_card_elements,
     "detect_elements": handle_detect_elements,
     "analyze_all": handle_analyze_all,
+    "analyze_incremental": handle_analyze_incremental,
+    "analyze_batch": handle_analyze_batch,
     "compress_analysis": handle_compress_analysis,
     "compare_images": handle_compare_images,
     "check_memory": handle_check_memory,
+    "negotiate_protocol": handle_negotiate_protocol,
+    "register_image": handle_register_image,
+    "release_image": handle_release_image,
+    "cancel": handle_cancel,
+    "server_stats": handle_server_stats,
     "exit": handle_exit
 }
 
+# ワーカープールを経由せず、読み取りスレッド上で直接実行するコマンド
+# （negotiate_protocolは次のリクエストを読む前にプロトコルを切り替える必要がある）
+# （cancelは実行中のリクエストより先に処理されなければ意味がない）
+INLINE_COMMANDS = {"exit", "negotiate_protocol", "cancel"}
+
+# コマンドの優先度クラス（未登録のコマンドはheavyとして扱う）
+PRIORITY_CONTROL = 'control'
+PRIORITY_LIGHT = 'light'
+PRIORITY_HEAVY = 'heavy'
+PRIORITY_CLASSES = (PRIORITY_CONTROL, PRIORITY_LIGHT, PRIORITY_HEAVY)
+
+COMMAND_PRIORITIES = {
+    "check_environment": PRIORITY_CONTROL,
+    "setup_environment": PRIORITY_CONTROL,
+    "check_memory": PRIORITY_CONTROL,
+    "server_stats": PRIORITY_CONTROL,
+    "release_image": PRIORITY_CONTROL,
+    "extract_colors": PRIORITY_LIGHT,
+    "register_image": PRIORITY_LIGHT,
+    "compress_analysis": PRIORITY_LIGHT,
+    "extract_text": PRIORITY_HEAVY,
+    "analyze_sections": PRIORITY_HEAVY,
+    "analyze_layout": PRIORITY_HEAVY,
+    "detect_main_sections": PRIORITY_HEAVY,
+    "detect_card_elements": PRIORITY_HEAVY,
+    "detect_elements": PRIORITY_HEAVY,
+    "analyze_all": PRIORITY_HEAVY,
+    "compare_images": PRIORITY_HEAVY,
+}
+
+def _initialize_worker_process(log_queue=None, debug: bool = False, threads: Optional[int] = None,
+                               warmup_ocr: bool = False):
+    """プロセスワーカーの初期化（ログを親プロセスのキューへ送り、画像解析モジュールを読み込む）"""
+    global stage_executor, ocr_pool
+    if log_queue is not None:
+        # 親プロセスのキューへ送るQueueHandlerだけを設定する（ワーカーではログファイルを開かない）
+        setup_logging(debug=debug, log_queue=log_queue)
+    else:
+        logging.getLogger().addHandler(logging.NullHandler())
+    # 親プロセスから引き継いだプールは使えないため、ワーカー内ではステージや帯のOCRを順に実行する
+    stage_executor = None
+    ocr_pool = None
+    initialize_image_analyzer(reload=True)
+    if threads and image_analyzer:
+        image_analyzer.configure_native_threads(threads)
+    if warmup_ocr and image_analyzer:
+        # ワーカーごとにOCRモデルを読み込んでおき、以降の呼び出しで使い回す
+        image_analyzer.warmup_easyocr(background=True)
+
+def create_process_pool(max_workers: int, threads: Optional[int] = None, warmup_ocr: bool = False):
+    """
+    画像解析モジュールを読み込んだワーカープロセスのプールを作成する
+
+    ワーカープロセスのログはキュー経由で親プロセスのリスナーがまとめて書き込む。
+    戻り値は (プール, ログリスナー)。
+    """
+    log_queue = multiprocessing.Queue()
+    listener = start_log_listener(log_queue)
+    pool = ProcessPoolExecutor(
+        max_workers=max_workers,
+        initializer=_initialize_worker_process,
+        initargs=(log_queue, logger.isEnabledFor(logging.DEBUG), threads or native_threads, warmup_ocr),
+    )
+    return pool, listener
+
+def _compute_analysis_node(name: str, image, values: Dict[str, Any], options: Dict[str, Any]):
+    """プロセスプール内で解析ノードを1つ計算する"""
+    return image_analyzer.compute_analysis_node(name, image, values, options)
+
+def _extract_strip_text(strip, quality: Optional[str], mode: Optional[str]):
+    """プロセスプール内で帯を1つOCRする"""
+    return image_analyzer.extract_text(strip, tile_height=0, quality=quality, mode=mode)
+
+class OcrProcessPool:
+    """
+    縦長画像の帯を並列にOCRするプロセスプール
+
+    EasyOCRの推論は1回の呼び出しでほぼ1コアしか使わないため、帯ごとに別プロセスでOCRする。
+    各ワーカーは起動時にOCRモデルを読み込み、以降の帯で使い回す。
+    """
+
+    def __init__(self, processes: int):
+        self.processes = max(1, int(processes))
+        # ワーカー同士でコアを取り合わないよう、ネイティブスレッドをコア数で分け合う
+        self.threads = max(1, (os.cpu_count() or 2) // self.processes)
+        self.pool, self._log_listener = create_process_pool(self.processes, threads=self.threads, warmup_ocr=True)
+        self._lock = threading.Lock()
+        self._submitted = 0
+
+    def submit(self, strip, quality, mode):
+        """帯のOCRを投入する（image_analyzer.configure_ocr_offloadに渡す関数）"""
+        with self._lock:
+            self._submitted += 1
+        return self.pool.submit(_extract_strip_text, strip, quality, mode)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "processes": self.processes,
+                "native_threads": self.threads,
+                "submitted": self._submitted,
+            }
+
+    def shutdown(self, wait: bool = True):
+        self.pool.shutdown(wait=wait)
+        self._log_listener.stop()
+
+class StageExecutor:
+    """
+    analyze_allの独立したステージを並列に実行するプール
+
+    ステージはスレッドプールで実行する（OpenCV・numpy・PyTorchの処理はGILを解放する）。
+    mode='process'の場合、GIL依存のノードはプロセスプールで計算する。
+    """
+
+    def __init__(self, threads: int = DEFAULT_STAGE_THREADS, mode: str = DEFAULT_STAGE_MODE):
+        self.threads = max(1, int(threads))
+        self.mode = mode if mode in ('thread', 'process') else DEFAULT_STAGE_MODE
+        self.thread_pool = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix='stage_worker')
+        self.process_pool = None
+        self._log_listener = None
+        if self.mode == 'process':
+            self.process_pool, self._log_listener = create_process_pool(self.threads)
+        self._lock = threading.Lock()
+        self._submitted = 0
+        self._offloaded = 0
+
+    def submit(self, func, *args):
+        """ステージを投入する（キャンセルトークンやリクエストIDのcontextvarsを引き継ぐ）"""
+        with self._lock:
+            self._submitted += 1
+        return self.thread_pool.submit(contextvars.copy_context().run, func, *args)
+
+    @property
+    def offload(self):
+        """AnalysisContextに渡すoffload関数（スレッドモードではNone）"""
+        return self._offload if self.process_pool is not None else None
+
+    def _offload(self, name, image, values, options):
+        with self._lock:
+            self._offloaded += 1
+        return self.process_pool.submit(_compute_analysis_node, name, image, values, options).result()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "threads": self.threads,
+                "mode": self.mode,
+                "native_threads": native_threads,
+                "submitted": self._submitted,
+                "offloaded": self._offloaded,
+            }
+
+    def shutdown(self, wait: bool = True):
+        self.thread_pool.shutdown(wait=wait)
+        if self.process_pool is not None:
+            self.process_pool.shutdown(wait=wait)
+            self._log_listener.stop()
+
+def run_handler(command: str, request_id: str, request: Dict[str, Any], token=None):
+    """
+    コマンドハンドラーを実行し、リクエストで使ったリソースを解放する
+
+    解析処理はキャンセルトークンのスコープ内で実行され、cancelコマンドや
+    deadline_msの期限切れで中断された場合はエラーレスポンスを返す。
+    """
+    request_id_token = current_request_id.set(str(request_id))
+    try:
+        if image_analyzer is None:
+            COMMAND_HANDLERS[command](request_id, request)
+            return
+
+        if token is None:
+            token = image_analyzer.CancelToken(request.get('_deadline_at'))
+        try:
+            with image_analyzer.cancellation_scope(token):
+                COMMAND_HANDLERS[command](request_id, request)
+        except image_analyzer.AnalysisCancelled as cancelled:
+            if cancelled.reason == 'deadline':
+                logger.warning(f"期限切れのため処理を中断しました: request_id={request_id}")
+                send_response(request_id, None, "処理が期限（deadline_ms）内に完了しませんでした")
+            else:
+                logger.info(f"キャンセルされたため処理を中断しました: request_id={request_id}")
+                send_response(request_id, None, "リクエストはキャンセルされました")
+    finally:
+        release_request_resources()
+        current_request_id.reset(request_id_token)
+
+def _run_handler_isolated(command: str, request_id: str, request: Dict[str, Any]) -> List[bytes]:
+    """プロセスワーカー内でハンドラーを実行し、送信すべきレスポンス行を返す"""
+    global _response_sink
+    _response_sink = []
+    try:
+        run_handler(command, request_id, request)
+        return _response_sink
+    finally:
+        _response_sink = None
+
+def _resolve_image_handles(request: Dict[str, Any]) -> Dict[str, Any]:
+    """リクエスト中の画像ハンドル（*_handle）を画像ストアの画像に置き換えたコピーを返す"""
+    resolved = dict(request)
+    for key, value in request.items():
+        if key.endswith('_handle') and isinstance(value, str):
+            resolved[key] = image_store.get(value)
+    # analyze_batchの画像リスト内のハンドルも解決する
+    if isinstance(request.get('images'), list):
+        resolved['images'] = [
+            {**item, 'image_handle': image_store.get(item['image_handle'])}
+            if isinstance(item, dict) and isinstance(item.get('image_handle'), str) else item
+            for item in request['images']
+        ]
+    return resolved
+
+class RequestDispatcher:
+    """
+    受信したリクエストを優先度クラスごとのキューに振り分けて実行するディスパッチャー
+
+    優先度クラス:
+        control: 専用スレッドで実行する制御系コマンド（check_memory, server_statsなど）
+        light:   軽量な解析（extract_colorsなど）。専用の軽量レーンと汎用ワーカーの両方で処理する
+        heavy:   OCRを伴う重い解析（analyze_allなど）。汎用ワーカーでのみ処理する
+
+    汎用ワーカーは常にlightをheavyより優先して取り出すため、軽量な問い合わせがOCRの後ろで
+    待たされることはない。レスポンスは完了した順に送信される（JS側はidで対応付ける）。
+    mode='process' ではheavyのハンドラーをプロセスプール上で実行し、結果行を親プロセスから送信する。
+    """
+
+    def __init__(self, workers: int = DEFAULT_WORKERS, mode: str = DEFAULT_WORKER_MODE):
+        self.workers = max(1, int(workers))
+        self.mode = mode if mode in ('thread', 'process') else DEFAULT_WORKER_MODE
+        self.process_pool = None
+        if self.mode == 'process':
+            self.process_pool, self._worker_log_listener = create_process_pool(self.workers)
+        self.started_at = time.time()
+
+        self._queues = {priority: deque() for priority in PRIORITY_CLASSES}
+        self._running = {priority: 0 for priority in PRIORITY_CLASSES}
+        self._stats = {priority: {"completed": 0, "total_wait": 0.0, "max_wait": 0.0} for priority in PRIORITY_CLASSES}
+        self._in_flight = {}
+        self._tokens = {}  # request_id → CancelToken
+        self._condition = threading.Condition()
+        self._shutting_down = False
+
+        # 汎用ワーカー（light → heavy の順に取り出す）、軽量レーン、制御レーン
+        lanes = [(f'request_worker_{i}', (PRIORITY_LIGHT, PRIORITY_HEAVY)) for i in range(self.workers)]
+        lanes.append(('light_worker', (PRIORITY_LIGHT,)))
+        lanes.append(('control_worker', (PRIORITY_CONTROL,)))
+        self._threads = []
+        for name, priorities in lanes:
+            thread = threading.Thread(target=self._worker_loop, args=(priorities,), name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+        logger.info(f"リクエストディスパッチャーを初期化しました: mode={self.mode}, workers={self.workers}")
+
+    def submit(self, request_id: str, command: str, request: Dict[str, Any]):
+        """リクエストを優先度クラスのキューに投入する"""
+        if command in INLINE_COMMANDS:
+            self._run(request_id, command, request)
+            return
+
+        # deadline_msは受信時点からの相対時間として扱う（プロセス間でも使えるようエポック秒に変換）
+        deadline_ms = request.get('deadline_ms')
+        if deadline_ms:
+            request['_deadline_at'] = time.time() + float(deadline_ms) / 1000.0
+
+        priority = COMMAND_PRIORITIES.get(command, PRIORITY_HEAVY)
+        with self._condition:
+            self._in_flight[request_id] = command
+            if image_analyzer is not None:
+                self._tokens[request_id] = image_analyzer.CancelToken(request.get('_deadline_at'))
+            self._queues[priority].append((time.monotonic(), request_id, command, request))
+            self._condition.notify_all()
+
+    def cancel(self, request_id: str) -> str:
+        """
+        リクエストのキャンセルを要求する
+
+        Returns:
+            'cancelled'（キャンセルを要求した）または 'not_found'（完了済み・不明なID）
+            プロセスモードでは実行中のリクエストは中断できず、開始前のものだけが取り消される。
+        """
+        with self._condition:
+            token = self._tokens.get(request_id)
+        if token is None:
+            return 'not_found'
+        token.cancel()
+        return 'cancelled'
+
+    def in_flight(self) -> Dict[str, str]:
+        """処理中・待機中のリクエスト（id → コマンド名）を返す"""
+        with self._condition:
+            return dict(self._in_flight)
+
+    def stats(self) -> Dict[str, Any]:
+        """優先度クラスごとのキューの深さ・実行数・待ち時間を返す"""
+        with self._condition:
+            classes = {}
+            for priority in PRIORITY_CLASSES:
+                stats = self._stats[priority]
+                completed = stats["completed"]
+                classes[priority] = {
+                    "queued": len(self._queues[priority]),
+                    "running": self._running[priority],
+                    "completed": completed,
+                    "avg_wait_ms": round(stats["total_wait"] / completed * 1000, 2) if completed else 0.0,
+                    "max_wait_ms": round(stats["max_wait"] * 1000, 2)
+                }
+            return {
+                "mode": self.mode,
+                "workers": self.workers,
+                "uptime_sec": round(time.time() - self.started_at, 1),
+                "in_flight": len(self._in_flight),
+                "classes": classes
+            }
+
+    def _next_task(self, priorities: Tuple[str, ...]):
+        """担当する優先度クラスの中から、優先度の高い順に次のタスクを取り出す"""
+        for priority in priorities:
+            if self._queues[priority]:
+                return priority, self._queues[priority].popleft()
+        return None, None
+
+    def _worker_loop(self, priorities: Tuple[str, ...]):
+        """ワーカースレッドのメインループ"""
+        while True:
+            with self._condition:
+                priority, task = self._next_task(priorities)
+                while task is None:
+                    if self._shutting_down:
+                        return
+                    self._condition.wait()
+                    priority, task = self._next_task(priorities)
+
+                enqueued_at, request_id, command, request = task
+                wait = time.monotonic() - enqueued_at
+                self._running[priority] += 1
+
+            try:
+                self._run(request_id, command, request, priority)
+            finally:
+                with self._condition:
+                    self._running[priority] -= 1
+                    stats = self._stats[priority]
+                    stats["completed"] += 1
+                    stats["total_wait"] += wait
+                    stats["max_wait"] = max(stats["max_wait"], wait)
+
+    def _run(self, request_id: str, command: str, request: Dict[str, Any], priority: str = PRIORITY_CONTROL):
+        """ハンドラーを実行する（ワーカースレッド上で呼ばれる）"""
+        with self._condition:
+            token = self._tokens.get(request_id)
+        try:
+            # 待機中にキャンセルされた、または期限を過ぎたリクエストは実行しない
+            if token is not None and (token.cancelled or token.expired()):
+                reason = "リクエストはキャンセルされました" if token.cancelled else "処理が期限（deadline_ms）内に開始できませんでした"
+                logger.info(f"実行前に取り消しました: request_id={request_id}, command={command}")
+                send_response(request_id, None, reason)
+                return
+
+            if self.process_pool is not None and priority == PRIORITY_HEAVY:
+                # 画像ストアは親プロセスにあるため、ハンドルを画像に解決してからワーカーに渡す
+                request = _resolve_image_handles(request)
+                lines = self.process_pool.submit(_run_handler_isolated, command, request_id, request).result()
+                for line in lines:
+                    write_line(line)
+            else:
+                run_handler(command, request_id, request, token)
+        except Exception as e:
+            logger.error(f"リクエスト処理中に予期せぬエラーが発生しました: {str(e)}")
+            logger.error(traceback.format_exc())
+            send_response(request_id, None, f"サーバーエラー: {str(e)}")
+        finally:
+            with self._condition:
+                self._in_flight.pop(request_id, None)
+                self._tokens.pop(request_id, None)
+
+    def shutdown(self, wait: bool = True, cancel_pending: bool = False):
+        """
+        ワーカーを停止する
+
+        既定ではキューに残っているリクエストを処理し終えてから停止する。cancel_pending=Trueの場合は
+        待機中のリクエストをエラーレスポンスで取り消し、実行中のリクエストにはキャンセルを要求する。
+        """
+        pending = []
+        running_tokens = []
+        with self._condition:
+            self._shutting_down = True
+            if cancel_pending:
+                for queue in self._queues.values():
+                    pending.extend(queue)
+                    queue.clear()
+                for _, request_id, _, _ in pending:
+                    self._in_flight.pop(request_id, None)
+                    self._tokens.pop(request_id, None)
+                running_tokens = list(self._tokens.values())
+            self._condition.notify_all()
+
+        for _, request_id, command, _ in pending:
+            logger.info(f"終了のため待機中のリクエストを取り消しました: request_id={request_id}, command={command}")
+            send_response(request_id, None, "サーバーが終了するため、リクエストは取り消されました")
+        for token in running_tokens:
+            token.cancel()
+
+        if wait:
+            for thread in self._threads:
+                thread.join()
+        if self.process_pool is not None:
+            self.process_pool.shutdown(wait=wait)
+            self._worker_log_listener.stop()
+
 def main():
     """メインの実行ループ"""
+    global dispatcher, stage_executor, native_threads, input_protocol, ocr_pool
+
+    setup_logging(debug=os.environ.get('PYTHON_SERVER_DEBUG', '').lower() in ('1', 'true', 'yes'))
+    logger.info(f"ログファイル: {log_file}")
     logger.info("Pythonサーバーを起動しています...")
 
     # 画像解析モジュールを初期化
@@ -963,12 +2510,57 @@ def main():
     # コマンドライン引数のパース
     parser = argparse.ArgumentParser(description='Python処理サーバー')
     parser.add_argument('--debug', action='store_true', help='デバッグモードを有効化')
+    parser.add_argument('--workers', type=int,
+                        default=int(os.environ.get('PYTHON_SERVER_WORKERS', DEFAULT_WORKERS)),
+                        help='同時に処理するリクエスト数（ワーカー数）')
+    parser.add_argument('--worker-mode', choices=['thread', 'process'],
+                        default=os.environ.get('PYTHON_SERVER_WORKER_MODE', DEFAULT_WORKER_MODE),
+                        help='ワーカーの種類（thread または process）')
+    parser.add_argument('--stage-threads', type=int,
+                        default=int(os.environ.get('PYTHON_SERVER_STAGE_THREADS', DEFAULT_STAGE_THREADS)),
+                        help='analyze_allのステージを並列に実行するスレッド数（1で逐次実行）')
+    parser.add_argument('--stage-mode', choices=['thread', 'process'],
+                        default=os.environ.get('PYTHON_SERVER_STAGE_MODE', DEFAULT_STAGE_MODE),
+                        help='GIL依存のステージをプロセスプールで実行する場合はprocess')
+    parser.add_argument('--native-threads', type=int,
+                        default=int(os.environ.get('PYTHON_SERVER_NATIVE_THREADS', 0)),
+                        help='OpenCVなどの内部スレッド数（0でコア数から自動決定）')
+    # argparse.BooleanOptionalActionはPython 3.9以降のため、store_true/store_falseの組で指定する
+    parser.add_argument('--warmup-ocr', dest='warmup_ocr', action='store_true',
+                        help='起動時にバックグラウンドでEasyOCRリーダーを読み込んでおく')
+    parser.add_argument('--no-warmup-ocr', dest='warmup_ocr', action='store_false',
+                        help='起動時にEasyOCRリーダーを読み込まない')
+    parser.set_defaults(warmup_ocr=os.environ.get('PYTHON_SERVER_WARMUP_OCR', '').lower() in ('1', 'true', 'yes'))
+    parser.add_argument('--ocr-processes', type=int,
+                        default=int(os.environ.get('PYTHON_SERVER_OCR_PROCESSES', DEFAULT_OCR_PROCESSES)),
+                        help='縦長画像の帯を並列にOCRするプロセス数（0で無効。プロセスごとにOCRモデルを読み込む）')
+    parser.add_argument('--protocol', choices=list(SUPPORTED_PROTOCOLS),
+                        default=os.environ.get('PYTHON_SERVER_PROTOCOL', 'line'),
+                        help='起動時の入力プロトコル（line または framed）')
     args = parser.parse_args()
 
     if args.debug:
         logging.getLogger().setLevel(logging.DEBUG)
         logger.debug("デバッグモードが有効です")
 
+    input_protocol = args.protocol
+
+    # 同時リクエスト数 × ステージ並列数 × ネイティブスレッド数がコア数を大きく超えないようにする
+    stage_threads = max(1, args.stage_threads)
+    native_threads = args.native_threads or max(1, (os.cpu_count() or 2) // (max(1, args.workers) * stage_threads))
+    image_analyzer.configure_native_threads(native_threads)
+
+    if args.warmup_ocr:
+        # 最初のOCRリクエストでモデルの読み込みを待たないよう、バックグラウンドで読み込んでおく
+        image_analyzer.warmup_easyocr(background=True)
+
+    if stage_threads > 1:
+        stage_executor = StageExecutor(threads=stage_threads, mode=args.stage_mode)
+    if args.ocr_processes > 0:
+        ocr_pool = OcrProcessPool(args.ocr_processes)
+        image_analyzer.configure_ocr_offload(ocr_pool.submit)
+    dispatcher = RequestDispatcher(workers=args.workers, mode=args.worker_mode)
+
     while True:
         try:
             # リクエストの読み取り
@@ -983,10 +2575,12 @@ def main():
             request_id = request.get('id', str(uuid.uuid4()))
             command = request.get('command')
 
-            # 🔥🔥🔥 ここに入れる 🔥🔥🔥
-            logger.error(f"🔥🔥🔥 Pythonサーバーで受け取ったコマンド: {command}")
-            logger.error(f"🔥🔥🔥 リクエストID: {request_id}")
-            logger.error(f"🔥🔥🔥 パラメータのキー: {list(request.keys()) if request else 'None'}")
+            if request.get('_frame_error'):
+                send_response(request_id, None, request['_frame_error'])
+                continue
+
+            logger.debug("リクエストを受信しました",
+                         extra={"command": command, "request_id": request_id, "keys": list(request.keys())})
 
             if not command:
                 logger.error(f"コマンドが指定されていません: {request}")
@@ -997,8 +2591,10 @@ def main():
             handler = COMMAND_HANDLERS.get(command)
 
             if handler:
-                # ハンドラーの実行
-                handler(request_id, request)
+                # ワーカープールに投入（完了順にレスポンスが送信される）
+                dispatcher.submit(request_id, command, request)
+                if command == "exit":
+                    break
             else:
                 logger.error(f"不明なコマンド: {command}")
                 send_response(request_id, None, f"不明なコマンド: {command}")
@@ -1014,7 +2610,15 @@ def main():
             except:
                 pass
 
+    # 待機中のリクエストは取り消し、実行中のリクエストの中断を待ってから終了する
+    dispatcher.shutdown(wait=True, cancel_pending=True)
+    if stage_executor is not None:
+        stage_executor.shutdown(wait=True)
+    if ocr_pool is not None:
+        ocr_pool.shutdown(wait=True)
     logger.info("Pythonサーバーが終了しました。")
 
 if __name__ == "__main__":
+    # PyInstallerでパッケージ化された環境でプロセスワーカーを使うために必要
+    multiprocessing.freeze_support()
     main()
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+Pythonサーバーのテスト共通設定
+
+python_serverはインポート時にキャッシュディレクトリを作成するため、
+インポートより前に一時ディレクトリを指すよう環境変数を設定する。
+"""
+
+import base64
+import os
+import sys
+import tempfile
+
+import pytest
+
+PYTHON_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_cache_root = tempfile.mkdtemp(prefix='python_server_test_')
+os.environ.setdefault('PYTHON_SERVER_CACHE_DIR', os.path.join(_cache_root, 'analysis'))
+os.environ.setdefault('PYTHON_SERVER_OCR_TILE_CACHE_DIR', os.path.join(_cache_root, 'ocr_tiles'))
+
+for path in (PYTHON_DIR, os.path.join(PYTHON_DIR, 'modules')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+@pytest.fixture(scope='session')
+def server():
+    """python_serverモジュール（NumPy・OpenCVがない環境ではスキップ）"""
+    pytest.importorskip('numpy')
+    pytest.importorskip('cv2')
+    import python_server
+    return python_server
+
+
+@pytest.fixture(scope='session')
+def analyzer():
+    """image_analyzerモジュール（NumPy・OpenCVがない環境ではスキップ）"""
+    pytest.importorskip('numpy')
+    pytest.importorskip('cv2')
+    import image_analyzer
+    return image_analyzer
+
+
+@pytest.fixture(scope='session')
+def loaded_server(server):
+    """画像解析モジュールを読み込んだpython_server（キャンセルトークンや解析ハンドラーを使うテスト用）"""
+    assert server.initialize_image_analyzer()
+    return server
+
+
+@pytest.fixture
+def responses(server, monkeypatch):
+    """標準出力の代わりに送信されたレスポンス・イベントの行を収集する"""
+    lines = []
+    monkeypatch.setattr(server, '_response_sink', lines)
+    return lines
+
+
+def make_screen(height=240, width=320):
+    """色の塗りと枠線を含む、OCRを必要としないテスト用のスクリーンショット（BGR）"""
+    import cv2
+    import numpy as np
+    image = np.full((height, width, 3), 255, np.uint8)
+    cv2.rectangle(image, (20, 20), (width - 20, 100), (40, 80, 200), -1)
+    cv2.rectangle(image, (40, 140), (160, min(height - 20, 220)), (30, 30, 30), 2)
+    return image
+
+
+def encode_png(image):
+    """画像をdata URL形式のBase64文字列にする"""
+    import cv2
+    encoded = base64.b64encode(cv2.imencode('.png', image)[1].tobytes()).decode('ascii')
+    return f'data:image/png;base64,{encoded}'
+
+
+@pytest.fixture
+def png_image(server):
+    return encode_png(make_screen())
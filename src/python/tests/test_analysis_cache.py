@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""AnalysisCacheのキー生成・LRU・ディスクキャッシュのテスト"""
+
+import os
+
+import pytest
+
+
+@pytest.fixture
+def cache(server, tmp_path):
+    return server.AnalysisCache(str(tmp_path), max_memory_entries=2)
+
+
+def test_make_key_is_stable_and_ignores_option_order(cache):
+    key = cache.make_key('text', 'abc', {'quality': 'full', 'tile_height': 0})
+    assert key == cache.make_key('text', 'abc', {'tile_height': 0, 'quality': 'full'})
+
+
+def test_make_key_distinguishes_stage_image_and_options(cache):
+    key = cache.make_key('text', 'abc', {'quality': 'full'})
+    assert key != cache.make_key('colors', 'abc', {'quality': 'full'})
+    assert key != cache.make_key('text', 'abd', {'quality': 'full'})
+    assert key != cache.make_key('text', 'abc', {'quality': 'preview'})
+
+
+def test_make_key_ignores_stage_selection(cache):
+    # 単体のステージコマンドとanalyze_allが同じエントリを共有する
+    plain = cache.make_key('text', 'abc', {'quality': 'full'})
+    assert plain == cache.make_key('text', 'abc', {'quality': 'full', 'stages': ['text'], 'type': 'all'})
+    assert plain == cache.make_key('text', 'abc', {'quality': 'full', 'image': 'data'})
+    assert cache.make_key('text', 'abc', None) == cache.make_key('text', 'abc', {'type': 'compress'})
+
+
+def test_get_returns_none_on_miss(cache):
+    assert cache.get(cache.make_key('text', 'missing')) is None
+    assert cache.stats()['misses'] == 1
+
+
+def test_memory_lru_evicts_oldest_and_falls_back_to_disk(cache):
+    keys = [cache.make_key('text', str(i)) for i in range(3)]
+    for i, key in enumerate(keys):
+        cache.put(key, {'text': str(i)})
+
+    assert cache.stats()['memory_entries'] == 2
+    # 最も古いエントリはメモリから追い出され、ディスクから読み込まれる
+    assert cache.get(keys[0]) == {'text': '0'}
+    assert cache.stats()['hits'] == {'memory': 0, 'disk': 1}
+    assert cache.get(keys[0]) == {'text': '0'}
+    assert cache.stats()['hits'] == {'memory': 1, 'disk': 1}
+
+
+def test_recently_used_entry_survives_eviction(server, tmp_path):
+    cache = server.AnalysisCache(None, max_memory_entries=2)
+    a, b, c = (cache.make_key('text', name) for name in 'abc')
+    cache.put(a, {'v': 'a'})
+    cache.put(b, {'v': 'b'})
+    cache.get(a)
+    cache.put(c, {'v': 'c'})
+
+    assert cache.get(a) == {'v': 'a'}
+    assert cache.get(b) is None
+
+
+def test_disk_entries_persist_across_instances(server, tmp_path):
+    first = server.AnalysisCache(str(tmp_path))
+    key = first.make_key('colors', 'abc')
+    first.put(key, [{'hex': '#ffffff'}])
+
+    second = server.AnalysisCache(str(tmp_path))
+    assert second.get(key) == [{'hex': '#ffffff'}]
+    assert second.stats()['hits']['disk'] == 1
+
+
+def test_put_skips_empty_and_error_results(cache):
+    empty = cache.make_key('text', 'empty')
+    failed = cache.make_key('text', 'failed')
+    cache.put(empty, [])
+    cache.put(failed, {'error': 'boom', 'textBlocks': []})
+
+    assert cache.get(empty) is None
+    assert cache.get(failed) is None
+
+
+def test_prune_removes_oldest_files_over_limit(server, tmp_path):
+    cache = server.AnalysisCache(str(tmp_path))
+    keys = [cache.make_key('text', str(i)) for i in range(3)]
+    for i, key in enumerate(keys):
+        cache.put(key, {'text': 'x' * 100})
+        # 更新時刻の順序を確定させる
+        os.utime(cache._path(key), (1000 + i, 1000 + i))
+
+    size = os.path.getsize(cache._path(keys[-1]))
+    cache.max_disk_bytes = size
+    cache.prune()
+
+    assert not os.path.exists(cache._path(keys[0]))
+    assert not os.path.exists(cache._path(keys[1]))
+    assert os.path.exists(cache._path(keys[2]))
+
+
+def test_put_skips_degraded_ocr_results(cache):
+    key = cache.make_key('text', 'no-engine')
+    cache.put(key, {'text': '', 'textBlocks': [], 'degraded': True})
+
+    assert cache.get(key) is None
+
+
+def test_ocr_engine_failure_is_not_cached(loaded_server, monkeypatch, tmp_path):
+    import numpy as np
+    analyzer = loaded_server.image_analyzer
+    monkeypatch.setattr(analyzer, 'EASYOCR_AVAILABLE', False)
+    monkeypatch.setattr(analyzer, 'TESSERACT_AVAILABLE', False)
+    monkeypatch.setattr(loaded_server, 'analysis_cache', loaded_server.AnalysisCache(str(tmp_path)))
+
+    image = np.full((200, 300, 3), 255, np.uint8)
+    result = loaded_server.cached_stage('text', 'no-engine', {}, lambda: analyzer.extract_text(image, tile_height=0))
+
+    assert result['degraded'] is True
+    assert loaded_server.analysis_cache.get(loaded_server.analysis_cache.make_key('text', 'no-engine', {})) is None
+    assert not any(files for _, _, files in os.walk(str(tmp_path)))
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""AnalysisContextによる中間結果の共有（ノードを1リクエストにつき1回だけ計算する）のテスト"""
+
+import threading
+from collections import Counter
+
+import pytest
+
+from conftest import make_screen
+
+
+@pytest.fixture
+def counted_nodes(analyzer, monkeypatch):
+    """ノードの計算関数を呼び出し回数を数えるものに置き換える"""
+    calls = Counter()
+    for name, (inputs, func, gil_bound) in list(analyzer.ANALYSIS_NODES.items()):
+        def counted(ctx, _name=name, _func=func, **values):
+            calls[_name] += 1
+            return _func(ctx, **values)
+        monkeypatch.setitem(analyzer.ANALYSIS_NODES, name, (inputs, counted, gil_bound))
+    return calls
+
+
+def make_context(analyzer):
+    ctx = analyzer.AnalysisContext(make_screen(), {'quality': 'full'})
+    # OCRエンジンに依存しないよう、テキストは外部で得た結果として登録する
+    ctx.provide('text', analyzer.empty_text_result())
+    return ctx
+
+
+def test_shared_nodes_are_computed_once(analyzer, counted_nodes):
+    ctx = make_context(analyzer)
+    for stage in analyzer.ANALYSIS_STAGES:
+        ctx.get(stage)
+
+    # gray・edgesはsections・layout・elementsの入力だが、計算は1回だけ
+    assert counted_nodes['gray'] == 1
+    assert counted_nodes['edges'] == 1
+    assert counted_nodes['small'] == 1
+    assert all(count == 1 for count in counted_nodes.values())
+    assert 'text' not in counted_nodes
+    assert set(ctx.timings) == set(counted_nodes)
+
+
+def test_concurrent_stages_share_inputs(analyzer, counted_nodes):
+    ctx = make_context(analyzer)
+    threads = [threading.Thread(target=ctx.get, args=(stage,)) for stage in ('layout', 'elements', 'sections')]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+
+    assert counted_nodes['gray'] == 1
+    assert counted_nodes['edges'] == 1
+    assert all(ctx.has(stage) for stage in ('layout', 'elements', 'sections'))
+
+
+def test_offload_is_used_for_gil_bound_nodes(analyzer):
+    offloaded = []
+
+    def offload(name, image, values, options):
+        offloaded.append(name)
+        return analyzer.compute_analysis_node(name, image, values, options)
+
+    ctx = analyzer.AnalysisContext(make_screen(), {'quality': 'full'}, offload=offload)
+    colors = ctx.get('colors')
+    ctx.get('edges')
+
+    assert offloaded == ['colors']
+    assert colors and 'hex' in colors[0]
+
+
+def test_unknown_node_raises(analyzer):
+    with pytest.raises(KeyError):
+        analyzer.AnalysisContext(make_screen()).get('unknown')
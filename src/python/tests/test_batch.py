@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""analyze_batchのitemイベントの形式と期限切れ時の途中結果のテスト"""
+
+import json
+import time
+
+STAGES = ['colors', 'elements']  # OCRを使わないステージ
+
+
+def run_batch(server, images, token=None, **params):
+    request = {'images': images, 'options': {'stages': STAGES}, 'cache': False, 'workers': 1, **params}
+    server.run_handler('analyze_batch', 'batch-1', request, token)
+
+
+def test_item_events_keep_request_id(loaded_server, responses, png_image):
+    run_batch(loaded_server, [{'id': 'first', 'image_data': png_image}, png_image])
+
+    messages = [json.loads(line) for line in responses]
+    events = [message for message in messages if message.get('event') == 'item']
+    assert len(events) == 2
+    assert all(event['id'] == 'batch-1' for event in events)
+    assert sorted(str(event['item_id']) for event in events) == ['1', 'first']
+    assert all(event['status'] == 'success' and 'colors' in event['result'] for event in events)
+
+    summary = messages[-1]['result']
+    assert messages[-1]['id'] == 'batch-1'
+    assert summary['succeeded'] == 2
+    assert [item['item_id'] for item in summary['items']] == ['first', 1]
+
+
+def test_deadline_keeps_completed_items(loaded_server, monkeypatch, responses, png_image):
+    server = loaded_server
+    token = server.image_analyzer.CancelToken(deadline=time.time() + 60)
+    analyze_image_stages = server.analyze_image_stages
+    calls = []
+
+    def expire_on_second_item(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == 2:
+            token.deadline = time.time() - 1
+            raise server.image_analyzer.AnalysisCancelled('deadline')
+        return analyze_image_stages(*args, **kwargs)
+
+    monkeypatch.setattr(server, 'analyze_image_stages', expire_on_second_item)
+    run_batch(server, [png_image] * 3, token=token, stream=False)
+
+    response = json.loads(responses[-1])
+    assert response['error'] is None
+    summary = response['result']
+    assert [item['status'] for item in summary['items']] == ['success', 'skipped', 'skipped']
+    assert 'colors' in summary['items'][0]['result']
+    assert summary['skipped'] == 2
+    assert summary['partial'] is True
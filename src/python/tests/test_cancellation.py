@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""CancelTokenの期限・キャンセルとcancellation_scopeのテスト"""
+
+import time
+
+import pytest
+
+
+def test_token_without_deadline(analyzer):
+    token = analyzer.CancelToken()
+
+    assert token.remaining() is None
+    assert not token.expired(margin=3600)
+    token.check()
+
+
+def test_future_deadline(analyzer):
+    token = analyzer.CancelToken(deadline=time.time() + 60)
+
+    assert 0 < token.remaining() <= 60
+    assert not token.expired()
+    assert token.expired(margin=120)
+    token.check()
+
+
+def test_past_deadline_raises(analyzer):
+    token = analyzer.CancelToken(deadline=time.time() - 1)
+
+    assert token.expired()
+    with pytest.raises(analyzer.AnalysisCancelled) as excinfo:
+        token.check()
+    assert excinfo.value.reason == 'deadline'
+
+
+def test_cancel_takes_precedence(analyzer):
+    token = analyzer.CancelToken(deadline=time.time() - 1)
+    token.cancel()
+
+    assert token.cancelled
+    with pytest.raises(analyzer.AnalysisCancelled) as excinfo:
+        token.check()
+    assert excinfo.value.reason == 'cancelled'
+
+
+def test_cancelled_is_not_swallowed_by_except_exception(analyzer):
+    token = analyzer.CancelToken()
+    token.cancel()
+
+    with pytest.raises(analyzer.AnalysisCancelled):
+        try:
+            token.check()
+        except Exception:
+            pytest.fail('AnalysisCancelledがExceptionとして捕捉された')
+
+
+def test_cancellation_scope(analyzer):
+    token = analyzer.CancelToken()
+    analyzer.check_cancelled()
+
+    with analyzer.cancellation_scope(token):
+        assert analyzer.current_cancel_token() is token
+        analyzer.check_cancelled()
+        token.cancel()
+        with pytest.raises(analyzer.AnalysisCancelled):
+            analyzer.check_cancelled()
+
+    assert analyzer.current_cancel_token() is None
+    analyzer.check_cancelled()
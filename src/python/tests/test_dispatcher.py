@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""RequestDispatcherによるリクエストの実行・優先度クラスの振り分けとプロセスワーカーの出力収集のテスト"""
+
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def parse(lines):
+    return [json.loads(line) for line in lines]
+
+
+def test_dispatcher_runs_requests_and_drains_on_shutdown(server, monkeypatch, responses):
+    def handle_echo(request_id, params):
+        server.send_response(request_id, {"value": params.get("value")})
+
+    monkeypatch.setitem(server.COMMAND_HANDLERS, 'echo', handle_echo)
+    dispatcher = server.RequestDispatcher(workers=2)
+    for i in range(5):
+        dispatcher.submit(f'req-{i}', 'echo', {'value': i})
+    dispatcher.shutdown(wait=True)
+
+    results = {message['id']: message['result']['value'] for message in parse(responses)}
+    assert results == {f'req-{i}': i for i in range(5)}
+    assert dispatcher.in_flight() == {}
+
+
+def test_isolated_handler_collects_output_from_pool_threads(server, monkeypatch):
+    def handle_fanout(request_id, params):
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            list(pool.map(lambda index: server.send_event(request_id, 'item', index=index), range(3)))
+        server.send_response(request_id, {"done": True})
+
+    monkeypatch.setitem(server.COMMAND_HANDLERS, 'fanout', handle_fanout)
+    messages = parse(server._run_handler_isolated('fanout', 'req-1', {}))
+
+    assert [message.get('event') for message in messages].count('item') == 3
+    assert messages[-1]['result'] == {"done": True}
+    assert all(message['id'] == 'req-1' for message in messages)
+    assert server._response_sink is None
+
+
+def test_shutdown_cancels_pending_and_running_requests(loaded_server, monkeypatch, responses):
+    server = loaded_server
+    started = threading.Event()
+
+    def handle_block(request_id, params):
+        started.set()
+        while True:
+            server.image_analyzer.check_cancelled()
+            time.sleep(0.01)
+
+    def handle_echo(request_id, params):
+        server.send_response(request_id, {"ok": True})
+
+    monkeypatch.setitem(server.COMMAND_HANDLERS, 'block', handle_block)
+    monkeypatch.setitem(server.COMMAND_HANDLERS, 'echo', handle_echo)
+    dispatcher = server.RequestDispatcher(workers=1)
+    dispatcher.submit('running', 'block', {})
+    assert started.wait(5)
+    dispatcher.submit('queued-1', 'echo', {})
+    dispatcher.submit('queued-2', 'echo', {})
+
+    stopper = threading.Thread(target=dispatcher.shutdown, kwargs={'wait': True, 'cancel_pending': True})
+    stopper.start()
+    stopper.join(5)
+
+    assert not stopper.is_alive()
+    messages = {message['id']: message for message in parse(responses)}
+    assert set(messages) == {'running', 'queued-1', 'queued-2'}
+    assert all(message['result'] is None and message['error'] for message in messages.values())
+
+
+def register(server, monkeypatch, command, handler, priority):
+    monkeypatch.setitem(server.COMMAND_HANDLERS, command, handler)
+    monkeypatch.setitem(server.COMMAND_PRIORITIES, command, priority)
+
+
+def blocking_handler(server, started, release):
+    def handle(request_id, params):
+        started.set()
+        release.wait(5)
+        server.send_response(request_id, {"released": True})
+    return handle
+
+
+def test_light_lane_is_not_blocked_by_heavy_request(server, monkeypatch, responses):
+    started, release, answered = threading.Event(), threading.Event(), threading.Event()
+
+    def handle_probe(request_id, params):
+        server.send_response(request_id, {"ok": True})
+        answered.set()
+
+    register(server, monkeypatch, 'heavy_block', blocking_handler(server, started, release), server.PRIORITY_HEAVY)
+    register(server, monkeypatch, 'probe', handle_probe, server.PRIORITY_LIGHT)
+    dispatcher = server.RequestDispatcher(workers=1)
+    try:
+        dispatcher.submit('heavy', 'heavy_block', {})
+        assert started.wait(5)
+        dispatcher.submit('light', 'probe', {})
+
+        # 汎用ワーカーがOCRなどで塞がっていても、軽量レーンが応答する
+        assert answered.wait(5)
+        assert dispatcher.in_flight() == {'heavy': 'heavy_block'}
+    finally:
+        release.set()
+        dispatcher.shutdown(wait=True)
+
+    assert [message['id'] for message in parse(responses)] == ['light', 'heavy']
+
+
+def test_light_requests_are_taken_before_queued_heavy(server, monkeypatch, responses):
+    heavy_started, light_started, release = threading.Event(), threading.Event(), threading.Event()
+    order = []
+
+    def handle_record(request_id, params):
+        order.append(request_id)
+        server.send_response(request_id, {"ok": True})
+
+    register(server, monkeypatch, 'heavy_block', blocking_handler(server, heavy_started, release), server.PRIORITY_HEAVY)
+    register(server, monkeypatch, 'light_block', blocking_handler(server, light_started, release), server.PRIORITY_LIGHT)
+    register(server, monkeypatch, 'heavy_record', handle_record, server.PRIORITY_HEAVY)
+    register(server, monkeypatch, 'light_record', handle_record, server.PRIORITY_LIGHT)
+    dispatcher = server.RequestDispatcher(workers=1)
+    # 汎用ワーカーと軽量レーンの両方を塞いでからキューに積む
+    dispatcher.submit('heavy-block', 'heavy_block', {})
+    assert heavy_started.wait(5)
+    dispatcher.submit('light-block', 'light_block', {})
+    assert light_started.wait(5)
+    dispatcher.submit('heavy-1', 'heavy_record', {})
+    dispatcher.submit('light-1', 'light_record', {})
+    dispatcher.submit('heavy-2', 'heavy_record', {})
+
+    queued = dispatcher.stats()['classes']
+    assert queued['heavy']['queued'] == 2 and queued['light']['queued'] == 1
+    assert queued['heavy']['running'] == 1 and queued['light']['running'] == 1
+
+    release.set()
+    dispatcher.shutdown(wait=True)
+
+    # 後から投入されたlightが、先に待っていたheavyより先に実行される
+    assert order[0] == 'light-1'
+    assert sorted(order[1:]) == ['heavy-1', 'heavy-2']
+    classes = dispatcher.stats()['classes']
+    assert classes['heavy']['completed'] == 3 and classes['light']['completed'] == 2
+    assert classes['heavy']['queued'] == 0 and classes['heavy']['running'] == 0
+
+
+def test_server_stats_reports_scheduler(server, monkeypatch, responses):
+    dispatcher = server.RequestDispatcher(workers=2)
+    monkeypatch.setattr(server, 'dispatcher', dispatcher)
+    dispatcher.submit('stats-1', 'server_stats', {})
+    dispatcher.shutdown(wait=True)
+
+    result = parse(responses)[-1]['result']
+    assert result['scheduler']['workers'] == 2
+    assert set(result['scheduler']['classes']) == set(server.PRIORITY_CLASSES)
+    assert result['scheduler']['classes']['control']['running'] == 1
+    assert 'analysis_cache' in result and 'image_store' in result
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""analyze_incrementalの前回結果の検証と、変更領域以外の結果の再利用のテスト"""
+
+import json
+
+import pytest
+
+from conftest import encode_png, make_screen
+
+cv2 = pytest.importorskip('cv2')
+
+PREVIOUS_BLOCK = {'text': 'Hello', 'confidence': 0.9, 'position': {'x': 30, 'y': 30, 'width': 100, 'height': 20}}
+
+
+def full_previous():
+    return {
+        'colors': [{'hex': '#ffffff', 'ratio': 0.8}],
+        'text': 'Hello',
+        'textBlocks': [PREVIOUS_BLOCK],
+        'sections': [],
+        'layout': {'width': 640, 'height': 480, 'type': 'standard'},
+        'elements': [],
+        'status': 'success',
+        'success': True,
+    }
+
+
+@pytest.fixture
+def images():
+    before = make_screen(480, 640)
+    after = before.copy()
+    cv2.rectangle(after, (560, 400), (600, 440), (0, 160, 0), -1)
+    return encode_png(before), encode_png(after)
+
+
+@pytest.mark.parametrize('previous', [
+    {'colors': [{'hex': '#ffffff'}], 'stages': ['colors']},
+    dict(full_previous(), partial=True, skipped_stages=['elements']),
+    dict(full_previous(), error='画像分析エラー'),
+])
+def test_incomplete_previous_is_rejected(loaded_server, previous):
+    assert loaded_server._previous_stage_results({'previous': previous}, None, {}) is None
+
+
+def test_complete_previous_is_converted_to_stages(loaded_server):
+    stages = loaded_server._previous_stage_results({'previous': full_previous()}, None, {})
+
+    assert set(stages) == set(loaded_server.image_analyzer.ANALYSIS_STAGES)
+    assert stages['text']['textBlocks'] == [PREVIOUS_BLOCK]
+
+
+def test_partial_previous_falls_back_to_full_analysis(loaded_server, monkeypatch, responses, images):
+    server = loaded_server
+    before, after = images
+    calls = []
+    monkeypatch.setattr(server, 'handle_analyze_all', lambda request_id, params: calls.append(request_id))
+
+    server.handle_analyze_incremental('inc-1', {
+        'image_data': after,
+        'previous_image': before,
+        'previous': {'colors': [{'hex': '#ffffff'}], 'stages': ['colors']},
+        'cache': False,
+    })
+
+    assert calls == ['inc-1']
+    assert responses == []
+
+
+def test_unchanged_text_is_reused(loaded_server, monkeypatch, responses, images):
+    server = loaded_server
+    before, after = images
+    ocr_calls = []
+
+    def fake_extract_text(image, **kwargs):
+        ocr_calls.append(image.shape[:2])
+        return {'text': '', 'textBlocks': []}
+
+    monkeypatch.setattr(server.image_analyzer, 'extract_text', fake_extract_text)
+    server.handle_analyze_incremental('inc-1', {
+        'image_data': after,
+        'previous_image': before,
+        'previous': full_previous(),
+        'cache': False,
+    })
+
+    result = json.loads(responses[-1])['result']
+    assert result['incremental']['reused']['textBlocks'] == 1
+    assert result['textBlocks'] == [PREVIOUS_BLOCK]
+    # OCRは変更領域だけで実行される
+    assert ocr_calls and all(h * w < 480 * 640 * 0.5 for h, w in ocr_calls)
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""OCRの前処理・エンジン選択のテスト（EasyOCRのリーダーは呼び出しを記録する偽物に置き換える）"""
+
+import pytest
+
+np = pytest.importorskip('numpy')
+cv2 = pytest.importorskip('cv2')
+
+
+class FakeReader:
+    """readtext / recognize の呼び出しを記録し、固定の結果を返すEasyOCRリーダー"""
+
+    def __init__(self):
+        self.calls = []
+
+    def readtext(self, image, **kwargs):
+        self.calls.append(('readtext', None))
+        return [([[10, 10], [90, 10], [90, 30], [10, 30]], 'Full', 0.9)]
+
+    def recognize(self, image, horizontal_list, **kwargs):
+        self.calls.append(('recognize', horizontal_list))
+        return [([[x0, y0], [x1, y0], [x1, y1], [x0, y1]], 'Line', 0.9) for x0, x1, y0, y1 in horizontal_list]
+
+
+@pytest.fixture
+def reader(analyzer, monkeypatch):
+    fake = FakeReader()
+    monkeypatch.setattr(analyzer, 'easyocr_reader', fake)
+    return fake
+
+
+def text_line_image():
+    image = np.full((200, 400, 3), 255, np.uint8)
+    cv2.putText(image, 'Hello world', (20, 100), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0, 0, 0), 2)
+    return image
+
+
+def test_proposals_are_opt_in(analyzer):
+    assert analyzer.get_quality_preset('standard')['ocr_proposals'] is False
+    assert analyzer.get_quality_preset(None)['ocr_proposals'] is False
+    assert analyzer.get_quality_preset('fast')['ocr_proposals'] is True
+
+
+def test_proposals_recognize_candidate_lines(analyzer, reader):
+    result = analyzer.extract_text_with_easyocr(text_line_image(), proposals=True)
+
+    assert [name for name, _ in reader.calls] == ['recognize']
+    assert reader.calls[0][1]
+    assert result['textBlocks'] and all(block['text'] == 'Line' for block in result['textBlocks'])
+
+
+def test_no_proposals_falls_back_to_full_detection(analyzer, reader):
+    image = np.full((200, 400, 3), 255, np.uint8)
+
+    result = analyzer.extract_text_with_easyocr(image, proposals=True)
+
+    assert [name for name, _ in reader.calls] == ['readtext']
+    assert result['text'] == 'Full'
+
+
+def test_full_detection_without_proposals(analyzer, reader):
+    analyzer.extract_text_with_easyocr(text_line_image(), proposals=False)
+
+    assert [name for name, _ in reader.calls] == ['readtext']
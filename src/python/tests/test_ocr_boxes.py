@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""検出だけを行うOCRモード（ocr_mode='boxes'）の結果の形とエンジンの呼び出しのテスト"""
+
+import pytest
+
+np = pytest.importorskip('numpy')
+cv2 = pytest.importorskip('cv2')
+
+
+class DetectOnlyReader:
+    """detectだけを許可するEasyOCRリーダー（認識が呼ばれたらテストを失敗させる）"""
+
+    def __init__(self):
+        self.detect_calls = 0
+
+    def detect(self, image, **kwargs):
+        self.detect_calls += 1
+        horizontal = [[10, 120, 20, 40], [-5, 30, 150, 170], [50, 50, 60, 70]]
+        free = [[[200, 100], [260, 110], [258, 130], [198, 120]]]
+        return [horizontal], [free]
+
+    def readtext(self, *args, **kwargs):
+        raise AssertionError('boxesモードで認識が実行されました')
+
+    recognize = readtext
+
+
+@pytest.fixture
+def no_strip_ocr(analyzer, monkeypatch):
+    """帯ごとのキャッシュや並列OCRを無効にして、画像全体を1回で処理させる"""
+    monkeypatch.setattr(analyzer, '_text_tile_cache', None)
+    monkeypatch.setattr(analyzer, '_ocr_offload', None)
+
+
+@pytest.fixture
+def reader(analyzer, monkeypatch):
+    fake = DetectOnlyReader()
+    monkeypatch.setattr(analyzer, 'EASYOCR_AVAILABLE', True)
+    monkeypatch.setattr(analyzer, 'easyocr_reader', fake)
+    return fake
+
+
+def text_image(height=200):
+    image = np.full((height, 400, 3), 255, np.uint8)
+    for y in range(60, height - 20, 90):
+        cv2.putText(image, 'Hello world', (20, y), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0, 0, 0), 2)
+    return image
+
+
+def test_empty_result_shape_depends_on_mode(analyzer):
+    assert analyzer.empty_text_result('boxes') == {'text': '', 'textBlocks': [], 'mode': 'boxes'}
+    assert analyzer.empty_text_result('text') == {'text': '', 'textBlocks': []}
+    assert analyzer.empty_text_result('unknown') == {'text': '', 'textBlocks': []}
+    assert analyzer.empty_text_result('BOXES', degraded=True)['degraded'] is True
+
+
+def test_boxes_mode_runs_detector_only(analyzer, no_strip_ocr, reader):
+    result = analyzer.extract_text(text_image(), tile_height=0, quality='full', mode='boxes')
+
+    assert reader.detect_calls == 1
+    assert result['mode'] == 'boxes' and result['text'] == ''
+    positions = [block['position'] for block in result['textBlocks']]
+    # 画像の外にはみ出す座標は切り詰め、幅のないボックスは除く。傾いたボックスは外接矩形にする
+    assert positions == [
+        {'x': 10, 'y': 20, 'width': 110, 'height': 20},
+        {'x': 198, 'y': 100, 'width': 62, 'height': 30},
+        {'x': 0, 'y': 150, 'width': 30, 'height': 20},
+    ]
+    assert all(block['text'] == '' and 'confidence' not in block for block in result['textBlocks'])
+
+
+def test_boxes_mode_without_easyocr_uses_proposals(analyzer, no_strip_ocr, monkeypatch):
+    monkeypatch.setattr(analyzer, 'EASYOCR_AVAILABLE', False)
+
+    result = analyzer.extract_text(text_image(), tile_height=0, quality='full', mode='boxes')
+
+    assert result['mode'] == 'boxes'
+    assert result['textBlocks']
+    assert 'degraded' not in result
+
+
+def test_tiled_boxes_are_ordered_top_to_bottom(analyzer, no_strip_ocr, monkeypatch):
+    monkeypatch.setattr(analyzer, 'EASYOCR_AVAILABLE', False)
+
+    result = analyzer.extract_text(text_image(600), tile_height=200, quality='full', mode='boxes')
+
+    assert result['mode'] == 'boxes'
+    ys = [block['position']['y'] for block in result['textBlocks']]
+    assert len(ys) >= 3 and ys == sorted(ys)
+
+
+def test_analysis_graph_honors_ocr_mode(analyzer, no_strip_ocr, reader):
+    ctx = analyzer.AnalysisContext(text_image(), {'quality': 'full', 'ocr_mode': 'boxes', 'tile_height': 0})
+
+    assert ctx.get('text')['mode'] == 'boxes'
+    assert reader.detect_calls == 1
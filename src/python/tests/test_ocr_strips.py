@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""帯ごとのOCR結果キャッシュ（帯のピクセルのハッシュで再利用する）と、帯の並列OCRのテスト"""
+
+from concurrent.futures import Future
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+
+@pytest.fixture
+def ocr_calls(analyzer, monkeypatch):
+    """extract_textを、呼び出された帯を記録して帯の平均輝度を返す偽物に置き換える"""
+    calls = []
+
+    def fake_extract_text(strip, tile_height=None, quality=None, mode=None):
+        calls.append(int(strip.mean()))
+        return {'text': str(int(strip.mean())), 'textBlocks': []}
+
+    monkeypatch.setattr(analyzer, 'extract_text', fake_extract_text)
+    monkeypatch.setattr(analyzer, '_ocr_offload', None)
+    return calls
+
+
+@pytest.fixture
+def tile_cache(server, analyzer, monkeypatch, tmp_path):
+    cache = server.AnalysisCache(str(tmp_path))
+    monkeypatch.setattr(analyzer, '_text_tile_cache', cache)
+    return cache
+
+
+def strips(*values):
+    return [np.full((40, 60, 3), value, np.uint8) for value in values]
+
+
+def test_strips_already_seen_are_not_ocred_again(analyzer, ocr_calls, tile_cache):
+    first = analyzer.extract_strips_text(strips(10, 20))
+    second = analyzer.extract_strips_text(strips(20, 30, 10))
+
+    assert ocr_calls == [10, 20, 30]
+    assert [result['text'] for result in first] == ['10', '20']
+    assert [result['text'] for result in second] == ['20', '30', '10']
+
+
+def test_cache_key_depends_on_pixels_quality_and_mode(analyzer, tile_cache):
+    strip = strips(10)[0]
+    key = analyzer._strip_cache_key(tile_cache, strip, None, None)
+
+    assert key == analyzer._strip_cache_key(tile_cache, strip.copy(), 'standard', 'text')
+    assert key != analyzer._strip_cache_key(tile_cache, strips(11)[0], None, None)
+    assert key != analyzer._strip_cache_key(tile_cache, strip, 'full', None)
+    assert key != analyzer._strip_cache_key(tile_cache, strip, None, 'boxes')
+    # 同じ画素数でも形が違えば別の帯とみなす
+    assert key != analyzer._strip_cache_key(tile_cache, np.full((60, 40, 3), 10, np.uint8), None, None)
+
+
+def test_degraded_strip_results_are_retried(analyzer, monkeypatch, tile_cache):
+    calls = []
+
+    def failing_extract_text(strip, tile_height=None, quality=None, mode=None):
+        calls.append(1)
+        return analyzer.empty_text_result(mode, degraded=True)
+
+    monkeypatch.setattr(analyzer, 'extract_text', failing_extract_text)
+    monkeypatch.setattr(analyzer, '_ocr_offload', None)
+    analyzer.extract_strips_text(strips(10))
+    analyzer.extract_strips_text(strips(10))
+
+    assert len(calls) == 2
+
+
+def test_tiled_extraction_reuses_unchanged_strips(analyzer, ocr_calls, tile_cache):
+    image = np.full((600, 60, 3), 200, np.uint8)
+    analyzer.extract_text_tiled(image, 200)
+    first_calls = len(ocr_calls)
+
+    # 下端だけを変更すると、変更を含む帯だけがOCRされる
+    image[-10:] = 0
+    analyzer.extract_text_tiled(image, 200)
+
+    assert first_calls >= 3
+    assert len(ocr_calls) == first_calls + 1
+
+
+class FakeOffload:
+    """帯のOCRの投入を記録し、結果を設定済み（またはresults=Falseで未完了）のFutureを返すsubmit"""
+
+    def __init__(self, results=True, error=None):
+        self.submitted = []
+        self.futures = []
+        self.results = results
+        self.error = error
+
+    def __call__(self, strip, quality, mode):
+        self.submitted.append(int(strip.mean()))
+        future = Future()
+        if self.error is not None:
+            future.set_exception(self.error)
+        elif self.results:
+            future.set_result({'text': f'offloaded {int(strip.mean())}', 'textBlocks': []})
+        self.futures.append(future)
+        return future
+
+
+def test_pending_strips_are_offloaded(analyzer, ocr_calls, monkeypatch):
+    offload = FakeOffload()
+    monkeypatch.setattr(analyzer, '_ocr_offload', offload)
+    monkeypatch.setattr(analyzer, '_text_tile_cache', None)
+
+    results = analyzer.extract_strips_text(strips(10, 20, 30))
+
+    assert offload.submitted == [10, 20, 30]
+    assert ocr_calls == []
+    assert [result['text'] for result in results] == ['offloaded 10', 'offloaded 20', 'offloaded 30']
+
+
+def test_single_strip_and_cached_strips_are_not_offloaded(analyzer, ocr_calls, tile_cache, monkeypatch):
+    offload = FakeOffload()
+    monkeypatch.setattr(analyzer, '_ocr_offload', offload)
+
+    analyzer.extract_strips_text(strips(10))
+    analyzer.extract_strips_text(strips(10, 20, 30))
+
+    # 1つだけの帯はこのプロセスで実行し、キャッシュにある帯は投入しない
+    assert ocr_calls == [10]
+    assert offload.submitted == [20, 30]
+
+
+def test_failed_worker_falls_back_to_local_ocr(analyzer, ocr_calls, monkeypatch):
+    monkeypatch.setattr(analyzer, '_ocr_offload', FakeOffload(error=RuntimeError('worker died')))
+    monkeypatch.setattr(analyzer, '_text_tile_cache', None)
+
+    results = analyzer.extract_strips_text(strips(10, 20))
+
+    assert ocr_calls == [10, 20]
+    assert [result['text'] for result in results] == ['10', '20']
+
+
+def test_cancellation_while_waiting_cancels_futures(analyzer, ocr_calls, monkeypatch):
+    offload = FakeOffload(results=False)
+    monkeypatch.setattr(analyzer, '_ocr_offload', offload)
+    monkeypatch.setattr(analyzer, '_text_tile_cache', None)
+    monkeypatch.setattr(analyzer, 'OCR_OFFLOAD_POLL_SECONDS', 0.01)
+    token = analyzer.CancelToken()
+    token.cancel()
+
+    with analyzer.cancellation_scope(token):
+        with pytest.raises(analyzer.AnalysisCancelled):
+            analyzer.extract_strips_text(strips(10, 20))
+
+    assert all(future.cancelled() for future in offload.futures)
+    assert ocr_calls == []
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""入力プロトコルの切り替えとフレーム形式の読み取りのテスト"""
+
+import io
+import json
+import sys
+
+import pytest
+
+
+def build_framed_request(header, frames=()):
+    """[4バイト長][JSONヘッダー] + [4バイト長][バイナリ]... を組み立てる"""
+    header = dict(header, frames=[key for key, _ in frames])
+    header_bytes = json.dumps(header).encode('utf-8')
+    data = len(header_bytes).to_bytes(4, 'big') + header_bytes
+    for _, payload in frames:
+        data += len(payload).to_bytes(4, 'big') + payload
+    return data
+
+
+def test_negotiate_protocol_switches_and_restores(server, monkeypatch, responses):
+    monkeypatch.setattr(server, 'input_protocol', 'line')
+
+    server.handle_negotiate_protocol('req-1', {'protocol': 'framed'})
+    assert server.input_protocol == 'framed'
+    response = json.loads(responses[-1])
+    assert response['id'] == 'req-1'
+    assert response['error'] is None
+    assert response['result']['protocol'] == 'framed'
+    assert response['result']['frame_length_size'] == server.FRAME_LENGTH_SIZE
+
+    server.handle_negotiate_protocol('req-2', {'protocol': 'line'})
+    assert server.input_protocol == 'line'
+
+
+def test_negotiate_protocol_rejects_unknown_protocol(server, monkeypatch, responses):
+    monkeypatch.setattr(server, 'input_protocol', 'line')
+
+    server.handle_negotiate_protocol('req-1', {'protocol': 'msgpack'})
+
+    assert server.input_protocol == 'line'
+    response = json.loads(responses[-1])
+    assert response['result'] is None
+    assert 'msgpack' in response['error']
+
+
+def test_framed_request_round_trip(server):
+    payload = bytes(range(256)) * 4
+    data = build_framed_request(
+        {'id': 'req-1', 'command': 'extract_text', 'params': {'ocr_mode': 'text'}},
+        [('image', payload), ('mask', b'')]
+    )
+
+    request = server._read_framed_request(io.BytesIO(data))
+
+    assert request['id'] == 'req-1'
+    assert request['params'] == {'ocr_mode': 'text'}
+    assert bytes(request['image']) == payload
+    assert bytes(request['mask']) == b''
+    assert 'frames' not in request
+
+
+def test_consecutive_framed_requests(server):
+    stream = io.BytesIO(
+        build_framed_request({'id': 'a'}, [('image', b'\x00\n\xff')])
+        + build_framed_request({'id': 'b'})
+    )
+
+    assert server._read_framed_request(stream)['image'] == b'\x00\n\xff'
+    assert server._read_framed_request(stream) == {'id': 'b'}
+    assert server._read_framed_request(stream) is None
+
+
+def test_truncated_frame_returns_none(server):
+    data = build_framed_request({'id': 'a'}, [('image', b'0123456789')])
+
+    assert server._read_framed_request(io.BytesIO(data[:-3])) is None
+    assert server._read_framed_request(io.BytesIO(data[:2])) is None
+
+
+def test_oversized_header_is_rejected(server):
+    data = (server.MAX_FRAME_HEADER_SIZE + 1).to_bytes(4, 'big')
+
+    with pytest.raises(ValueError):
+        server._read_framed_request(io.BytesIO(data))
+
+
+def test_read_request_follows_negotiated_protocol(server, monkeypatch):
+    framed = build_framed_request({'id': 'b', 'command': 'ping'}, [('image', b'\x89PNG')])
+    stdin = io.TextIOWrapper(io.BytesIO(b'{"id": "a", "command": "ping"}\n' + framed))
+    monkeypatch.setattr(sys, 'stdin', stdin)
+
+    monkeypatch.setattr(server, 'input_protocol', 'line')
+    assert server.read_request() == {'id': 'a', 'command': 'ping'}
+
+    monkeypatch.setattr(server, 'input_protocol', 'framed')
+    request = server.read_request()
+    assert request['id'] == 'b'
+    assert request['image'] == b'\x89PNG'
+    assert server.read_request() is None
+
+
+def test_oversized_frame_is_discarded_and_stream_stays_in_sync(server, monkeypatch):
+    monkeypatch.setattr(server, 'MAX_FRAME_SIZE', 8)
+    monkeypatch.setattr(server, 'FRAME_DISCARD_CHUNK_SIZE', 3)
+    stream = io.BytesIO(
+        build_framed_request({'id': 'big'}, [('image', b'x' * 20)])
+        + build_framed_request({'id': 'next'}, [('image', b'small')])
+    )
+
+    with pytest.raises(server.FrameTooLargeError) as excinfo:
+        server._read_framed_request(stream)
+    assert excinfo.value.request_id == 'big'
+    assert excinfo.value.keys == ['image']
+    assert server._read_framed_request(stream) == {'id': 'next', 'image': b'small'}
+
+
+def test_read_request_reports_oversized_frame(server, monkeypatch):
+    monkeypatch.setattr(server, 'MAX_FRAME_SIZE', 8)
+    framed = build_framed_request({'id': 'big', 'command': 'extract_text'}, [('image', b'x' * 20)])
+    monkeypatch.setattr(sys, 'stdin', io.TextIOWrapper(io.BytesIO(framed)))
+    monkeypatch.setattr(server, 'input_protocol', 'framed')
+
+    request = server.read_request()
+
+    assert request['id'] == 'big'
+    assert 'command' not in request
+    assert request['_frame_error']
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+"""setup_environmentによる画像解析モジュールの再初期化のテスト"""
+
+import json
+
+
+def test_initialize_keeps_loaded_module(loaded_server):
+    module = loaded_server.image_analyzer
+
+    assert loaded_server.initialize_image_analyzer()
+    assert loaded_server.image_analyzer is module
+
+
+def test_setup_environment_keeps_module_and_configuration(loaded_server, responses):
+    server = loaded_server
+    module = server.image_analyzer
+    cancelled_class = module.AnalysisCancelled
+    offload = object()
+    module.configure_ocr_offload(offload)
+    try:
+        server.handle_setup_environment('setup-1', {})
+
+        assert json.loads(responses[-1])['result']['status'] == 'ok'
+        assert server.image_analyzer is module
+        assert server.image_analyzer.AnalysisCancelled is cancelled_class
+        assert server.image_analyzer._ocr_offload is offload
+    finally:
+        module.configure_ocr_offload(None)
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""analyze_allのステージ指定（stages / type）のテスト"""
+
+import json
+
+import pytest
+
+
+@pytest.mark.parametrize('params, options, expected', [
+    ({}, {}, ['colors', 'text', 'sections', 'layout', 'elements']),
+    ({'stages': ['layout', 'colors']}, {}, ['colors', 'layout']),
+    ({'stages': 'ocr, element'}, {}, ['text', 'elements']),
+    ({}, {'stages': ['Color']}, ['colors']),
+    ({'type': 'all'}, {}, ['colors', 'text', 'sections', 'layout', 'elements']),
+    ({'type': 'compress'}, {}, ['colors', 'text', 'sections', 'layout', 'elements']),
+    ({}, {'type': 'sections'}, ['sections']),
+    ({'stages': ['all']}, {}, ['colors', 'text', 'sections', 'layout', 'elements']),
+])
+def test_resolve_requested_stages(loaded_server, params, options, expected):
+    assert loaded_server.resolve_requested_stages(params, options) == expected
+
+
+def test_unknown_explicit_stage_is_rejected(loaded_server):
+    with pytest.raises(ValueError):
+        loaded_server.resolve_requested_stages({'stages': ['colors', 'fonts']}, {})
+
+
+def test_analyze_all_returns_only_selected_stages(loaded_server, responses, png_image):
+    loaded_server.handle_analyze_all('all-1', {
+        'image_data': png_image,
+        'stages': ['colors', 'elements'],
+        'cache': False,
+    })
+
+    response = json.loads(responses[-1])
+    result = response['result']
+    assert response['error'] is None
+    assert result['stages'] == ['colors', 'elements']
+    assert result['colors']
+    assert 'elements' in result
+    assert not {'text', 'textBlocks', 'sections', 'layout'} & set(result)
+
+
+def test_analyze_all_reports_unknown_stage(loaded_server, responses, png_image):
+    loaded_server.handle_analyze_all('all-1', {'image_data': png_image, 'stages': ['fonts'], 'cache': False})
+
+    response = json.loads(responses[-1])
+    assert 'fonts' in response['error']
+    assert response['result']['status'] == 'error'
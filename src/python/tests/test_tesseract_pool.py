@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""TesseractPoolのAPIの使い回し・同時実行数の制限・CLIの出力の解析のテスト（Tesseract本体は偽物に置き換える）"""
+
+import subprocess
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+
+class FakeWord:
+    def __init__(self, text, box):
+        self.text, self.box = text, box
+
+    def GetUTF8Text(self, level):
+        return self.text
+
+    def BoundingBox(self, level):
+        return self.box
+
+    def Confidence(self, level):
+        return 87.5
+
+
+class FakeApi:
+    """PyTessBaseAPIの偽物（生成数と同時に認識中の数を記録する）"""
+
+    created = 0
+    active = 0
+    max_active = 0
+    lock = threading.Lock()
+
+    def __init__(self, lang, oem):
+        with FakeApi.lock:
+            FakeApi.created += 1
+        self.cleared = 0
+
+    def SetPageSegMode(self, psm):
+        self.psm = psm
+
+    def SetImageBytes(self, data, width, height, channels, stride):
+        self.image = (len(data), width, height, channels, stride)
+
+    def Recognize(self):
+        with FakeApi.lock:
+            FakeApi.active += 1
+            FakeApi.max_active = max(FakeApi.max_active, FakeApi.active)
+        time.sleep(0.02)
+        with FakeApi.lock:
+            FakeApi.active -= 1
+
+    def GetIterator(self):
+        return [FakeWord('Hello', (1, 2, 41, 22)), FakeWord('', (0, 0, 1, 1)), FakeWord('world', None)]
+
+    def GetUTF8Text(self):
+        return 'Hello\n'
+
+    def Clear(self):
+        self.cleared += 1
+
+
+@pytest.fixture
+def fake_tesserocr(analyzer, monkeypatch):
+    FakeApi.created = FakeApi.active = FakeApi.max_active = 0
+    module = SimpleNamespace(
+        PyTessBaseAPI=FakeApi,
+        OEM=SimpleNamespace(DEFAULT=3),
+        RIL=SimpleNamespace(WORD=3),
+        iterate_level=lambda iterator, level: iterator,
+    )
+    monkeypatch.setattr(analyzer, 'tesserocr', module, raising=False)
+    monkeypatch.setattr(analyzer, 'TESSEROCR_AVAILABLE', True)
+    return module
+
+
+def image():
+    return np.full((40, 80, 3), 255, np.uint8)
+
+
+def test_tesserocr_apis_are_reused(analyzer, fake_tesserocr):
+    pool = analyzer.TesseractPool(size=2)
+    assert pool.backend == 'tesserocr'
+
+    for _ in range(3):
+        words = pool.image_to_data(image())
+    assert pool.image_to_string(image()) == 'Hello\n'
+
+    # 逐次呼び出しでは1つのAPIを使い回す（言語データの読み込みは1回だけ）
+    assert FakeApi.created == 1
+    assert words == [{'text': 'Hello', 'conf': 87.5, 'left': 1, 'top': 2, 'width': 40, 'height': 20}]
+    stats = pool.stats()
+    assert stats['workers'] == 1 and stats['calls'] == 4
+
+
+def test_concurrent_calls_are_limited_to_pool_size(analyzer, fake_tesserocr):
+    pool = analyzer.TesseractPool(size=2)
+    threads = [threading.Thread(target=pool.image_to_data, args=(image(),)) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert FakeApi.max_active <= 2
+    assert FakeApi.created <= 2
+    assert pool.stats()['calls'] == 6
+
+
+def test_cli_backend_parses_tsv_from_stdin_run(analyzer, monkeypatch):
+    monkeypatch.setattr(analyzer, 'TESSEROCR_AVAILABLE', False)
+    monkeypatch.setattr(analyzer, 'PYTESSERACT_AVAILABLE', True)
+    monkeypatch.setattr(analyzer, 'pytesseract', SimpleNamespace(pytesseract=SimpleNamespace(tesseract_cmd='tesseract')),
+                        raising=False)
+    commands = []
+    tsv = ('level\tpage_num\tblock_num\tpar_num\tline_num\tword_num\tleft\ttop\twidth\theight\tconf\ttext\n'
+           '4\t1\t1\t1\t1\t0\t0\t0\t80\t40\t-1\t\n'
+           '5\t1\t1\t1\t1\t1\t3\t4\t30\t12\t91.5\tHello\n')
+
+    def fake_run(command, input=None, **kwargs):
+        commands.append((command, kwargs['env'].get('OMP_THREAD_LIMIT'), input[:4]))
+        return subprocess.CompletedProcess(command, 0, stdout=tsv.encode('utf-8'), stderr=b'')
+
+    monkeypatch.setattr(analyzer.subprocess, 'run', fake_run)
+    pool = analyzer.TesseractPool(size=1)
+
+    words = pool.image_to_data(image(), psm=6)
+
+    assert pool.backend == 'cli'
+    assert words == [{'text': 'Hello', 'conf': 91.5, 'left': 3, 'top': 4, 'width': 30, 'height': 12}]
+    command, thread_limit, header = commands[0]
+    # 一時ファイルを作らず、標準入力にPNGを渡す
+    assert command[1:3] == ['stdin', 'stdout'] and command[-1] == 'tsv'
+    assert thread_limit == '1'
+    assert header == b'\x89PNG'
+
+
+def test_unavailable_backend_raises(analyzer, monkeypatch):
+    monkeypatch.setattr(analyzer, 'TESSEROCR_AVAILABLE', False)
+    monkeypatch.setattr(analyzer, 'PYTESSERACT_AVAILABLE', False)
+    pool = analyzer.TesseractPool()
+
+    assert pool.stats()['available'] is False
+    with pytest.raises(RuntimeError):
+        pool.image_to_string(image())
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""要素内のテキストの有無をまとめて判定するdetect_text_presenceと、要素検出でOCRを行わないことのテスト"""
+
+import pytest
+
+from conftest import make_screen
+
+np = pytest.importorskip('numpy')
+cv2 = pytest.importorskip('cv2')
+
+
+def block(x, y, width, height):
+    return {'text': 'x', 'position': {'x': x, 'y': y, 'width': width, 'height': height}}
+
+
+def boxed_edges():
+    """枠線だけの矩形と、内側に文字のようなストロークがある矩形のエッジ画像"""
+    edges = np.zeros((200, 400), np.uint8)
+    cv2.rectangle(edges, (10, 10), (110, 110), 255, 1)
+    cv2.rectangle(edges, (200, 10), (300, 110), 255, 1)
+    for x in range(220, 285, 8):
+        cv2.line(edges, (x, 40), (x, 80), 255, 1)
+    return edges
+
+
+def test_empty_rects(analyzer):
+    assert analyzer.detect_text_presence(boxed_edges(), []).shape == (0,)
+
+
+def test_edge_density_ignores_borders(analyzer):
+    has_text = analyzer.detect_text_presence(boxed_edges(), [(10, 10, 101, 101), (200, 10, 101, 101)])
+
+    assert has_text.tolist() == [False, True]
+
+
+def test_text_blocks_are_matched_by_center(analyzer):
+    rects = [(0, 0, 100, 100), (100, 0, 100, 100), (0, 100, 100, 100)]
+    # 2つ目のブロックは左上が矩形の外にあるが、中心は2つ目の矩形の内側
+    blocks = [block(10, 10, 20, 10), block(90, 40, 40, 10), {'text': 'no position'}]
+
+    has_text = analyzer.detect_text_presence(np.zeros((200, 200), np.uint8), rects, text_blocks=blocks)
+
+    assert has_text.tolist() == [True, True, False]
+    assert analyzer.detect_text_presence(np.zeros((200, 200), np.uint8), rects, text_blocks=[]).tolist() == [False] * 3
+
+
+def test_detect_elements_runs_no_ocr(analyzer, monkeypatch):
+    calls = []
+    detect_text_presence = analyzer.detect_text_presence
+
+    def counted(edges, rects, text_blocks=None):
+        calls.append(len(rects))
+        return detect_text_presence(edges, rects, text_blocks=text_blocks)
+
+    def fail(*args, **kwargs):
+        raise AssertionError('要素の分類でOCRが呼び出されました')
+
+    monkeypatch.setattr(analyzer, 'detect_text_presence', counted)
+    monkeypatch.setattr(analyzer, 'extract_text', fail)
+    monkeypatch.setattr(analyzer, 'extract_text_with_easyocr', fail)
+
+    result = analyzer.detect_elements(make_screen(), quality='full')
+
+    assert 'error' not in result
+    assert result['elements']
+    # すべての要素を1回の呼び出しで判定する
+    assert calls == [len(result['elements'])]
+
+
+def test_classify_square_element_uses_text_presence(analyzer):
+    square = np.full((120, 120, 3), 255, np.uint8)
+
+    assert analyzer.classify_element(square, 1.0, has_text=True) == 'button'
+    assert analyzer.classify_element(square, 1.0, has_text=False) == 'card'
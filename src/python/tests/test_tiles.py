@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+"""縦長画像の帯分割（iter_tiles / resolve_tile_height）のテスト"""
+
+import pytest
+
+
+@pytest.mark.parametrize('height, tile_height, overlap', [
+    (10000, 2048, 160),
+    (4097, 2048, 160),
+    (2048 * 3 - 160 * 2, 2048, 160),
+    (5000, 1000, 0),
+    (5001, 1000, 161),
+])
+def test_owned_ranges_partition_image(analyzer, height, tile_height, overlap):
+    tiles = list(analyzer.iter_tiles(height, tile_height, overlap))
+
+    assert tiles[0][0] == 0 and tiles[0][2] == 0
+    assert tiles[-1][1] == height and tiles[-1][3] == height
+    for (_, _, _, owned_bottom), (_, _, owned_top, _) in zip(tiles, tiles[1:]):
+        assert owned_bottom == owned_top
+    for top, bottom, owned_top, owned_bottom in tiles:
+        assert 0 <= top <= owned_top < owned_bottom <= bottom <= height
+        assert bottom - top <= tile_height
+
+
+def test_adjacent_tiles_overlap(analyzer):
+    tiles = list(analyzer.iter_tiles(10000, 2048, 160))
+
+    assert len(tiles) == 6
+    for (_, bottom, _, _), (top, _, _, _) in zip(tiles, tiles[1:]):
+        assert bottom - top == 160
+
+
+def test_single_tile_covers_whole_image(analyzer):
+    assert list(analyzer.iter_tiles(1500, 2048, 160)) == [(0, 1500, 0, 1500)]
+
+
+def test_resolve_tile_height(analyzer):
+    assert analyzer.resolve_tile_height(analyzer.TILED_MIN_HEIGHT) == 0
+    assert analyzer.resolve_tile_height(analyzer.TILED_MIN_HEIGHT + 1) == analyzer.TILE_HEIGHT
+    assert analyzer.resolve_tile_height(5000, 0) == 0
+    assert analyzer.resolve_tile_height(5000, analyzer.TILE_OVERLAP) == 0
+    assert analyzer.resolve_tile_height(1000, 1000) == 0
+    assert analyzer.resolve_tile_height(3000, 1000) == 1000